@@ -25,8 +25,7 @@ from estee.schedulers.others import BlevelScheduler, DLSScheduler, ETFScheduler,
 from estee.schedulers.queue import BlevelGtScheduler, RandomGtScheduler, TlevelGtScheduler
 from estee.serialization.dask_json import json_deserialize, json_serialize
 from estee.simulator import MaxMinFlowNetModel, SimpleNetModel
-from estee.simulator import Simulator, Worker
-from estee.simulator.trace import FetchEndTraceEvent
+from estee.simulator import Worker, run_replicas
 
 
 def generate_seed():
@@ -68,6 +67,7 @@ CLUSTERS = {
     "2x8": [{"cpus": 8}] * 2,
     "4x4": [{"cpus": 4}] * 4,
     "16x4": [{"cpus": 4}] * 16,
+    "16x4mixed": [{"cpus": 4, "speed": 2.0}] * 8 + [{"cpus": 4}] * 8,
     "stairs16": [{"cpus": i} for i in range(1, 6)] + [{"cpus": 1}],
     "32x16": [{"cpus": 16}] * 32,
     "64x16": [{"cpus": 16}] * 64,
@@ -106,7 +106,7 @@ Instance = collections.namedtuple("Instance",
                                    "count"))
 
 
-def run_single_instance(instance):
+def benchmark_scheduler(instance):
     time.sleep(1)
     inf = 2**32
 
@@ -115,28 +115,18 @@ def run_single_instance(instance):
             return Worker(**wargs, max_downloads=inf, max_downloads_per_worker=inf)
         return Worker(**wargs)
 
-    begin_time = time.monotonic()
     workers = [create_worker(wargs) for wargs in CLUSTERS[instance.cluster_name]]
     netmodel = NETMODELS[instance.netmodel](instance.bandwidth)
     scheduler = SCHEDULERS[instance.scheduler_name]()
-    simulator = Simulator(instance.graph, workers, scheduler, netmodel, trace=True)
     try:
-        sim_time = simulator.run()
-        runtime = time.monotonic() - begin_time
-        transfer = 0
-        for e in simulator.trace_events:
-            if isinstance(e, FetchEndTraceEvent):
-                transfer += e.output.size
-        return sim_time, runtime, transfer
-    except Exception as e:
+        results = run_replicas(instance.graph, workers, scheduler, netmodel, instance.count)
+        return [(r.makespan,
+                 r.setup_wall_time + r.statistics.wall_time,
+                 r.statistics.bytes_transferred) for r in results]
+    except Exception:
         traceback.print_exc()
         print("ERROR INSTANCE: {}".format(instance), file=sys.stderr)
-        return None, None
-
-
-def benchmark_scheduler(instance):
-    return [run_single_instance(instance)
-            for _ in range(instance.count)]
+        return [(None, None, None)] * instance.count
 
 
 def instance_iter(graphs, cluster_names, bandwidths, netmodels, scheduler_names, imodes,
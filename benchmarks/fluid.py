@@ -0,0 +1,83 @@
+"""
+Measures the error and the speedup of the fluid approximation (FluidSimulator)
+against the exact simulation on graphsets of the benchmark
+
+Error is the relative difference of the fluid makespan from the makespan
+of the exact simulation with the given scheduler.
+
+Instead of graphsets, generated graphs may be measured by --generated
+(e.g. large graphs or multi-cpu graphs).
+"""
+
+import argparse
+
+import numpy as np
+
+from benchmark import BANDWIDTHS, CLUSTERS, IMODES, NETMODELS, SCHEDULERS, load_graphs, \
+    parse_option
+from estee.generators.elementary import fork2, plain1cpus, plain1n, triplets
+from estee.generators.irw import crossv
+from estee.serialization.dask_json import json_deserialize
+from estee.simulator import Worker, compare_fluid
+
+# Generated graphs (multi-cpu tasks are started by a separate path of the fluid model)
+GENERATED = {
+    "triplets": lambda: triplets(3000, 4),
+    "plain1cpus": lambda: plain1cpus(300),
+    "plain1n": lambda: plain1n(20000),
+    "fork2": lambda: fork2(3000),
+    "crossv": lambda: crossv(40),
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("graphset", nargs="?",
+                        help="Comma separated list of graphset files")
+    parser.add_argument("--generated", default=None,
+                        help="Comma separated list of generated graphs ({}) or 'all'".format(
+                            ",".join(GENERATED)))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scheduler", default="blevel", choices=list(SCHEDULERS))
+    parser.add_argument("--cluster", default="16x4", choices=list(CLUSTERS))
+    parser.add_argument("--bandwidth", default="2G", choices=list(BANDWIDTHS))
+    parser.add_argument("--netmodel", default="maxmin", choices=list(NETMODELS))
+    parser.add_argument("--imode", default="exact", choices=list(IMODES))
+    parser.add_argument("--step-fraction", type=float, default=0.1)
+    args = parser.parse_args()
+    if not args.graphset and not args.generated:
+        parser.error("graphset or --generated is required")
+    return args
+
+
+def iterate_graphs(args):
+    if args.graphset:
+        for _, row in load_graphs(args.graphset).iterrows():
+            yield row["graph_name"], json_deserialize(row["graph"])
+    if args.generated:
+        np.random.seed(args.seed)
+        for name in parse_option(args.generated, GENERATED):
+            yield name, GENERATED[name]()
+
+
+def main():
+    args = parse_args()
+    print("{:>24} {:>8} {:>12} {:>12} {:>8} {:>10}".format(
+        "graph", "tasks", "exact", "fluid", "error", "speedup"))
+    errors = []
+    for name, graph in iterate_graphs(args):
+        IMODES[args.imode](graph)
+        workers = [Worker(**wargs) for wargs in CLUSTERS[args.cluster]]
+        comparison = compare_fluid(graph, workers, SCHEDULERS[args.scheduler](),
+                                   NETMODELS[args.netmodel](BANDWIDTHS[args.bandwidth]),
+                                   step_fraction=args.step_fraction)
+        errors.append(abs(comparison.error))
+        print("{:>24} {:>8} {:>12.2f} {:>12.2f} {:>8.3f} {:>10.1f}".format(
+            name, len(graph.tasks), comparison.exact_makespan,
+            comparison.fluid_makespan, comparison.error, comparison.speedup))
+    if errors:
+        print("mean absolute error: {:.3f}, max: {:.3f}".format(np.mean(errors), max(errors)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Measures the cost of a worker event with respect to the depth of its ready queue
+
+All tasks are independent and statically assigned (with random priorities)
+to a single worker, so the ready queue of the worker initially contains
+all tasks. The reported time per task should grow only logarithmically
+with the number of tasks.
+"""
+
+import argparse
+import random
+import time
+
+from estee.common import TaskGraph
+from estee.schedulers import StaticScheduler
+from estee.simulator import InstantNetModel, Simulator, Worker
+
+
+class SingleWorkerScheduler(StaticScheduler):
+
+    def __init__(self, seed):
+        super().__init__("single-worker", "0")
+        self.seed = seed
+
+    def static_schedule(self):
+        rng = random.Random(self.seed)
+        worker = self.workers[0]
+        for task in self.task_graph.tasks.values():
+            self.assign(worker, task, priority=rng.randrange(100))
+
+
+def create_graph(task_count, max_cpus, seed):
+    rng = random.Random(seed)
+    task_graph = TaskGraph()
+    for _ in range(task_count):
+        task_graph.new_task(duration=rng.random(), cpus=rng.randint(1, max_cpus))
+    return task_graph
+
+
+def measure(task_count, cpus, max_task_cpus, engine, seed):
+    task_graph = create_graph(task_count, max_task_cpus, seed)
+    simulator = Simulator(task_graph, [Worker(cpus=cpus)], SingleWorkerScheduler(seed),
+                          InstantNetModel(), engine=engine)
+    start = time.perf_counter()
+    simulator.run()
+    return time.perf_counter() - start
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", default="1000,2000,4000,8000,16000,32000",
+                        help="Comma separated list of task counts")
+    parser.add_argument("--cpus", type=int, default=4, help="Cpus of the worker")
+    parser.add_argument("--max-task-cpus", type=int, default=1)
+    parser.add_argument("--engine", default="native", choices=["simpy", "native"])
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    print("{:>10} {:>12} {:>16}".format("tasks", "time [s]", "per task [us]"))
+    for task_count in [int(t) for t in args.tasks.split(",")]:
+        duration = measure(task_count, args.cpus, args.max_task_cpus, args.engine, args.seed)
+        print("{:>10} {:>12.3f} {:>16.2f}".format(
+            task_count, duration, duration / task_count * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,15 @@ from .taskbase import TaskBase, DataObjectBase
 
 
 class Task(TaskBase):
+    """
+    Task of a task graph
+
+        duration - running time of the task on a worker with speed 1
+        expected_duration - duration estimate visible to schedulers
+        parallel_fraction - fraction of `duration` that is scaled with `cpus`
+                            (Amdahl's law), durations are then single-cpu times
+                            (None = durations are already times on `cpus` cpus)
+    """
 
     def __init__(self,
                  task_id: int,
@@ -11,10 +20,12 @@ class Task(TaskBase):
                  duration=1,
                  cpus=1,
                  output_size=None,
-                 expected_duration=None):
+                 expected_duration=None,
+                 parallel_fraction=None):
         assert cpus >= 0
         assert duration >= 0
         assert expected_duration is None or expected_duration >= 0
+        assert parallel_fraction is None or 0 <= parallel_fraction <= 1
 
         if output_size is not None:
             if outputs:
@@ -34,13 +45,44 @@ class Task(TaskBase):
         self.duration = duration
         self.expected_duration = expected_duration
         self.cpus = cpus
+        self.parallel_fraction = parallel_fraction
+
+    @property
+    def amdahl_factor(self):
+        """
+        Ratio of the running time on `cpus` cpus to the single-cpu time
+        """
+        f = self.parallel_fraction
+        if f is None:
+            return 1
+        return (1 - f) + f / max(self.cpus, 1)
+
+    def run_time(self, speed=1):
+        """
+        Returns the running time of the task on a worker with the given speed
+        """
+        duration = self.duration
+        if self.parallel_fraction is not None:
+            duration *= self.amdahl_factor
+        if speed != 1:
+            duration /= speed
+        return duration
+
+    @property
+    def expected_run_time(self):
+        """
+        Expected duration scaled by `parallel_fraction` (as seen by schedulers)
+        """
+        if self.parallel_fraction is None or self.expected_duration is None:
+            return self.expected_duration
+        return self.expected_duration * self.amdahl_factor
 
     def to_dict(self):
         return {
             "id": self.id,
             "inputs": [o.id for o in self.inputs],
             "outputs": [o.id for o in self.outputs],
-            "expected_duration": self.expected_duration,
+            "expected_duration": self.expected_run_time,
             "cpus": self.cpus
         }
 
@@ -48,7 +90,8 @@ class Task(TaskBase):
         t = Task(self.id, self.name,
                  duration=self.duration,
                  expected_duration=self.expected_duration,
-                 cpus=self.cpus)
+                 cpus=self.cpus,
+                 parallel_fraction=self.parallel_fraction)
         t.outputs = [DataObject(o.id, o.size, o.expected_size) for o in self.outputs]
         for o in t.outputs:
             o.parent = t
@@ -99,6 +142,7 @@ class Task(TaskBase):
     def validate(self):
         assert self.duration >= 0
         assert self.expected_duration is None or self.expected_duration >= 0
+        assert self.parallel_fraction is None or 0 <= self.parallel_fraction <= 1
         assert not self.is_predecessor_of(self)
         assert len(self.outputs) == len(set(self.outputs))
         for o in self.outputs:
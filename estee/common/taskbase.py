@@ -1,3 +1,4 @@
+import copy
 from typing import List, Set, Dict
 
 
@@ -60,6 +61,20 @@ class TaskGraphBase:
         self.tasks = tasks or {}
         self.objects = objects or {}
 
+    def __deepcopy__(self, memo):
+        # All tasks and objects are created before their attributes are copied,
+        # so copying does not recurse along paths of the graph
+        result = self.__class__.__new__(self.__class__)
+        memo[id(self)] = result
+        nodes = list(self.tasks.values())
+        nodes += self.objects.values()
+        for node in nodes:
+            memo[id(node)] = node.__class__.__new__(node.__class__)
+        for node in nodes:
+            memo[id(node)].__dict__.update(copy.deepcopy(node.__dict__, memo))
+        result.__dict__.update(copy.deepcopy(self.__dict__, memo))
+        return result
+
     def source_tasks(self):
         return [t for t in self.tasks.values() if not t.inputs]
 
@@ -31,9 +31,11 @@ class TaskGraph(TaskGraphBase):
                  duration=1,
                  expected_duration=None,
                  cpus=1,
-                 output_size=None):
+                 output_size=None,
+                 parallel_fraction=None):
         task_id = len(self.tasks)
-        task = Task(task_id, name, outputs, duration, cpus, output_size, expected_duration)
+        task = Task(task_id, name, outputs, duration, cpus, output_size, expected_duration,
+                    parallel_fraction)
         self.tasks[task_id] = task
 
         output_id = len(self.objects)
@@ -7,10 +7,22 @@ def flat_list(list_of_lists):
 
 
 class LruCache:
-    def __init__(self, size):
+    """
+    Cache that drops least recently used items
+
+    size - maximal number of items, or maximal sum of sizeof(key, value)
+           of items when sizeof is given
+    """
+
+    def __init__(self, size, sizeof=None):
         self.size = size
+        self.sizeof = sizeof
+        self.used = 0
         self.cache = collections.OrderedDict()
 
+    def _item_size(self, key, value):
+        return self.sizeof(key, value) if self.sizeof is not None else 1
+
     def get(self, key):
         value = self.cache.pop(key, None)
         if value is None:
@@ -19,6 +31,10 @@ class LruCache:
         return value
 
     def set(self, key, value):
+        old = self.cache.pop(key, None)
+        if old is not None:
+            self.used -= self._item_size(key, old)
         self.cache[key] = value
-        if len(self.cache) > self.size:
-            self.cache.popitem(last=False)
+        self.used += self._item_size(key, value)
+        while self.used > self.size:
+            self.used -= self._item_size(*self.cache.popitem(last=False))
@@ -5,3 +5,4 @@ from .queue import RandomScheduler, RandomGtScheduler, BlevelGtScheduler  # noqa
 from .others import DLSScheduler, ETFScheduler, MCPScheduler  # noqa
 from .camp import Camp2Scheduler  # noqa
 from .ws import WorkStealingScheduler  # noqa
+from .replay import ReplayScheduler  # noqa
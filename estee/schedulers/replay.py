@@ -0,0 +1,78 @@
+from ..simulator import TaskState
+from .scheduler import SchedulerInterface
+
+
+class ReplayScheduler(SchedulerInterface):
+    """
+    Replays assignments from ScheduleRecord without any scheduling logic
+
+    At each invocation, all recorded assignments made when at most as many
+    tasks were finished as are finished now are returned. Replay follows
+    the progress of the simulation rather than the recorded times, so it
+    works also under other conditions (e.g. a faster network) than the
+    record was made in; recorded reassignments of tasks that are already
+    finished are dropped. Finished tasks are counted from the updates, so
+    the scheduler does not depend on the simulator and it does not build any
+    model of the task graph; replaying costs only the simulation.
+
+    With batch_updates=False, updates are received as dictionaries
+    (see SchedulerInterface.send_message).
+    """
+
+    def __init__(self, record, batch_updates=True):
+        self.record = record
+        self.batch_updates = batch_updates
+        self.position = 0
+        self.has_tasks = False
+        self.finished = set()
+        self.tasks_finished = 0
+
+    def start(self):
+        self.position = 0
+        self.has_tasks = False
+        self.finished = set()
+        self.tasks_finished = 0
+        return {
+            "type": "register",
+            "protocol_version": 0,
+            "scheduler_name": "replay",
+            "scheduler_version": "0",
+            "reassigning": self.record.reassigning,
+            "task_start_notification": self.record.task_start_notification,
+            "batch_updates": self.batch_updates,
+        }
+
+    def send_message(self, message):
+        message_type = message["type"]
+        if message_type == "update_batch":
+            batch = message["batch"]
+            new_tasks = batch.new_tasks
+            finished_tasks = batch.finished_tasks.tolist()
+            retired_tasks = batch.retired_tasks.tolist()
+        elif message_type == "update":
+            new_tasks = message.get("new_tasks")
+            finished_tasks = [tu["id"] for tu in message.get("tasks_update", ())
+                              if tu["state"] == TaskState.Finished]
+            retired_tasks = message.get("retired_tasks", ())
+        else:
+            raise Exception("Unkown message type: '{}'".format(message_type))
+
+        finished = self.finished
+        finished.update(finished_tasks)
+        finished.difference_update(retired_tasks)
+        self.tasks_finished += len(finished_tasks)
+
+        # Tasks are not known in the first update
+        if new_tasks:
+            self.has_tasks = True
+        if not self.has_tasks:
+            return []
+
+        record = self.record
+        progress = record.progress
+        start = position = self.position
+        while position < len(progress) and progress[position] <= self.tasks_finished:
+            position += 1
+        self.position = position
+        return [record.assignment(i) for i in range(start, position)
+                if record.tasks[i] not in finished]
@@ -1,4 +1,5 @@
 
+import copy
 import logging
 import time
 
@@ -26,19 +27,31 @@ class SchedulerInterface:
 
         {
             "type": "update",
-            "new_workers": [WORKER_ID, ...]  # Optional
+            "new_workers": [WORKER_DEF, ...]  # Optional
             "network_bandwidth": FLOAT  # Optional
+            "network_latency": FLOAT  # Optional, latency of each transfer
             "new_tasks": [TASK_DEF, ...]  # Optional
             "new_objects": [OBJECT_DEF, ...]  # Optional
             "tasks_update": [TASK_UPDATE, ...]  # Optional
             "objects_update": [OBJECT_UPDATE, ...]  # Optional
             "reassign_failed": [REASSIGN_FAILED, ...]  # Optinal
+            "cancelled_duplicates": [CANCELLED_DUPLICATE, ...]  # Optional
+            "retired_tasks": [TASK_ID, ...]  # Optional
+            "retired_objects": [OBJECT_ID, ...]  # Optional
+        }
+
+        WORKER_DEF = {
+            "id": WORKER_ID,
+            "cpus": INT
+            "speed": FLOAT  # Optional (1.0), durations of tasks are divided by speed
         }
 
         TASK_UPDATE = {
             "id": TASK_ID,
             "state": TaskState
-            "worker": WORKER_ID
+            "worker": WORKER_ID  # Finishing worker, or a worker running (assigned) the task
+            "running": BOOL
+            "duplicates": [WORKER_ID, ...]  # Optional, other workers with a copy of the task
         }
 
         OBJECT_UPDATE = {
@@ -51,6 +64,28 @@ class SchedulerInterface:
             "id": TASK_ID
             "assigned_workers": [WORKER_ID, ...]  # Ground truth from simulator
         }
+
+        CANCELLED_DUPLICATE = {  # Copy cancelled because another copy finished first
+                                 # (or dropped because the task finished before
+                                 # the copy was assigned)
+            "id": TASK_ID
+            "worker": WORKER_ID
+        }
+
+        Objects evicted from the memory of a worker are reported in
+        "objects_update" without the worker in "placing" and "availability".
+
+        Retired tasks and objects (of finished jobs) are removed after all
+        other changes in the message are processed, their ids may be reused
+        by tasks and objects in later messages.
+
+        In-process schedulers that set "batch_updates" in the registration
+        message receive instead:
+
+        {
+            "type": "update_batch",
+            "batch": UpdateBatch  # see estee.simulator.UpdateBatch
+        }
         """
         raise NotImplementedError()
 
@@ -70,6 +105,10 @@ class SchedulerInterface:
 
         REASSIGNING_FLAG has to be True if scheduler may reassign
         already scheduled tasks
+
+        Optional "batch_updates": True asks the simulator to send
+        "update_batch" messages instead of "update" (only for schedulers
+        running in the same process as the simulator)
         """
         raise NotImplementedError()
 
@@ -80,16 +119,17 @@ class SchedulerInterface:
 
 class SchedulerWorker:
 
-    def __init__(self, worker_id, cpus):
+    def __init__(self, worker_id, cpus, speed=1.0):
         self.worker_id = worker_id
         self.cpus = cpus
+        self.speed = speed
 
         # metadata, may not be used
         self.running_tasks = set()
         self.scheduled_tasks = []
 
     def simple_copy(self):
-        return SchedulerWorker(self.worker_id, self.cpus)
+        return SchedulerWorker(self.worker_id, self.cpus, self.speed)
 
     def __repr__(self):
         return "<SW id={} cpus={}>".format(self.worker_id, self.cpus)
@@ -105,7 +145,10 @@ class Update:
                  new_ready_tasks,
                  new_finished_tasks,
                  reassign_failed,
-                 new_started_tasks):
+                 new_started_tasks,
+                 retired_tasks=(),
+                 retired_objects=(),
+                 cancelled_duplicates=()):
 
         self.new_workers = new_workers
         self.network_update = network_update
@@ -115,10 +158,14 @@ class Update:
         self.new_finished_tasks = new_finished_tasks
         self.reassign_failed = reassign_failed
         self.new_started_tasks = new_started_tasks
+        self.retired_tasks = retired_tasks
+        self.retired_objects = retired_objects
+        self.cancelled_duplicates = cancelled_duplicates
 
     @property
     def graph_changed(self):
-        return bool(self.new_objects or self.new_tasks)
+        return bool(self.new_objects or self.new_tasks or
+                    self.retired_tasks or self.retired_objects)
 
     @property
     def cluster_changed(self):
@@ -128,34 +175,54 @@ class Update:
 class SchedulerBase(SchedulerInterface):
     """
     Base class for Python implemented schedulers
+
+    With batch_updates (default), the simulator sends updates as UpdateBatch
+    ("update_batch" message), otherwise as dictionaries ("update" message)
+    as they would be sent to an out-of-process scheduler.
     """
 
     PROTOCOL_VERSION = 0
+    # Scheduler handles tasks that arrive during the simulation (see Simulator.submit)
+    INCREMENTAL = True
 
     _disable_cleanup = False  # Disable clean in stop(), for testing purposes
 
     def __init__(self, name, version,
                  reassigning=False,
                  task_start_notification=False,
-                 only_in_simulator=False):
+                 only_in_simulator=False,
+                 batch_updates=True):
 
         self.workers = {}
         self.task_graph = SchedulerTaskGraph()
         self._name = name
         self._version = version
         self.network_bandwidth = None
+        self.network_latency = None
         self.assignments = None
         self.reassigning = reassigning
         self.task_start_notification = task_start_notification
         self.only_in_simulator = only_in_simulator
+        self.batch_updates = batch_updates
 
     def now(self):
         return self._simulator.env.now if self._simulator else time.time()
 
+    def __deepcopy__(self, memo):
+        # The task graph is copied first, so attributes of subclasses that refer
+        # to its tasks (e.g. dictionaries of levels) are resolved through memo
+        result = self.__class__.__new__(self.__class__)
+        memo[id(self)] = result
+        copy.deepcopy(self.task_graph, memo)
+        result.__dict__.update(copy.deepcopy(self.__dict__, memo))
+        return result
+
     def send_message(self, message):
         message_type = message["type"]
         if message_type == "update":
             return self._process_update(message)
+        elif message_type == "update_batch":
+            return self._process_batch(message["batch"])
         else:
             raise Exception("Unkown message type: '{}'".format(message_type))
 
@@ -170,13 +237,14 @@ class SchedulerBase(SchedulerInterface):
             "scheduler_version": self._version,
             "reassigning": self.reassigning,
             "task_start_notification": self.task_start_notification,
+            "batch_updates": self.batch_updates,
+            "incremental": self.INCREMENTAL,
         }
 
     def schedule(self, update: Update):
         raise NotImplementedError()
 
     def _process_update(self, message):
-
         task_graph = self.task_graph
         workers = self.workers
 
@@ -184,94 +252,44 @@ class SchedulerBase(SchedulerInterface):
         finished_tasks = []
         started_tasks = []
 
-        if "new_workers" in message:
-            new_workers = []
-            for w in message["new_workers"]:
-                worker_id = w["id"]
-                if worker_id in workers:
-                    raise Exception(
-                        "Registering already registered worker '{}'".format(worker_id))
-                worker = SchedulerWorker(worker_id, w["cpus"])
-                new_workers.append(worker)
-                workers[worker_id] = worker
-        else:
-            new_workers = ()
-
-        network_update = False
-        if "network_bandwidth" in message:
-            bandwidth = message["network_bandwidth"]
-            if bandwidth != self.network_bandwidth:
-                network_update = True
-                self.network_bandwidth = bandwidth
-
-        if "new_objects" in message:
-            objects = self.task_graph.objects
-            new_objects = []
-            for o in message["new_objects"]:
-                object_id = o["id"]
-                obj = SchedulerDataObject(object_id, o["expected_size"], o.get("size"))
-                new_objects.append(obj)
-                objects[object_id] = obj
-        else:
-            new_objects = ()
-
-        if "new_tasks" in message:
-            tasks = self.task_graph.tasks
-            objects = self.task_graph.objects
-            new_tasks = []
-            for t in message["new_tasks"]:
-                task_id = t["id"]
-                inputs = [objects[o] for o in t["inputs"]]
-                outputs = [objects[o] for o in t["outputs"]]
-                task = SchedulerTask(
-                    task_id,
-                    inputs,
-                    outputs,
-                    t["expected_duration"],
-                    t["cpus"])
-                new_tasks.append(task)
-                for o in outputs:
-                    o.parent = task
-                for o in inputs:
-                    o.consumers.add(task)
-                if task.unfinished_inputs == 0:
-                    ready_tasks.append(task)
-                tasks[task_id] = task
-        else:
-            new_tasks = ()
-
-        reassign_failed = ()
-        if "reassign_failed" in message:
-            reassign_failed = []
-            for tu in message["reassign_failed"]:
-                task = self.task_graph.tasks[tu["id"]]
-                ws = [self.workers[w] for w in tu["assigned_workers"]]
-                task.scheduled_worker = ws[0]
-                reassign_failed.append(task)
-                self._fix_implied_schedule(task)
+        new_workers = [self._register_worker(w["id"], w["cpus"], w.get("speed", 1.0))
+                       for w in message.get("new_workers", ())]
+        network_update = self._update_network_bandwidth(message.get("network_bandwidth"))
+        network_update |= self._update_network_latency(message.get("network_latency"))
+
+        new_objects = [self._register_object(o["id"], o["expected_size"], o.get("size"))
+                       for o in message.get("new_objects", ())]
+
+        objects = task_graph.objects
+        new_tasks = [self._register_task(t["id"],
+                                         [objects[o] for o in t["inputs"]],
+                                         [objects[o] for o in t["outputs"]],
+                                         t["expected_duration"],
+                                         t["cpus"],
+                                         ready_tasks)
+                     for t in message.get("new_tasks", ())]
+
+        reassign_failed = [self._reassign_failed(task_graph.tasks[tu["id"]],
+                                                 workers[tu["assigned_workers"][0]])
+                           for tu in message.get("reassign_failed", ())]
 
         for tu in message.get("tasks_update", ()):
             state = tu["state"]
             assert state == TaskState.Finished or state == TaskState.Assigned
             task = task_graph.tasks[tu["id"]]
-            task.state = state
-            task.computed_by = workers[tu["worker"]]
-            was_running = task.running
-            running = bool(tu["running"])
-            task.running = running
-
+            worker = workers[tu["worker"]]
             if state == TaskState.Finished:
-                finished_tasks.append(task)
-                for o in task.outputs:
-                    for t in o.consumers:
-                        t.unfinished_inputs -= 1
-                        if t.unfinished_inputs <= 0:
-                            assert t.unfinished_inputs == 0
-                            ready_tasks.append(t)
-
-            if not was_running and running:
-                task.start_time = self.now()
-                started_tasks.append(task)
+                self._task_finished(task, worker, finished_tasks, ready_tasks)
+            elif tu["running"]:
+                self._task_started(task, worker, started_tasks)
+            else:
+                task.state = state
+                task.computed_by = worker
+                task.running = False
+
+        cancelled_duplicates = [
+            self._duplicate_cancelled(task_graph.tasks[cd["id"]], workers[cd["worker"]])
+            for cd in message.get("cancelled_duplicates", ())]
 
         for ou in message.get("objects_update", ()):
             o = task_graph.objects[ou["id"]]
@@ -281,8 +299,95 @@ class SchedulerBase(SchedulerInterface):
             if size is not None:
                 o.size = size
 
-        self.assignments = {}
-        self.schedule(Update(
+        retired_tasks, retired_objects = self._retire(message.get("retired_tasks", ()),
+                                                      message.get("retired_objects", ()))
+
+        return self._run_schedule(Update(
+            new_workers,
+            network_update,
+            new_objects,
+            new_tasks,
+            ready_tasks,
+            finished_tasks,
+            reassign_failed,
+            started_tasks,
+            retired_tasks,
+            retired_objects,
+            cancelled_duplicates))
+
+    def _process_batch(self, batch):
+        """
+        In-process fast path of `_process_update`
+
+        The simulator passes its own worker/task/object instances and NumPy
+        arrays with changes since the last update (see UpdateBatch), so no
+        intermediate dictionaries are built.
+        """
+        task_graph = self.task_graph
+        tasks = task_graph.tasks
+        objects = task_graph.objects
+        workers = self.workers
+
+        ready_tasks = []
+        finished_tasks = []
+        started_tasks = []
+
+        new_workers = [self._register_worker(w.id, w.cpus, w.speed) for w in batch.new_workers]
+        network_update = self._update_network_bandwidth(batch.network_bandwidth)
+        network_update |= self._update_network_latency(batch.network_latency)
+
+        new_objects = [self._register_object(o.id, o.expected_size, None)
+                       for o in batch.new_objects]
+
+        new_tasks = [self._register_task(t.id,
+                                         [objects[o.id] for o in t.inputs],
+                                         [objects[o.id] for o in t.outputs],
+                                         t.expected_run_time,
+                                         t.cpus,
+                                         ready_tasks)
+                     for t in batch.new_tasks]
+
+        reassign_failed = [self._reassign_failed(tasks[t], workers[w])
+                           for t, w in zip(batch.reassign_failed_tasks.tolist(),
+                                           batch.reassign_failed_workers.tolist())]
+
+        for t, w in zip(batch.finished_tasks.tolist(), batch.finished_workers.tolist()):
+            self._task_finished(tasks[t], workers[w], finished_tasks, ready_tasks)
+
+        for t, w in zip(batch.started_tasks.tolist(), batch.started_workers.tolist()):
+            self._task_started(tasks[t], workers[w], started_tasks)
+
+        cancelled_duplicates = [
+            self._duplicate_cancelled(tasks[t], workers[w])
+            for t, w in zip(batch.cancelled_tasks.tolist(), batch.cancelled_workers.tolist())]
+
+        for o, w in zip(batch.evicted_objects.tolist(), batch.evicted_workers.tolist()):
+            obj = objects[o]
+            worker = workers[w]
+            obj.placing = [x for x in obj.placing if x is not worker]
+            obj.availability = [x for x in obj.availability if x is not worker]
+
+        for o, w, size in zip(batch.placed_objects.tolist(),
+                              batch.placed_workers.tolist(),
+                              batch.placed_sizes.tolist()):
+            obj = objects[o]
+            if obj.placing:
+                obj.placing.append(workers[w])
+            else:
+                obj.placing = [workers[w]]
+            obj.size = size
+
+        for o, w in zip(batch.available_objects.tolist(), batch.available_workers.tolist()):
+            obj = objects[o]
+            if obj.availability:
+                obj.availability.append(workers[w])
+            else:
+                obj.availability = [workers[w]]
+
+        retired_tasks, retired_objects = self._retire(batch.retired_tasks.tolist(),
+                                                      batch.retired_objects.tolist())
+
+        return self._run_schedule(Update(
             new_workers,
             network_update,
             new_objects,
@@ -290,8 +395,99 @@ class SchedulerBase(SchedulerInterface):
             ready_tasks,
             finished_tasks,
             reassign_failed,
-            started_tasks))
+            started_tasks,
+            retired_tasks,
+            retired_objects,
+            cancelled_duplicates))
+
+    def _register_worker(self, worker_id, cpus, speed=1.0):
+        if worker_id in self.workers:
+            raise Exception(
+                "Registering already registered worker '{}'".format(worker_id))
+        worker = SchedulerWorker(worker_id, cpus, speed)
+        self.workers[worker_id] = worker
+        return worker
+
+    def _update_network_bandwidth(self, bandwidth):
+        if bandwidth is None or bandwidth == self.network_bandwidth:
+            return False
+        self.network_bandwidth = bandwidth
+        return True
+
+    def _update_network_latency(self, latency):
+        if latency is None or latency == self.network_latency:
+            return False
+        self.network_latency = latency
+        return True
+
+    def _register_object(self, object_id, expected_size, size):
+        obj = SchedulerDataObject(object_id, expected_size, size)
+        self.task_graph.objects[object_id] = obj
+        return obj
+
+    def _register_task(self, task_id, inputs, outputs, expected_duration, cpus, ready_tasks):
+        task = SchedulerTask(task_id, inputs, outputs, expected_duration, cpus)
+        for o in outputs:
+            o.parent = task
+        for o in inputs:
+            o.consumers.add(task)
+        if task.unfinished_inputs == 0:
+            ready_tasks.append(task)
+        self.task_graph.tasks[task_id] = task
+        return task
+
+    def _reassign_failed(self, task, worker):
+        task.scheduled_worker = worker
+        self._fix_implied_schedule(task)
+        return task
+
+    def _task_finished(self, task, worker, finished_tasks, ready_tasks):
+        task.state = TaskState.Finished
+        task.computed_by = worker
+        task.running = False
+        if task.duplicates:
+            task.duplicates = []
+        finished_tasks.append(task)
+        for o in task.outputs:
+            for t in o.consumers:
+                t.unfinished_inputs -= 1
+                if t.unfinished_inputs <= 0:
+                    assert t.unfinished_inputs == 0
+                    ready_tasks.append(t)
 
+    def _task_started(self, task, worker, started_tasks):
+        task.state = TaskState.Assigned
+        task.computed_by = worker
+        if not task.running:
+            task.running = True
+            task.start_time = self.now()
+            started_tasks.append(task)
+
+    def _duplicate_cancelled(self, task, worker):
+        if task in worker.scheduled_tasks:
+            worker.scheduled_tasks.remove(task)
+        worker.running_tasks.discard(task)
+        return task, worker
+
+    def _retire(self, task_ids, object_ids):
+        if not task_ids and not object_ids:
+            return (), ()
+        tasks = self.task_graph.tasks
+        objects = self.task_graph.objects
+        retired_tasks = [tasks.pop(t) for t in task_ids]
+        retired_objects = [objects.pop(o) for o in object_ids]
+        if retired_tasks:
+            retired = set(retired_tasks)
+            for worker in self.workers.values():
+                if worker.scheduled_tasks:
+                    worker.scheduled_tasks = [t for t in worker.scheduled_tasks
+                                              if t not in retired]
+                worker.running_tasks.difference_update(retired)
+        return retired_tasks, retired_objects
+
+    def _run_schedule(self, update):
+        self.assignments = {}
+        self.schedule(update)
         return list(self.assignments.values())
 
     def _fix_implied_schedule_of_object(self, obj):
@@ -347,6 +543,37 @@ class SchedulerBase(SchedulerInterface):
 
         self.assignments[task] = result
 
+    def duplicate(self, worker: SchedulerWorker, task: SchedulerTask,
+                  priority=None, blocking=None):
+        """
+            Assign a copy of a task to another worker
+
+            The task has to be assigned (in this or a previous call of
+            "schedule") to a different worker. Copies run concurrently,
+            the first finished copy wins and the others are cancelled
+            (reported in Update.cancelled_duplicates).
+        """
+        assert task.state == TaskState.Assigned
+        assert worker is not None and worker is not task.scheduled_worker
+        task.duplicates.append(worker)
+
+        for o in task.inputs:
+            o.scheduled.add(worker)
+
+        result = {
+            "worker": worker.worker_id,
+            "task": task.id,
+            "duplicate": True,
+        }
+
+        if priority is not None:
+            result["priority"] = priority
+        if blocking is not None:
+            result["blocking"] = blocking
+
+        worker.scheduled_tasks.append(task)
+        self.assignments[(task, worker)] = result
+
     def stop(self):
         if self._disable_cleanup:
             return
@@ -354,6 +581,7 @@ class SchedulerBase(SchedulerInterface):
         self.task_graph.tasks.clear()
         self.task_graph.objects.clear()
         self.network_bandwidth = None
+        self.network_latency = None
 
 
 class StaticScheduler(SchedulerBase):
@@ -364,6 +592,9 @@ class StaticScheduler(SchedulerBase):
         is changed
     """
 
+    # static_schedule() assigns all tasks of the graph at once
+    INCREMENTAL = False
+
     def schedule(self, update):
         if update.graph_changed or update.cluster_changed:
             return self.static_schedule()
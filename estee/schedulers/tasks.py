@@ -25,6 +25,8 @@ class SchedulerTask(TaskBase):
         self.cpus = cpus
         self.expected_duration = expected_duration
         self.scheduled_worker = None
+        # Workers with copies of the task (see SchedulerBase.duplicate)
+        self.duplicates = []
         self.computed_by = None
         self.running = False
         self.start_time: float = None
@@ -55,6 +57,7 @@ class SchedulerDataObject(DataObjectBase):
     def __init__(self, id, expected_size, size=None):
         super().__init__(id)
         self.placement = ()
+        self.placing = ()
         self.availability = ()
         self.scheduled = set()
         self.expected_size = expected_size
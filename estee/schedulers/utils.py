@@ -224,7 +224,7 @@ def worker_estimate_earliest_time(worker: SchedulerWorker, task: SchedulerTask,
                                   now: int, worker_assignments=None):
     """
     Estimates in how many time units from `now` will `worker` be able to start executing
-    the given `task`. Neglects data transfers.
+    the given `task`. Neglects data transfers. Durations are divided by the speed of `worker`.
     """
     assert task.cpus <= worker.cpus
 
@@ -232,12 +232,13 @@ def worker_estimate_earliest_time(worker: SchedulerWorker, task: SchedulerTask,
         worker_assignments = []
 
     running_tasks = worker.running_tasks
+    speed = worker.speed
 
     free_cpus = worker.cpus
     index = 0
     runqueue = []
     for t in running_tasks:
-        heappush(runqueue, (t.start_time + (t.expected_duration or 1), index, t))
+        heappush(runqueue, (t.start_time + (t.expected_duration or 1) / speed, index, t))
         index += 1
         free_cpus -= t.cpus
     assignments = deque(worker.scheduled_tasks + worker_assignments)
@@ -249,7 +250,8 @@ def worker_estimate_earliest_time(worker: SchedulerWorker, task: SchedulerTask,
         free_cpus += t.cpus
         while assignments and free_cpus >= assignments[0].cpus:
             heappush(runqueue,
-                     (clock + (assignments[0].expected_duration or 1), index, assignments[0]))
+                     (clock + (assignments[0].expected_duration or 1) / speed, index,
+                      assignments[0]))
             index += 1
             free_cpus -= assignments[0].cpus
             assignments.popleft()
@@ -15,6 +15,8 @@ def json_serialize(graph):
             "cpus": task.cpus,
             "outputs": [{"s": o.size, "e_s": o.expected_size} for o in task.outputs]
         }
+        if task.parallel_fraction is not None:
+            ser["p_f"] = task.parallel_fraction
         task_to_id[task] = len(tasks)
         tasks.append(ser)
         for (index, output) in enumerate(task.outputs):
@@ -41,6 +43,7 @@ def json_deserialize(data):
             duration=t["d"],
             expected_duration=t["e_d"],
             cpus=t["cpus"],
+            parallel_fraction=t.get("p_f"),
             outputs=[o["s"] for o in t["outputs"]]
         )
         for (index, output) in enumerate(task.outputs):
@@ -1,4 +1,12 @@
 
 from .netmodels import InstantNetModel, SimpleNetModel, MaxMinFlowNetModel  # noqa
-from .simulator import Simulator, TaskAssignment, TaskState  # noqa
+from .simulator import RunResult, Simulator, SimulatorSnapshot, TaskAssignment, TaskState, \
+    UpdateBatch  # noqa
+from .batch import ReplicaResult, run_replicas  # noqa
+from .fluid import FluidComparison, FluidSimulator, compare_fluid  # noqa
+from .jobs import Job, poisson_arrivals  # noqa
+from .memory import EvictionPolicy, LargestFirstEvictionPolicy, LruEvictionPolicy, \
+    NoConsumersFirstEvictionPolicy  # noqa
+from .record import ScheduleRecord  # noqa
+from .statistics import SimulatorStatistics, WorkerStatistics  # noqa
 from .worker import Worker  # noqa
@@ -0,0 +1,51 @@
+from time import perf_counter
+
+from .simulator import Simulator
+
+
+class ReplicaResult:
+    """
+    Result of a single replica of run_replicas()
+
+        makespan - simulated time when all tasks were finished
+        statistics - SimulatorStatistics of the replica
+        setup_wall_time - wall-clock time of the shared initialization
+    """
+
+    __slots__ = ("makespan", "statistics", "setup_wall_time")
+
+    def __init__(self, makespan, statistics, setup_wall_time):
+        self.makespan = makespan
+        self.statistics = statistics
+        self.setup_wall_time = setup_wall_time
+
+    def __repr__(self):
+        return "<ReplicaResult makespan={}>".format(self.makespan)
+
+
+def run_replicas(task_graph, workers, scheduler, netmodel, count, **simulator_args):
+    """
+    Runs `count` replicas of the same simulation back-to-back
+
+    Runtime state, network model, workers and the scheduler (with registered
+    workers) are initialized only once in a prototype simulator, each replica
+    is its fork. Replicas share the task graph (including consumer lists),
+    so only the state of a running simulation is allocated per replica.
+    Replicas differ only by random decisions of the scheduler (it has to use
+    global random generators of `random` or `numpy.random` modules).
+
+    The given workers, scheduler and netmodel are used by the prototype,
+    `simulator_args` are passed to Simulator. Returns a list of ReplicaResult.
+    """
+    start = perf_counter()
+    prototype = Simulator(task_graph, workers, scheduler, netmodel, **simulator_args)
+    prototype._prepare()
+    setup_wall_time = perf_counter() - start
+
+    results = []
+    for _ in range(count):
+        replica = prototype.fork()
+        makespan = replica.run()
+        results.append(ReplicaResult(makespan, replica.statistics, setup_wall_time))
+    prototype.stop_scheduler()
+    return results
@@ -0,0 +1,98 @@
+from heapq import heappop, heappush
+
+
+class NativeEvent:
+    """
+    Lightweight counterpart of simpy.Event used by NativeEnvironment.
+
+    Only the subset of the simpy API that is used by the simulator components
+    is provided: `callbacks`, `value`, `triggered`, `processed` and `succeed()`.
+    Callbacks are invoked with the event as the only argument (as in simpy).
+    """
+
+    __slots__ = ("env", "callbacks", "value", "triggered")
+
+    def __init__(self, env):
+        self.env = env
+        self.callbacks = []
+        self.value = None
+        self.triggered = False
+
+    @property
+    def processed(self):
+        return self.callbacks is None
+
+    def succeed(self, value=None):
+        if self.triggered:
+            raise RuntimeError("{} has already been triggered".format(self))
+        self.triggered = True
+        self.value = value
+        self.env.schedule(0, self._process)
+        return self
+
+    def _process(self):
+        callbacks = self.callbacks
+        self.callbacks = None
+        for callback in callbacks:
+            callback(self)
+
+
+class NativeEnvironment:
+    """
+    Discrete event engine driven by a single binary heap.
+
+    The heap contains (time, seq, callback) entries; `seq` is a monotonic
+    counter that keeps FIFO order of entries with the same time. Since
+    the simulator components schedule all their work through `timeout()` and
+    `event()`, the processing order is the same as in simpy.Environment
+    (where all these events have the same priority).
+    """
+
+    def __init__(self, initial_time=0):
+        self.now = initial_time
+        self.queue = []
+        self.seq = 0
+
+    def schedule(self, delay, callback):
+        self.seq += 1
+        heappush(self.queue, (self.now + delay, self.seq, callback))
+
+    def event(self):
+        return NativeEvent(self)
+
+    def timeout(self, delay, value=None):
+        if delay < 0:
+            raise ValueError("Negative delay {}".format(delay))
+        event = NativeEvent(self)
+        event.triggered = True
+        event.value = value
+        self.schedule(delay, event._process)
+        return event
+
+    def peek(self):
+        return self.queue[0][0] if self.queue else float("inf")
+
+    def step(self):
+        time, _, callback = heappop(self.queue)
+        self.now = time
+        callback()
+
+    def run(self, until=None):
+        queue = self.queue
+        if until is None:
+            while queue:
+                self.step()
+        elif isinstance(until, NativeEvent):
+            while until.callbacks is not None:
+                if not queue:
+                    raise RuntimeError('No scheduled events left but "until" '
+                                       'event was not triggered: {}'.format(until))
+                self.step()
+            return until.value
+        else:
+            if until < self.now:
+                raise ValueError("until (={}) must be greater than the current "
+                                 "simulation time".format(until))
+            while queue and queue[0][0] < until:
+                self.step()
+            self.now = until
@@ -0,0 +1,501 @@
+from time import perf_counter
+
+import numpy as np
+
+from .netmodels import InstantNetModel
+from .simulator import Simulator
+
+
+class FluidSimulator:
+    """
+    Approximate simulation for fast makespan estimates of large task graphs
+
+        step_fraction - length of a time step as a fraction of a lower bound
+                        of the makespan (the critical path or the total work)
+
+    Time advances in steps to a horizon, all tasks finished until the horizon
+    are finished at once (a step without any finished task jumps to the first
+    finish). In each step, a built-in b-level list scheduler starts ready tasks
+    in batches on cpus that are free until the horizon, it prefers the worker
+    holding the producer of the largest input; start times of tasks are moved
+    back to the time when inputs and cpus were available. Downloads of a batch
+    of tasks started on a worker are aggregated into a single fluid flow through
+    its incoming link with `netmodel.bandwidth`, data sent by a worker share its
+    outgoing link in the same way. Downloading tasks are delayed by
+    `netmodel.latency` (per-link latencies are not modelled).
+
+    No scheduler is involved, the estimate approximates runs of good list
+    schedulers (see compare_fluid()). All per-step work is done on NumPy arrays.
+    """
+
+    def __init__(self, task_graph, workers, netmodel, step_fraction=0.1):
+        assert 0 < step_fraction <= 1
+        self.task_graph = task_graph
+        self.workers = workers
+        self.netmodel = netmodel
+        self.step_fraction = step_fraction
+        self.steps = 0
+
+    def _prepare(self):
+        tasks = list(self.task_graph.tasks.values())
+        index = {task: i for i, task in enumerate(tasks)}
+        self.tasks = tasks
+        self.durations = np.array([t.run_time() for t in tasks], dtype=float)
+        self.cpus = np.array([t.cpus for t in tasks], dtype=int)
+
+        producers = []
+        consumers = []
+        sizes = []
+        for i, task in enumerate(tasks):
+            for o in task.inputs:
+                if o.parent is not None:
+                    producers.append(index[o.parent])
+                    consumers.append(i)
+                    sizes.append(o.size)
+        producers = np.array(producers, dtype=int)
+        consumers = np.array(consumers, dtype=int)
+        sizes = np.array(sizes, dtype=float)
+        n = len(tasks)
+
+        # Edges sorted by producers (for finished tasks) and by consumers (for transfers)
+        order = np.argsort(producers, kind="stable")
+        self.out_indptr = _indptr(producers[order], n)
+        self.out_counts = np.diff(self.out_indptr)
+        self.out_consumers = consumers[order]
+        self.in_indptr = _indptr(consumers, n)
+        self.in_counts = np.diff(self.in_indptr)
+        self.in_producers = producers
+        self.in_sizes = sizes
+
+        self.input_count = np.bincount(consumers, minlength=n)
+        # Producer of the largest input of each task (-1 for tasks without inputs)
+        main_parent = np.full(n, -1, dtype=int)
+        if len(sizes):
+            order = np.lexsort((sizes, consumers))
+            last = np.flatnonzero(np.diff(consumers[order], append=n))
+            main_parent[consumers[order][last]] = producers[order][last]
+        self.main_parent = main_parent
+        self.blevel = self._compute_blevel()
+
+        slot_worker = []
+        for i, worker in enumerate(self.workers):
+            slot_worker.extend([i] * worker.cpus)
+        self.slot_worker = np.array(slot_worker, dtype=int)
+        self.speeds = np.array([w.speed for w in self.workers], dtype=float)
+        self.worker_cpus = np.array([w.cpus for w in self.workers], dtype=int)
+        if n and self.cpus.max() > self.worker_cpus.max():
+            raise Exception("Task requires more cpus than any worker has")
+
+    def _compute_blevel(self):
+        n = len(self.tasks)
+        remaining = self.input_count.copy()
+        frontier = np.flatnonzero(remaining == 0)
+        levels = []
+        processed = 0
+        while frontier.size:
+            levels.append(frontier)
+            processed += frontier.size
+            consumers = self.out_consumers[_gather(self.out_indptr, frontier)]
+            np.subtract.at(remaining, consumers, 1)
+            frontier = np.unique(consumers[remaining[consumers] == 0])
+        if processed != n:
+            raise Exception("Task graph contains a cycle")
+
+        blevel = self.durations.copy()
+        for level in reversed(levels):
+            edges = _gather(self.out_indptr, level)
+            producers = np.repeat(level, self.out_counts[level])
+            np.maximum.at(blevel, producers,
+                          self.durations[producers] + blevel[self.out_consumers[edges]])
+        return blevel
+
+    def run(self):
+        """
+        Runs the approximate simulation and returns the estimated makespan
+        """
+        self._prepare()
+        n = len(self.tasks)
+        if isinstance(self.netmodel, InstantNetModel):
+            bandwidth = np.inf
+        else:
+            bandwidth = self.netmodel.bandwidth
+
+        self.slot_free = np.zeros(len(self.slot_worker))
+        self.link_free = np.zeros(len(self.workers))
+        self.uplink_free = np.zeros(len(self.workers))
+        self.bandwidth = bandwidth
+        self.latency = self.netmodel.latency
+        self.remaining = self.input_count.copy()
+        self.ready_time = np.zeros(n)
+        self.finish = np.full(n, np.inf)
+        self.placed = np.full(n, -1, dtype=int)
+
+        # Ready tasks that were not started, sorted by priority
+        self.pending_single = np.empty(0, dtype=int)
+        self.pending_multi = np.empty(0, dtype=int)
+        self._push_ready(np.flatnonzero(self.remaining == 0))
+        running = np.empty(0, dtype=int)
+        finished = 0
+        makespan = 0
+        horizon = 0
+        step = self.step_fraction * self._lower_bound()
+        self.steps = 0
+
+        while finished < n:
+            horizon += step
+            running = np.concatenate((running, self._start_tasks(horizon)))
+            if not running.size:
+                raise Exception("No task can be started")
+
+            self.steps += 1
+            times = self.finish[running]
+            # Jump over time intervals in which no task finishes
+            horizon = max(horizon, times.min())
+            mask = times <= horizon
+            done = running[mask]
+            running = running[~mask]
+            finished += done.size
+            makespan = max(makespan, self.finish[done].max())
+
+            edges = _gather(self.out_indptr, done)
+            consumers = self.out_consumers[edges]
+            producers = np.repeat(done, self.out_counts[done])
+            np.subtract.at(self.remaining, consumers, 1)
+            np.maximum.at(self.ready_time, consumers, self.finish[producers])
+            self._push_ready(np.unique(consumers[self.remaining[consumers] == 0]))
+
+        return makespan
+
+    def _lower_bound(self):
+        """
+        Returns a lower bound of the makespan (the critical path or the total work)
+        """
+        if not len(self.tasks):
+            return 0
+        capacity = (self.worker_cpus * self.speeds).sum()
+        return max(self.blevel.max() / self.speeds.max(),
+                   (self.durations * self.cpus).sum() / capacity)
+
+    def _push_ready(self, tasks):
+        multi = self.cpus[tasks] > 1
+        self.pending_single = self._merge_pending(self.pending_single, tasks[~multi])
+        self.pending_multi = self._merge_pending(self.pending_multi, tasks[multi])
+
+    def _merge_pending(self, pending, tasks):
+        if not tasks.size:
+            return pending
+        keys = -self.blevel[tasks]
+        order = np.argsort(keys, kind="stable")
+        positions = np.searchsorted(-self.blevel[pending], keys[order], side="right")
+        return np.insert(pending, positions, tasks[order])
+
+    def _start_tasks(self, horizon):
+        """
+        Starts pending tasks on slots that are free until the horizon, returns them
+
+        Tasks are started in rounds, in each round multi-cpu and then single-cpu
+        tasks with the highest priority take the slots from _round_slots().
+        Tasks that would take later slots stay pending, so that tasks becoming
+        ready before those slots are free can still overtake them.
+        """
+        slot_count = len(self.slot_worker)
+        started = []
+        while self.pending_multi.size or self.pending_single.size:
+            free_slots = self._round_slots(np.concatenate(
+                (self.pending_multi[:slot_count], self.pending_single[:slot_count])), horizon)
+            if not free_slots.size:
+                break
+            if self.pending_multi.size:
+                tasks, used = self._start_multi_cpu_tasks(self.pending_multi, free_slots)
+                if not tasks.size and not self.pending_single.size:
+                    # No task fits into the round, try all slots free until the horizon
+                    tasks, used = self._start_multi_cpu_tasks(
+                        self.pending_multi, np.flatnonzero(self.slot_free <= horizon))
+                    if not tasks.size:
+                        break
+                self.pending_multi = self.pending_multi[~np.isin(self.pending_multi, tasks)]
+                free_slots = np.setdiff1d(free_slots, used, assume_unique=True)
+                started.append(tasks)
+
+            single = self.pending_single[:free_slots.size]
+            if not single.size:
+                continue
+            self.pending_single = self.pending_single[single.size:]
+            workers = self._place_single_cpu_tasks(single, free_slots)
+            # Free slots of each worker ordered by the time when they become free
+            order = np.lexsort((self.slot_free[free_slots], self.slot_worker[free_slots]))
+            free_slots = free_slots[order]
+            first = np.searchsorted(self.slot_worker[free_slots], workers)
+            slots = free_slots[first + _ranks(workers)]
+            data_time = self._transfer_inputs(single, workers)
+            start = np.maximum(data_time, self.slot_free[slots])
+            self.finish[single] = start + self.durations[single] / self.speeds[workers]
+            self.placed[single] = workers
+            self.slot_free[slots] = self.finish[single]
+            started.append(single)
+
+        if not started:
+            return np.empty(0, dtype=int)
+        return np.concatenate(started)
+
+    def _round_slots(self, tasks, horizon):
+        """
+        Returns slots that become free until the horizon and before the slot
+        that is free first could finish any of the given tasks (i.e. slots that
+        a list scheduler would use for the next tasks)
+
+        There is at least one slot unless all slots are busy after the horizon.
+        """
+        free = np.maximum(self.slot_free, self.ready_time[tasks].min())
+        first = free.min()
+        if first > horizon:
+            return np.empty(0, dtype=int)
+        end = min(horizon, first + self.durations[tasks].min() / self.speeds.max())
+        return np.flatnonzero(free <= end)
+
+    def _place_single_cpu_tasks(self, tasks, free_slots):
+        """
+        Returns workers for tasks (sorted by priority), one of the slots per task
+        """
+        free = np.bincount(self.slot_worker[free_slots], minlength=len(self.workers))
+        parents = self.main_parent[tasks]
+        preferred = np.where(parents >= 0, self.placed[np.maximum(parents, 0)], -1)
+        workers = np.full(tasks.size, -1, dtype=int)
+
+        has = np.flatnonzero(preferred >= 0)
+        if has.size:
+            order = has[np.argsort(preferred[has], kind="stable")]
+            local = order[_group_ranks(preferred[order]) < free[preferred[order]]]
+            workers[local] = preferred[local]
+            free -= np.bincount(workers[local], minlength=len(free))
+
+        rest = np.flatnonzero(workers < 0)
+        if rest.size:
+            # Remaining free slots interleaved among workers
+            slot_workers = np.repeat(np.arange(len(free)), free)
+            ranks = _group_ranks(slot_workers)
+            slot_workers = slot_workers[np.lexsort((slot_workers, ranks))]
+            workers[rest] = slot_workers[:rest.size]
+        return workers
+
+    def _start_multi_cpu_tasks(self, tasks, free_slots):
+        """
+        Starts multi-cpu tasks (sorted by priority) that fit into the given slots
+
+        Returns the started tasks (in the order of priority) and the used slots
+        """
+        free = np.bincount(self.slot_worker[free_slots], minlength=len(self.workers))
+        tasks = tasks[self.cpus[tasks] <= free.max()]
+        if not tasks.size:
+            return tasks, tasks
+        workers = self._place_multi_cpu_tasks(tasks, free)
+        placed = workers >= 0
+        tasks = tasks[placed]
+        workers = workers[placed]
+        if not tasks.size:
+            return tasks, tasks
+        cpus = self.cpus[tasks]
+
+        # Each task takes its cpus slots of the worker that became free first
+        order = np.lexsort((self.slot_free[free_slots], self.slot_worker[free_slots]))
+        free_slots = free_slots[order]
+        first = np.searchsorted(self.slot_worker[free_slots], workers)
+        by_worker = np.argsort(workers, kind="stable")
+        offsets = np.empty(tasks.size, dtype=int)
+        offsets[by_worker] = _group_offsets(workers[by_worker], cpus[by_worker])
+        task_slots = np.repeat(first + offsets, cpus) + _group_ranks(np.repeat(
+            np.arange(tasks.size), cpus))
+        slots = free_slots[task_slots]
+        slots_free = np.maximum.reduceat(self.slot_free[slots], np.cumsum(cpus) - cpus)
+
+        data_time = self._transfer_inputs(tasks, workers)
+        start = np.maximum(data_time, slots_free)
+        self.finish[tasks] = start + self.durations[tasks] / self.speeds[workers]
+        self.placed[tasks] = workers
+        self.slot_free[slots] = np.repeat(self.finish[tasks], cpus)
+        return tasks, slots
+
+    def _place_multi_cpu_tasks(self, tasks, free):
+        """
+        Returns workers for tasks (sorted by priority), -1 for tasks that do not fit
+
+        A task is placed on the worker of its main parent if it fits there,
+        other tasks are placed in rounds, in each round the tasks are paired
+        with workers sorted by their free cpus.
+        """
+        free = free.copy()
+        cpus = self.cpus[tasks]
+        parents = self.main_parent[tasks]
+        preferred = np.where(parents >= 0, self.placed[np.maximum(parents, 0)], -1)
+        workers = np.full(tasks.size, -1, dtype=int)
+
+        has = np.flatnonzero(preferred >= 0)
+        if has.size:
+            order = has[np.argsort(preferred[has], kind="stable")]
+            used = _group_offsets(preferred[order], cpus[order]) + cpus[order]
+            local = order[used <= free[preferred[order]]]
+            workers[local] = preferred[local]
+            free -= np.bincount(workers[local], weights=cpus[local],
+                                minlength=len(free)).astype(int)
+
+        rest = np.flatnonzero(workers < 0)
+        while rest.size:
+            rest = rest[cpus[rest] <= free.max()]
+            if not rest.size:
+                break
+            # The first task always fits into the worker with the most free cpus
+            candidates = np.argsort(-free, kind="stable")[:rest.size]
+            paired = rest[:candidates.size]
+            fits = cpus[paired] <= free[candidates]
+            workers[paired[fits]] = candidates[fits]
+            free[candidates[fits]] -= cpus[paired[fits]]
+            rest = np.setdiff1d(rest, paired[fits], assume_unique=True)
+        return workers
+
+    def _transfer_inputs(self, tasks, workers):
+        """
+        Returns times when inputs of tasks are present on the given workers
+
+        Remote inputs of all tasks started on a worker are downloaded as one
+        fluid flow starting when the link is free and the first of them is ready.
+        Data sent by each source worker are aggregated in the same way.
+        """
+        ready_time = self.ready_time[tasks]
+        edges = _gather(self.in_indptr, tasks)
+        if not edges.size or self.bandwidth == np.inf:
+            return ready_time
+        positions = np.repeat(np.arange(tasks.size), self.in_counts[tasks])
+        sources = self.placed[self.in_producers[edges]]
+        remote = (sources != workers[positions]) & (self.in_sizes[edges] > 0)
+        if not remote.any():
+            return ready_time
+        positions = positions[remote]
+        sources = sources[remote]
+        sizes = self.in_sizes[edges][remote]
+
+        data_time = ready_time.copy()
+        downloading = np.unique(positions)
+        w = workers[downloading]
+        self._use_links(self.link_free, w, ready_time[downloading],
+                        np.bincount(positions, weights=sizes)[downloading])
+        data_time[downloading] = (np.maximum(ready_time[downloading], self.link_free[w]) +
+                                  self.latency)
+
+        self._use_links(self.uplink_free, sources, ready_time[positions], sizes)
+        np.maximum.at(data_time, positions, self.uplink_free[sources])
+        return data_time
+
+    def _use_links(self, link_free, workers, ready_time, sizes):
+        worker_count = len(self.workers)
+        first_ready = np.full(worker_count, np.inf)
+        np.minimum.at(first_ready, workers, ready_time)
+        total = np.bincount(workers, weights=sizes, minlength=worker_count)
+        used = total > 0
+        link_free[used] = (np.maximum(link_free[used], first_ready[used]) +
+                           total[used] / self.bandwidth)
+
+
+class FluidComparison:
+    """
+    Makespans and wall-clock times of the exact and the fluid simulation
+
+        error - relative error of the fluid makespan
+        speedup - exact wall time / fluid wall time
+    """
+
+    __slots__ = ("exact_makespan", "fluid_makespan", "exact_wall_time", "fluid_wall_time")
+
+    def __init__(self, exact_makespan, fluid_makespan, exact_wall_time, fluid_wall_time):
+        self.exact_makespan = exact_makespan
+        self.fluid_makespan = fluid_makespan
+        self.exact_wall_time = exact_wall_time
+        self.fluid_wall_time = fluid_wall_time
+
+    @property
+    def error(self):
+        if not self.exact_makespan:
+            return 0
+        return (self.fluid_makespan - self.exact_makespan) / self.exact_makespan
+
+    @property
+    def speedup(self):
+        if not self.fluid_wall_time:
+            return None
+        return self.exact_wall_time / self.fluid_wall_time
+
+    def __repr__(self):
+        return "<FluidComparison exact={} fluid={} error={:.3f}>".format(
+            self.exact_makespan, self.fluid_makespan, self.error)
+
+
+def compare_fluid(task_graph, workers, scheduler, netmodel, step_fraction=0.1,
+                  **simulator_args):
+    """
+    Runs the fluid and the exact simulation (with the given scheduler) of a graph
+
+    `simulator_args` are passed to Simulator. Returns FluidComparison.
+    """
+    start = perf_counter()
+    fluid_makespan = FluidSimulator(task_graph, workers, netmodel, step_fraction).run()
+    fluid_wall_time = perf_counter() - start
+
+    start = perf_counter()
+    exact_makespan = Simulator(task_graph, workers, scheduler, netmodel, **simulator_args).run()
+    exact_wall_time = perf_counter() - start
+    return FluidComparison(exact_makespan, fluid_makespan, exact_wall_time, fluid_wall_time)
+
+
+def _indptr(rows, n):
+    """
+    Returns CSR offsets of sorted `rows` with values in 0..n-1
+    """
+    indptr = np.zeros(n + 1, dtype=int)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return indptr
+
+
+def _gather(indptr, rows):
+    """
+    Returns indices of entries of all given CSR rows
+    """
+    starts = indptr[rows]
+    counts = indptr[rows + 1] - starts
+    total = counts.sum()
+    if not total:
+        return np.empty(0, dtype=int)
+    offsets = starts - (np.cumsum(counts) - counts)
+    return np.arange(total) + np.repeat(offsets, counts)
+
+
+def _ranks(values):
+    """
+    Returns the position of each element among equal elements of `values`
+    """
+    order = np.argsort(values, kind="stable")
+    ranks = np.empty(values.size, dtype=int)
+    ranks[order] = _group_ranks(values[order])
+    return ranks
+
+
+def _group_ranks(values):
+    """
+    Returns the position of each element among equal elements of grouped `values`
+    """
+    if not values.size:
+        return np.empty(0, dtype=int)
+    starts = np.flatnonzero(np.concatenate(([True], values[1:] != values[:-1])))
+    counts = np.diff(np.append(starts, values.size))
+    return np.arange(values.size) - np.repeat(starts, counts)
+
+
+def _group_offsets(values, weights):
+    """
+    Returns the sum of weights of preceding elements among equal elements
+    of grouped `values`
+    """
+    if not values.size:
+        return np.empty(0, dtype=int)
+    sums = np.cumsum(weights) - weights
+    starts = np.flatnonzero(np.concatenate(([True], values[1:] != values[:-1])))
+    counts = np.diff(np.append(starts, values.size))
+    return sums - np.repeat(sums[starts], counts)
@@ -0,0 +1,50 @@
+import random
+
+
+class Job:
+    """
+    Independent task graph submitted into a running simulation
+
+    Tasks and objects of the job are removed from the simulator (and the
+    scheduler) after the job is finished and the scheduler was informed
+    about it, their ids are reused by later jobs.
+    """
+
+    __slots__ = ("id", "tasks", "objects", "arrival_time", "end_time", "unfinished_tasks")
+
+    def __init__(self, job_id, tasks, objects, arrival_time):
+        self.id = job_id
+        self.tasks = tasks
+        self.objects = objects
+        self.arrival_time = arrival_time
+        self.end_time = None
+        self.unfinished_tasks = len(tasks)
+
+    @property
+    def latency(self):
+        if self.end_time is None:
+            return None
+        return self.end_time - self.arrival_time
+
+    def __repr__(self):
+        return "<Job {} tasks={}>".format(self.id, len(self.tasks))
+
+
+def poisson_arrivals(graph_factory, rate, count=None, start=0, seed=None):
+    """
+    Yields (arrival_time, task_graph) with exponentially distributed inter-arrival times
+
+        graph_factory - function returning a new task graph for each job,
+                        e.g. lambda: crossv(10)
+        rate - mean number of arrivals per unit of simulated time
+        count - number of jobs (None for an infinite stream)
+
+    The stream is meant for Simulator.submit_stream(), graphs are created lazily.
+    """
+    rng = random.Random(seed)
+    time = start
+    i = 0
+    while count is None or i < count:
+        time += rng.expovariate(rate)
+        yield time, graph_factory()
+        i += 1
@@ -0,0 +1,52 @@
+class EvictionPolicy:
+    """
+    Chooses objects evicted from memory of a worker
+
+    Objects in memory are sorted by key(), objects with lower keys are evicted first.
+    """
+
+    def key(self, worker, obj):
+        raise NotImplementedError()
+
+
+class LruEvictionPolicy(EvictionPolicy):
+    """
+    Least recently used (produced, downloaded or used as an input) objects first
+    """
+
+    def key(self, worker, obj):
+        return worker.last_use[obj]
+
+
+class LargestFirstEvictionPolicy(EvictionPolicy):
+    """
+    Largest objects first, objects of the same size in LRU order
+    """
+
+    def key(self, worker, obj):
+        return (-obj.size, worker.last_use[obj])
+
+
+class NoConsumersFirstEvictionPolicy(EvictionPolicy):
+    """
+    Objects without unfinished consumers first, then in LRU order
+    """
+
+    def key(self, worker, obj):
+        return (worker.simulator.has_unfinished_consumers(obj), worker.last_use[obj])
+
+
+EVICTION_POLICIES = {
+    "lru": LruEvictionPolicy,
+    "largest": LargestFirstEvictionPolicy,
+    "no-consumers": NoConsumersFirstEvictionPolicy,
+}
+
+
+def get_eviction_policy(policy):
+    if isinstance(policy, EvictionPolicy):
+        return policy
+    cls = EVICTION_POLICIES.get(policy)
+    if cls is None:
+        raise Exception("Unknown eviction policy '{}'".format(policy))
+    return cls()
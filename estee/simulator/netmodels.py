@@ -1,8 +1,9 @@
 
 import logging
+from functools import partial
+from heapq import heappop, heappush
 
 import numpy as np
-from simpy import Event
 
 from ..common.utils import LruCache
 from ..simulator.trace import NetModelFlowEvent
@@ -15,10 +16,20 @@ class NetModel:
         bandwidth - maximal bandwidth between two nodes
                     (this is what the network announces publicly,
                     not necessary how it really behaves)
+        latency - time before data of each transfer start to flow
+                  (announced together with the bandwidth)
+        link_latencies - optional dict {(source id, target id): latency}
+                         of additional latencies of links
     """
 
-    def __init__(self, bandwidth=1.0):
+    # Concurrent downloads of a worker share its bandwidth
+    LIMITS_RECEIVER_BANDWIDTH = False
+
+    def __init__(self, bandwidth=1.0, latency=0.0, link_latencies=None):
+        assert latency >= 0
         self.bandwidth = float(bandwidth)
+        self.latency = float(latency)
+        self.link_latencies = link_latencies
         self.worker_bandwidth = {}
         self.event_listener = None
 
@@ -28,9 +39,27 @@ class NetModel:
         for worker in workers:
             assert worker.id is not None
 
+    def transfer_latency(self, source, target):
+        latency = self.latency
+        if self.link_latencies:
+            latency += self.link_latencies.get((source.id, target.id), 0)
+        return latency
+
     def set_event_listener(self, listener):
         self.event_listener = listener
 
+    def shared_objects(self):
+        """
+        Objects that are shared (not copied) when the simulator is forked
+        """
+        return ()
+
+    def update_statistics(self, statistics):
+        """
+        Stores counters of the network model into SimulatorStatistics
+        """
+        pass
+
 
 class InstantNetModel(NetModel):
 
@@ -39,7 +68,7 @@ class InstantNetModel(NetModel):
 
     def download(self, source, target, size, value=None):
         assert source != target
-        event = Event(self.env)
+        event = self.env.event()
         event.succeed(value)
         return event
 
@@ -52,13 +81,16 @@ class SimpleNetModel(NetModel):
     def download(self, source, target, size, value=None):
         assert source != target
 
-        e = self.env.timeout(size / self.bandwidth, value)
+        e = self.env.timeout(self.transfer_latency(source, target) + size / self.bandwidth, value)
 
         if self.event_listener:
             self.trace_bandwidth(source, target, self.bandwidth)
-            e.callbacks.append(lambda _: self.trace_bandwidth(source, target, -self.bandwidth))
+            e.callbacks.append(partial(self._trace_download_finished, source, target))
         return e
 
+    def _trace_download_finished(self, source, target, event):
+        self.trace_bandwidth(source, target, -self.bandwidth)
+
     def trace_bandwidth(self, source, target, value):
         key = (source, target)
         bandwidth = self.bandwidth_cache.get(key, 0) + value
@@ -68,124 +100,336 @@ class SimpleNetModel(NetModel):
 
 class RunningDownload:
 
-    __slots__ = ("size", "speed", "event", "value")
+    __slots__ = ("size", "end", "event", "value")
 
     def __init__(self, size, event, value):
         self.size = size
         self.event = event
-        self.speed = None
+        self.end = None
         self.value = value
 
+    def __lt__(self, other):
+        return self.end < other.end
+
     def __repr__(self):
-        return "<RD {} {} {}>".format(id(self), self.size, self.speed)
+        return "<RD {} {} {}>".format(id(self), self.size, self.end)
+
+
+class Link:
+    """
+    Open link between two workers
+
+    All downloads of a link share its flow equally, so their remaining sizes
+    are not stored. 'progress' is the amount of data transferred by each
+    download of the link since the link was opened and a download is finished
+    when the progress reaches its 'end'. The progress is updated lazily, only
+    when the speed of the link is changed.
+
+    A link is dropped when it has no downloads, so an idle link starts again
+    from zero. A link that stays busy rebases its progress (and ends of its
+    downloads) to zero when it exceeds REBASE_PROGRESS, otherwise the remaining
+    sizes (end - progress) of small downloads would lose precision.
+    """
+
+    __slots__ = ("downloads", "speed", "progress", "updated", "version")
+
+    REBASE_PROGRESS = 1024 * 1024
+
+    def __init__(self, now):
+        self.downloads = []  # Heap of RunningDownloads ordered by end
+        self.speed = 0.0
+        self.progress = 0.0
+        self.updated = now
+        self.version = None
+
+    def advance(self, now):
+        self.progress += (now - self.updated) * self.speed
+        self.updated = now
+        if self.progress > self.REBASE_PROGRESS:
+            # Shifting all ends by the same value keeps the heap order
+            progress = self.progress
+            for download in self.downloads:
+                download.end -= progress
+            self.progress = 0.0
 
 
 class MaxMinFlowNetModel(NetModel):
+    """
+    Flows of links are max-min fair with respect to the bandwidth of each
+    sender and receiver
+
+    When links are opened or closed, only flows of the connected component of
+    the bipartite sender/receiver graph that contains the changed links are
+    recomputed, flows of other components are not affected.
+
+    Finish times of links (of their earliest download) are kept in a heap that
+    is updated only for links whose speed was changed.
+    """
+
+    # Maximal size of cached flows in bytes
+    CACHE_SIZE = 16 * 1024 * 1024
+    LIMITS_RECEIVER_BANDWIDTH = True
 
-    CACHE_SIZE = 256
+    def __init__(self, bandwidth=1.0, latency=0.0, link_latencies=None):
+        super().__init__(bandwidth, latency, link_latencies)
+        self.flow_cache = None
+
+    def shared_objects(self):
+        # Cached flows depend only on connections and are never modified
+        if self.flow_cache is not None:
+            return (self.flow_cache,)
+        return ()
+
+    def update_statistics(self, statistics):
+        statistics.flow_cache_hits = self.flow_cache_hits
+        statistics.flow_cache_misses = self.flow_cache_misses
 
     def init(self, env, workers):
         super().init(env, workers)
-        self.downloads = {}
-        self.recompute_event = Event(env)
-        self.flows = np.zeros((len(workers), len(workers)))
+        self.recompute_event = None
+        # Open links {(source id, target id): Link}
+        self.links = {}
+        # Flows of open links {(source id, target id): flow}
+        self.flows = {}
+        # Ids of targets/sources of open links for each worker id
+        self.send_links = [set() for _ in workers]
+        self.recv_links = [set() for _ in workers]
+        # (source id, target id) of links opened or closed since the last recomputation
+        self.changed_links = set()
+        # (source id, target id) of links whose speed has to be updated
+        self.dirty_links = set()
+        # Heap of (finish time, version, (source id, target id)),
+        # entries with other version than the version of the link are stale
+        self.finish_heap = []
+        self.heap_version = 0
 
         self.recompute_flows = False
-        self.flow_cache = LruCache(self.CACHE_SIZE)
-
-        def network_process():
-            while True:
-                if self.recompute_flows:
-                    self.recompute_flows = False
-                    self._recompute_flows()
-                    logger.info("Flows reconfigured:\n%s", self.flows)
-
-                timeout = self._update_speeds()
-                logger.info("Earliest download finished in: %s", timeout)
-                if timeout is not None:
-                    start_time = self.env.now
-                    r = yield self.recompute_event | self.env.timeout(timeout)
-                    self._update_sizes(self.env.now - start_time)
-                    if self.recompute_event in r:
-                        self.recompute_event = Event(env)
-                else:
-                    logger.info("No active downloads")
-                    yield self.recompute_event
-                    self.recompute_event = Event(env)
-        env.process(network_process())
+        self.flow_cache = LruCache(self.CACHE_SIZE, _flow_cache_sizeof)
+        # Counted by the model, the cache may be shared by forked simulators
+        self.flow_cache_hits = 0
+        self.flow_cache_misses = 0
+
+        self.timeout_id = 0
+
+    def _wakeup(self):
+        if self.recompute_event is None:
+            self.recompute_event = self.env.event()
+            self.recompute_event.callbacks.append(self._network_step)
+            self.recompute_event.succeed()
+
+    def _timeout_expired(self, event):
+        if event.value == self.timeout_id:
+            self._network_step(None)
+
+    def _network_step(self, event):
+        if event is not None:
+            self.recompute_event = None
+        now = self.env.now
+        self._finish_downloads(now)
+
+        if self.recompute_flows:
+            self.recompute_flows = False
+            self._recompute_flows(now)
+            logger.info("Flows reconfigured:\n%s", self.flows)
+
+        if self.dirty_links:
+            self._update_speeds(now)
+
+        # Any pending timeout is superseded by the new one
+        self.timeout_id += 1
+        finish_time = self._earliest_finish()
+        if finish_time is not None:
+            timeout = max(finish_time - now, 0)
+            logger.info("Earliest download finished in: %s", timeout)
+            self.env.timeout(timeout, self.timeout_id).callbacks.append(self._timeout_expired)
+        else:
+            logger.info("No active downloads")
 
     def download(self, source, target, size, value=None):
         assert source != target
-        event = Event(self.env)
+        event = self.env.event()
         rd = RunningDownload(size, event, value)
         logger.info("New download %s; %s-%s size=%s", rd, source, target, size)
-        key = (source, target)
-        lst = self.downloads.get(key)
-        if lst is None:
-            lst = []
-            self.downloads[key] = lst
-        if not lst:
-            logger.info("Link %s-%s opened, need recompute flows", source, target)
-            self.recompute_flows = True
-        lst.append(rd)
-        if not self.recompute_event.triggered:
-            self.recompute_event.succeed()
+        latency = self.transfer_latency(source, target)
+        if latency:
+            # The flow is opened after the latency
+            self.env.timeout(latency).callbacks.append(
+                partial(self._start_flow, source, target, rd))
+        else:
+            self._start_flow(source, target, rd)
         return event
 
-    def _update_speeds(self):
-        timeout = None
-        for (source, target), lst in self.downloads.items():
-            if not lst:
+    def _start_flow(self, source, target, rd, event=None):
+        key = (source.id, target.id)
+        now = self.env.now
+        link = self.links.get(key)
+        if link is None:
+            logger.info("Link %s-%s opened, need recompute flows", source, target)
+            link = Link(now)
+            self.links[key] = link
+            self.recompute_flows = True
+            self.send_links[source.id].add(target.id)
+            self.recv_links[target.id].add(source.id)
+            self.changed_links.add(key)
+        else:
+            link.advance(now)
+        rd.end = link.progress + rd.size
+        heappush(link.downloads, rd)
+        self.dirty_links.add(key)
+        self._wakeup()
+
+    def _finish_downloads(self, now):
+        heap = self.finish_heap
+        links = self.links
+        while heap:
+            _, version, key = heap[0]
+            link = links.get(key)
+            if link is None or link.version != version:
+                heappop(heap)
                 continue
-            speed = self.flows[source.id, target.id] / len(lst)
-            for download in lst:
-                download.speed = speed
-                t = download.size / speed
-                timeout = min(t, timeout) if timeout is not None else t
-        return timeout
-
-    def _update_sizes(self, time):
-        for key, lst in self.downloads.items():
-            if not lst:
+            link.advance(now)
+            downloads = link.downloads
+            if downloads[0].end - link.progress >= 0.000002:
+                break
+            heappop(heap)
+            while downloads and downloads[0].end - link.progress < 0.000002:
+                download = heappop(downloads)
+                logger.info("Download finished %s", download)
+                download.event.succeed(download.value)
+            if downloads:
+                self.dirty_links.add(key)
+            else:
+                self._close_link(key)
+
+    def _close_link(self, key):
+        source, target = key
+        logger.info("Link %s-%s closed, need recompute flows", source, target)
+        del self.links[key]
+        self.recompute_flows = True
+        self.send_links[source].discard(target)
+        self.recv_links[target].discard(source)
+        self.changed_links.add(key)
+
+    def _update_speeds(self, now):
+        heap = self.finish_heap
+        links = self.links
+        flows = self.flows
+        for key in self.dirty_links:
+            link = links.get(key)
+            if link is None:
                 continue
-            for download in lst[:]:
-                if download.speed is None:  # Freshly scheduled
-                    continue
-                size = download.size - time * download.speed
-                if size < 0.000002:
-                    logger.info("Download finished %s", download)
-                    lst.remove(download)
-                    download.event.succeed(download.value)
-                download.size = size
-            if not lst:
-                source, target = key
-                logger.info("Link %s-%s opened, need recompute flows", source, target)
-                self.recompute_flows = True
-
-    def _recompute_flows(self):
-        connections = np.zeros_like(self.flows, dtype=np.int32)
-        for (source, target), lst in self.downloads.items():
-            if lst:
-                connections[source.id, target.id] = 1
-        key = connections.tobytes()
-        f = self.flow_cache.get(key)
-        if f is None:
-            send_capacities = np.full(len(self.workers), self.bandwidth)
-            recv_capacities = send_capacities.copy()
-            f = compute_maxmin_flow(send_capacities, recv_capacities, connections)
-            self.flow_cache.set(key, f)
-        self._trace_flows(self.flows, f)
-        self.flows = f
-
-    def _trace_flows(self, old_flows, new_flows):
-        if not self.event_listener:
-            return
+            link.speed = speed = flows[key] / len(link.downloads)
+            self.heap_version += 1
+            link.version = self.heap_version
+            if speed > 0:
+                finish_time = now + (link.downloads[0].end - link.progress) / speed
+                heappush(heap, (finish_time, link.version, key))
+        self.dirty_links.clear()
+
+    def _earliest_finish(self):
+        heap = self.finish_heap
+        links = self.links
+        while heap:
+            finish_time, version, key = heap[0]
+            link = links.get(key)
+            if link is not None and link.version == version:
+                return finish_time
+            heappop(heap)
+        return None
+
+    def _recompute_flows(self, now):
+        senders, receivers = self._changed_component()
+        send_links = self.send_links
+        recv_links = self.recv_links
+        closed = [(s, r) for s, r in self.changed_links if r not in send_links[s]]
+        self.changed_links.clear()
+
+        # Links of the component relabeled to indices of sorted senders and receivers
+        # (workers without open links are left out, so the labels are canonical)
+        senders = [s for s in senders if send_links[s]]
+        receivers = [r for r in receivers if recv_links[r]]
+        recv_index = {r: i for i, r in enumerate(receivers)}
+        links = []
+        for i, s in enumerate(senders):
+            links.extend((i, recv_index[r]) for r in sorted(send_links[s]))
+
+        if not links:
+            # The last links of the component were closed, there is nothing to solve
+            f = np.zeros(0)
+        else:
+            # All capacities are equal, so flows depend only on links of the component
+            key = np.array(links, dtype=np.int32).tobytes()
+            f = self.flow_cache.get(key)
+            if f is None:
+                self.flow_cache_misses += 1
+                send_capacities = np.full(len(senders), self.bandwidth)
+                recv_capacities = np.full(len(receivers), self.bandwidth)
+                f = compute_maxmin_flow_sparse(send_capacities, recv_capacities, links)
+                self.flow_cache.set(key, f)
+            else:
+                self.flow_cache_hits += 1
+
+        flows = self.flows
+        component = [(senders[i], receivers[j]) for i, j in links]
+        old_flows = np.fromiter((flows.get(key, 0.0) for key in component),
+                                np.float64, len(component))
+        changed = np.flatnonzero(old_flows != f)
+        closed = [(key, flows.pop(key)) for key in closed if key in flows]
+        if self.event_listener:
+            self._trace_flows(component, changed, f, closed)
+
+        flows.update(zip(component, f.tolist()))
+        links = self.links
+        for i in changed.tolist():
+            key = component[i]
+            links[key].advance(now)
+            self.dirty_links.add(key)
+
+    def _changed_component(self):
+        """
+        Returns sorted ids of senders and receivers connected to changed links
+        """
+        send_links = self.send_links
+        recv_links = self.recv_links
+        senders = set()
+        receivers = set()
+        send_stack = [s for s, _ in self.changed_links]
+        recv_stack = [r for _, r in self.changed_links]
+        while send_stack or recv_stack:
+            while send_stack:
+                s = send_stack.pop()
+                if s not in senders:
+                    senders.add(s)
+                    recv_stack.extend(send_links[s].difference(receivers))
+            while recv_stack:
+                r = recv_stack.pop()
+                if r not in receivers:
+                    receivers.add(r)
+                    send_stack.extend(recv_links[r].difference(senders))
+        return sorted(senders), sorted(receivers)
+
+    def _trace_flows(self, component, changed, flows, closed):
+        """
+        Emits events only for links with changed flows
+
+        component - (source id, target id) of links of the recomputed component
+        changed - indices of links in component whose flow was changed
+        flows - new flows of links in component
+        closed - ((source id, target id), old flow) of closed links
+        """
         now = self.env.now
-        for s in self.workers:
-            for t in self.workers:
-                f = new_flows[s.id, t.id]
-                if old_flows[s.id, t.id] != f:
-                    self.event_listener(NetModelFlowEvent(now, s, t, f))
+        workers = self.workers
+        listener = self.event_listener
+        for i, flow in zip(changed.tolist(), flows[changed].tolist()):
+            s, t = component[i]
+            listener(NetModelFlowEvent(now, workers[s], workers[t], flow))
+        for (s, t), flow in closed:
+            if flow != 0:
+                listener(NetModelFlowEvent(now, workers[s], workers[t], 0.0))
+
+
+def _flow_cache_sizeof(key, flows):
+    return len(key) + flows.nbytes
 
 
 def compute_maxmin_flow(send_capacities, recv_capacities, connections):
@@ -214,3 +458,67 @@ def compute_maxmin_flow(send_capacities, recv_capacities, connections):
                 connections[:, ra] = 0
                 result[:, ra] += flow
     return result
+
+
+def compute_maxmin_flow_sparse(send_capacities, recv_capacities, links):
+    """
+    Sparse variant of compute_maxmin_flow
+
+    links - sequence of unique (sender, receiver) pairs, senders and receivers
+            are indices into send_capacities and recv_capacities
+
+    Returns an array of flows of links (in the order of links). The result is
+    the same as of compute_maxmin_flow, but the time is proportional to the
+    number of links instead of the size of the connection matrix.
+    """
+    result = np.zeros(len(links))
+    send_links = {}
+    recv_links = {}
+    for i, (s, r) in enumerate(links):
+        send_links.setdefault(s, set()).add(i)
+        recv_links.setdefault(r, set()).add(i)
+    send_caps = {s: float(send_capacities[s]) for s in send_links}
+    recv_caps = {r: float(recv_capacities[r]) for r in recv_links}
+
+    # Heaps of (share, node, version); entries with an old version are stale
+    send_versions = dict.fromkeys(send_links, 0)
+    recv_versions = dict.fromkeys(recv_links, 0)
+    send_heap = [(send_caps[s] / len(lst), s, 0) for s, lst in send_links.items()]
+    recv_heap = [(recv_caps[r] / len(lst), r, 0) for r, lst in recv_links.items()]
+    send_heap.sort()
+    recv_heap.sort()
+
+    def top(heap, versions):
+        while True:
+            share, node, version = heap[0]
+            if versions.get(node) == version:
+                return share, node
+            heappop(heap)
+
+    def saturate(node, share, node_links, versions, other_links, other_caps,
+                 other_versions, other_heap, other_side):
+        for i in node_links.pop(node):
+            result[i] = share
+            o = links[i][other_side]
+            other_caps[o] -= share
+            lst = other_links[o]
+            lst.remove(i)
+            if lst:
+                version = other_versions[o] + 1
+                other_versions[o] = version
+                heappush(other_heap, (other_caps[o] / len(lst), o, version))
+            else:
+                del other_links[o]
+                del other_versions[o]
+        del versions[node]
+
+    while send_links:
+        sm, sa = top(send_heap, send_versions)
+        rm, ra = top(recv_heap, recv_versions)
+        if sm <= rm:
+            saturate(sa, sm, send_links, send_versions,
+                     recv_links, recv_caps, recv_versions, recv_heap, 1)
+        else:
+            saturate(ra, rm, recv_links, recv_versions,
+                     send_links, send_caps, send_versions, send_heap, 0)
+    return result
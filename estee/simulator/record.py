@@ -0,0 +1,76 @@
+import numpy as np
+
+
+class ScheduleRecord:
+    """
+    Stream of assignments returned by a scheduler
+
+    Each assignment is stored together with the simulated time and the number
+    of finished tasks at the scheduler invocation that produced it. The record
+    is saved into a compressed NumPy (.npz) file and replayed by ReplayScheduler.
+    """
+
+    def __init__(self, reassigning=False, task_start_notification=False):
+        self.reassigning = reassigning
+        self.task_start_notification = task_start_notification
+        self.times = []
+        self.progress = []
+        self.tasks = []
+        self.workers = []
+        self.priorities = []
+        self.blockings = []
+        self.duplicates = []
+
+    def add(self, time, tasks_finished, schedule):
+        for assignment in schedule:
+            worker = assignment.get("worker")
+            self.times.append(time)
+            self.progress.append(tasks_finished)
+            self.tasks.append(assignment["task"])
+            self.workers.append(-1 if worker is None else worker)
+            self.priorities.append(assignment.get("priority", 0))
+            self.blockings.append(assignment.get("blocking", 0))
+            self.duplicates.append(assignment.get("duplicate", False))
+
+    def assignment(self, index):
+        worker = self.workers[index]
+        result = {
+            "worker": None if worker == -1 else worker,
+            "task": self.tasks[index],
+            "priority": self.priorities[index],
+            "blocking": self.blockings[index],
+        }
+        if self.duplicates[index]:
+            result["duplicate"] = True
+        return result
+
+    def save(self, filename):
+        np.savez_compressed(filename,
+                            times=np.array(self.times, dtype=np.float64),
+                            progress=np.array(self.progress, dtype=np.int64),
+                            tasks=np.array(self.tasks, dtype=np.int64),
+                            workers=np.array(self.workers, dtype=np.int32),
+                            priorities=np.array(self.priorities, dtype=np.float64),
+                            blockings=np.array(self.blockings, dtype=np.float64),
+                            duplicates=np.array(self.duplicates, dtype=bool),
+                            flags=np.array([self.reassigning, self.task_start_notification]))
+
+    @staticmethod
+    def load(filename):
+        with np.load(filename) as data:
+            reassigning, task_start_notification = data["flags"].tolist()
+            record = ScheduleRecord(reassigning, task_start_notification)
+            record.times = data["times"].tolist()
+            record.progress = data["progress"].tolist()
+            record.tasks = data["tasks"].tolist()
+            record.workers = data["workers"].tolist()
+            record.priorities = data["priorities"].tolist()
+            record.blockings = data["blockings"].tolist()
+            if "duplicates" in data:
+                record.duplicates = data["duplicates"].tolist()
+            else:
+                record.duplicates = [False] * len(record.times)
+        return record
+
+    def __len__(self):
+        return len(self.times)
@@ -1,5 +1,7 @@
 from enum import IntEnum
 
+import numpy as np
+
 
 class TaskState(IntEnum):
     Waiting = 1
@@ -7,59 +9,232 @@ class TaskState(IntEnum):
     Finished = 3
 
 
+_BITS = [np.uint64(1 << i) for i in range(64)]
+
+
+class WorkerBitmap:
+    """
+    Compact (rows x workers) boolean matrix
+
+    Each row is stored as ceil(workers / 64) words of uint64.
+    """
+
+    __slots__ = ("bits",)
+
+    def __init__(self, rows, worker_count):
+        self.bits = np.zeros((rows, max(1, (worker_count + 63) // 64)), dtype=np.uint64)
+
+    def add(self, row, worker_id):
+        self.bits[row, worker_id >> 6] |= _BITS[worker_id & 63]
+
+    def remove(self, row, worker_id):
+        self.bits[row, worker_id >> 6] &= ~_BITS[worker_id & 63]
+
+    def contains(self, row, worker_id):
+        return bool(self.bits[row, worker_id >> 6] & _BITS[worker_id & 63])
+
+    def any(self, row):
+        return bool(self.bits[row].any())
+
+    def clear(self, row):
+        self.bits[row] = 0
+
+    def resize(self, rows):
+        bits = np.zeros((rows, self.bits.shape[1]), dtype=np.uint64)
+        count = min(rows, len(self.bits))
+        bits[:count] = self.bits[:count]
+        self.bits = bits
+
+    def ids(self, row):
+        result = []
+        for i, word in enumerate(self.bits[row].tolist()):
+            while word:
+                low = word & -word
+                result.append(i * 64 + low.bit_length() - 1)
+                word ^= low
+        return result
+
+    def count(self, row):
+        return sum(bin(word).count("1") for word in self.bits[row].tolist())
+
+
+def _resize(array, size, fill):
+    result = np.full(size, fill, dtype=array.dtype)
+    result[:len(array)] = array
+    return result
+
+
 class TaskRuntimeInfo:
+    """
+    Lightweight view of a task in RuntimeState
+    """
+
+    __slots__ = ("runtime_state", "index")
+
+    def __init__(self, runtime_state, index):
+        self.runtime_state = runtime_state
+        self.index = index
+
+    @property
+    def state(self):
+        return TaskState(self.runtime_state.states[self.index])
 
-    __slots__ = ("state",
-                 "assign_time",
-                 "end_time",
-                 "assigned_workers",
-                 "running_at_workers",
-                 "unfinished_inputs")
-
-    def __init__(self, task):
-        self.state = TaskState.Waiting
-        self.assign_time = None
-        self.end_time = None
-        self.assigned_workers = []
-        self.running_at_workers = []
-        self.unfinished_inputs = len(task.inputs)
+    @state.setter
+    def state(self, value):
+        self.runtime_state.states[self.index] = value
+
+    @property
+    def end_time(self):
+        value = self.runtime_state.end_times[self.index]
+        return None if np.isnan(value) else float(value)
+
+    @end_time.setter
+    def end_time(self, value):
+        self.runtime_state.end_times[self.index] = np.nan if value is None else value
+
+    @property
+    def unfinished_inputs(self):
+        return int(self.runtime_state.unfinished_inputs[self.index])
+
+    @unfinished_inputs.setter
+    def unfinished_inputs(self, value):
+        self.runtime_state.unfinished_inputs[self.index] = value
+
+    @property
+    def assigned_workers(self):
+        return self.runtime_state.get_workers(self.runtime_state.assigned, self.index)
+
+    @property
+    def running_at_workers(self):
+        return self.runtime_state.get_workers(self.runtime_state.running, self.index)
 
     @property
     def is_running(self):
-        return self.state == TaskState.Running
+        return self.runtime_state.running.any(self.index)
 
     @property
     def is_ready(self):
-        return self.unfinished_inputs == 0
+        return self.runtime_state.unfinished_inputs[self.index] == 0
 
     @property
     def is_finished(self):
-        return self.state == TaskState.Finished
+        return self.runtime_state.states[self.index] == TaskState.Finished
 
     @property
     def is_waiting(self):
-        return self.state == TaskState.Waiting
+        return self.runtime_state.states[self.index] == TaskState.Waiting
 
 
 class ObjectRuntimeInfo:
+    """
+    Lightweight view of a data object in RuntimeState
+    """
 
-    __slots__ = ("placing", "availability")
+    __slots__ = ("runtime_state", "index")
 
-    def __init__(self, output):
-        self.placing = []
-        self.availability = []
+    def __init__(self, runtime_state, index):
+        self.runtime_state = runtime_state
+        self.index = index
 
+    @property
+    def placing(self):
+        return self.runtime_state.get_workers(self.runtime_state.placing, self.index)
 
-class RuntimeState:
+    @property
+    def availability(self):
+        return self.runtime_state.get_workers(self.runtime_state.availability, self.index)
 
-    def __init__(self, task_graph):
-        self.task_infos = {task.id: TaskRuntimeInfo(task)
-                           for task in task_graph.tasks.values()}
-        self.object_infos = {obj.id: ObjectRuntimeInfo(obj)
-                             for obj in task_graph.objects.values()}
+
+class RuntimeState:
+    """
+    Runtime state of tasks and objects in the simulator
+
+    The state is kept in NumPy arrays indexed by task/object ids, sets of
+    workers (assigned/running workers of tasks, placing and availability
+    of objects) are kept in WorkerBitmaps. Methods `task_info()` and
+    `object_info()` return lightweight views into these arrays.
+    """
+
+    def __init__(self, task_graph, workers):
+        self.workers = workers
+        worker_count = len(workers)
+
+        tasks = task_graph.tasks
+        task_count = max(tasks) + 1 if tasks else 0
+        self.states = np.full(task_count, TaskState.Waiting, dtype=np.int8)
+        self.end_times = np.full(task_count, np.nan)
+        self.unfinished_inputs = np.zeros(task_count, dtype=np.int32)
+        self.unfinished_inputs[np.fromiter(tasks.keys(), np.int64, len(tasks))] = \
+            np.fromiter((len(t.inputs) for t in tasks.values()), np.int32, len(tasks))
+        self.assigned = WorkerBitmap(task_count, worker_count)
+        self.running = WorkerBitmap(task_count, worker_count)
+
+        objects = task_graph.objects
+        object_count = max(objects) + 1 if objects else 0
+        self.placing = WorkerBitmap(object_count, worker_count)
+        self.availability = WorkerBitmap(object_count, worker_count)
+
+    def add_tasks(self, tasks):
+        """
+        Initializes rows of (new or reused) task ids, arrays grow when needed
+        """
+        if not tasks:
+            return
+        ids = np.fromiter((t.id for t in tasks), np.int64, len(tasks))
+        size = int(ids.max()) + 1
+        if size > len(self.states):
+            size = max(size, 2 * len(self.states))
+            self.states = _resize(self.states, size, TaskState.Waiting)
+            self.end_times = _resize(self.end_times, size, np.nan)
+            self.unfinished_inputs = _resize(self.unfinished_inputs, size, 0)
+            self.assigned.resize(size)
+            self.running.resize(size)
+        self.states[ids] = TaskState.Waiting
+        self.end_times[ids] = np.nan
+        self.unfinished_inputs[ids] = np.fromiter((len(t.inputs) for t in tasks),
+                                                  np.int32, len(tasks))
+        self.assigned.bits[ids] = 0
+        self.running.bits[ids] = 0
+
+    def add_objects(self, objects):
+        """
+        Initializes rows of (new or reused) object ids, arrays grow when needed
+        """
+        if not objects:
+            return
+        ids = np.fromiter((o.id for o in objects), np.int64, len(objects))
+        size = int(ids.max()) + 1
+        if size > len(self.placing.bits):
+            size = max(size, 2 * len(self.placing.bits))
+            self.placing.resize(size)
+            self.availability.resize(size)
+        self.placing.bits[ids] = 0
+        self.availability.bits[ids] = 0
+
+    def get_workers(self, bitmap, index):
+        workers = self.workers
+        return [workers[i] for i in bitmap.ids(index)]
 
     def task_info(self, task):
-        return self.task_infos[task.id]
+        return TaskRuntimeInfo(self, task.id)
 
     def object_info(self, output):
-        return self.object_infos[output.id]
+        return ObjectRuntimeInfo(self, output.id)
+
+    def task_state(self, task):
+        return self.states[task.id]
+
+    def set_task_state(self, task, state):
+        self.states[task.id] = state
+
+    def is_ready(self, task):
+        return self.unfinished_inputs[task.id] == 0
+
+    def assigned_workers(self, task):
+        return self.get_workers(self.assigned, task.id)
+
+    def is_placed(self, obj):
+        return self.placing.any(obj.id)
+
+    def first_placing(self, obj):
+        return self.workers[self.placing.ids(obj.id)[0]]
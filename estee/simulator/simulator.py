@@ -1,28 +1,176 @@
+import copy
 import logging
+from time import perf_counter, process_time
 
-from simpy import Environment, Event
+import numpy as np
+from simpy import Environment
+from simpy.events import PENDING
 
+from .engine import NativeEnvironment
+from .jobs import Job
+from .record import ScheduleRecord
 from .runtimeinfo import RuntimeState, TaskState
-from .trace import TaskAssignTraceEvent, TaskRetractTraceEvent, FetchEndTraceEvent
+from .statistics import SimulatorStatistics
+from .trace import TaskAssignTraceEvent, TaskCancelTraceEvent, TaskRetractTraceEvent, \
+    FetchEndTraceEvent
 
 logger = logging.getLogger(__name__)
 
 
 class TaskAssignment:
 
-    __slots__ = ("worker", "task", "priority", "block", "cancelled", "remaining_inputs_count")
+    __slots__ = ("worker", "task", "priority", "block", "duplicate", "cancelled",
+                 "remaining_inputs_count")
 
-    def __init__(self, worker, task, priority=0, block=0):
+    def __init__(self, worker, task, priority=0, block=0, duplicate=False):
         assert block <= priority
         self.worker = worker
         self.task = task
         self.priority = priority
         self.block = block
+        self.duplicate = duplicate
         self.cancelled = False
         self.remaining_inputs_count = None
 
 
+def _id_pairs(pairs):
+    array = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+    return array[:, 0], array[:, 1]
+
+
+class UpdateBatch:
+    """
+    Typed update sent to in-process schedulers instead of the "update" dictionary
+
+    New workers, tasks and objects are the simulator's own instances,
+    changes since the previous update are NumPy arrays of ids:
+
+        network_bandwidth, network_latency -- announced parameters of the network
+                                              (None if not changed)
+        finished_tasks, finished_workers -- tasks finished since the last update
+        started_tasks, started_workers -- tasks that started and are still running
+                                          (only with task_start_notification)
+        placed_objects, placed_workers, placed_sizes -- new placings of objects
+        available_objects, available_workers -- new availabilities of objects
+        evicted_objects, evicted_workers -- objects evicted from workers (removed
+                                            from placing and availability before
+                                            new placings and availabilities are added)
+        reassign_failed_tasks, reassign_failed_workers -- failed reassignments
+        cancelled_tasks, cancelled_workers -- copies of duplicated tasks cancelled
+                                              because another copy finished first
+        retired_tasks, retired_objects -- ids of tasks and objects of finished jobs
+                                          removed from the simulation (the ids
+                                          may be reused by later jobs)
+    """
+
+    __slots__ = ("new_workers", "network_bandwidth", "network_latency", "new_objects", "new_tasks",
+                 "finished_tasks", "finished_workers", "started_tasks", "started_workers",
+                 "placed_objects", "placed_workers", "placed_sizes",
+                 "available_objects", "available_workers",
+                 "evicted_objects", "evicted_workers",
+                 "reassign_failed_tasks", "reassign_failed_workers",
+                 "cancelled_tasks", "cancelled_workers",
+                 "retired_tasks", "retired_objects")
+
+    def __init__(self, new_workers=(), network_bandwidth=None, new_objects=(), new_tasks=(),
+                 finished=(), started=(), placed=(), available=(), reassign_failed=(),
+                 retired_tasks=(), retired_objects=(), evicted=(), cancelled=(),
+                 network_latency=None):
+        self.new_workers = new_workers
+        self.network_bandwidth = network_bandwidth
+        self.network_latency = network_latency
+        self.new_objects = new_objects
+        self.new_tasks = new_tasks
+        self.finished_tasks, self.finished_workers = _id_pairs(finished)
+        self.started_tasks, self.started_workers = _id_pairs(started)
+        self.placed_objects, self.placed_workers = _id_pairs([(o.id, w.id) for o, w in placed])
+        self.placed_sizes = np.array([o.size for o, w in placed], dtype=np.float64)
+        self.available_objects, self.available_workers = _id_pairs(
+            [(o.id, w.id) for o, w in available])
+        self.evicted_objects, self.evicted_workers = _id_pairs(
+            [(o.id, w.id) for o, w in evicted])
+        self.reassign_failed_tasks, self.reassign_failed_workers = _id_pairs(reassign_failed)
+        self.cancelled_tasks, self.cancelled_workers = _id_pairs(
+            [(t.id, w.id) for t, w in cancelled])
+        self.retired_tasks = np.array(retired_tasks, dtype=np.int64)
+        self.retired_objects = np.array(retired_objects, dtype=np.int64)
+
+
+class RunResult:
+    """
+    Result of Simulator.run_bounded()
+
+        completed - True if all tasks were finished
+        time - simulated time reached (the makespan if completed)
+        tasks_finished - number of finished tasks
+        bytes_transferred - total size of finished downloads
+    """
+
+    __slots__ = ("completed", "time", "tasks_finished", "bytes_transferred")
+
+    def __init__(self, completed, time, tasks_finished, bytes_transferred):
+        self.completed = completed
+        self.time = time
+        self.tasks_finished = tasks_finished
+        self.bytes_transferred = bytes_transferred
+
+    @property
+    def makespan(self):
+        return self.time if self.completed else None
+
+    def __repr__(self):
+        return "<RunResult completed={} time={} tasks_finished={} bytes_transferred={}>".format(
+            self.completed, self.time, self.tasks_finished, self.bytes_transferred)
+
+
+class SimulatorSnapshot:
+    """
+    Frozen state of a simulation created by Simulator.snapshot()
+
+    Method fork() creates independent simulators continuing from this state,
+    each fork is a full copy of the state (see Simulator.fork()).
+    """
+
+    def __init__(self, simulator):
+        self._simulator = simulator
+
+    @property
+    def now(self):
+        return self._simulator.env.now
+
+    def fork(self):
+        return self._simulator.fork()
+
+
 class Simulator:
+    """
+        scheduling_time - simulated time charged after each scheduler invocation
+                          before its schedule is applied; "measured" charges
+                          the CPU time (time.process_time) of
+                          scheduler.send_message multiplied by
+                          scheduling_time_scale, so that it does not depend
+                          on the load of the machine
+        engine - "simpy" (default) runs the simulation in simpy.Environment,
+                 "native" uses a lightweight heap-based NativeEnvironment.
+                 Both engines produce the same results.
+        coalesce_updates - if True, all events of the current time are processed
+                           before an update is sent to the scheduler, so tasks
+                           finished at the same time are reported at once.
+        record_schedule - if True, assignments returned by the scheduler are
+                          recorded into `schedule_record` (ScheduleRecord)
+
+    Counters of the simulation (SimulatorStatistics) are always gathered
+    in `statistics`.
+
+    Besides `task_graph`, independent jobs may be submitted into the simulation
+    by submit() and submit_stream(). Tasks and objects of finished jobs are
+    retired (removed from the simulator and the scheduler), so memory stays
+    bounded for long streams of jobs. When the first job arrives, `task_graph`
+    is replaced by a new graph with the same tasks, so the given graph is not
+    modified. Jobs are accepted only by schedulers that register as
+    "incremental", i.e. schedulers that can handle tasks arriving during
+    the simulation.
+    """
 
     def __init__(self,
                  task_graph,
@@ -31,22 +179,33 @@ class Simulator:
                  netmodel,
                  min_scheduling_interval=None,
                  scheduling_time=None,
-                 trace=False):
+                 trace=False,
+                 engine="simpy",
+                 coalesce_updates=False,
+                 record_schedule=False,
+                 scheduling_time_scale=1.0):
         self.workers = workers
         self.task_graph = task_graph
         self.netmodel = netmodel
         self.scheduler = scheduler
-        self.new_finished = []
         self.wakeup_event = None
         self.env = None
         self.min_scheduling_interval = min_scheduling_interval
+        if isinstance(scheduling_time, str) and scheduling_time != "measured":
+            raise Exception("Invalid scheduling time '{}'".format(scheduling_time))
         self.scheduling_time = scheduling_time
+        self.scheduling_time_scale = scheduling_time_scale
+        self.coalesce_updates = coalesce_updates
+        self.schedule_record = ScheduleRecord() if record_schedule else None
+        self.statistics = SimulatorStatistics()
         self.reassign_allowed = False
         self.task_start_notification = False
+        self.batch_updates = False
+        self.incremental = False
 
         if trace:
             self.trace_events = []
-            netmodel.set_event_listener(lambda e: self.trace_events.append(e))
+            netmodel.set_event_listener(self.add_trace_event)
         else:
             self.trace_events = None
 
@@ -57,11 +216,38 @@ class Simulator:
         self.tasks_updated = set()
         self.objects_updated = set()
         self.reassign_failed = set()
+        self.cancelled_duplicates = []
         self.new_workers = []
         self.new_tasks = []
         self.new_objects = []
+        self.new_placing = []
+        self.new_availability = []
+        self.new_evictions = []
         self.update_bandwidth = True
-        self.env = Environment()
+        self.done_event = None
+        self.tasks_submitted = False
+        self.master_waits = 0
+
+        # Submitted jobs
+        self.pending_jobs = 0  # scheduled arrivals and unfinished streams
+        self.job_count = 0
+        self.task_jobs = {}
+        self.completed_jobs = []  # finished since the last update
+        self.retirable_jobs = []  # finished and reported to the scheduler
+        self.retired_tasks = []
+        self.retired_objects = []
+        self.free_task_ids = []
+        self.free_object_ids = []
+        self.next_task_id = None
+        self.next_object_id = None
+
+        if engine == "simpy":
+            self.env = Environment()
+        elif engine == "native":
+            self.env = NativeEnvironment()
+        else:
+            raise Exception("Unknown simulation engine '{}'".format(engine))
+        self.engine = engine
 
     def add_trace_event(self, trace_event):
         if self.trace_events is not None:
@@ -74,24 +260,58 @@ class Simulator:
             worker = self.workers[worker]
         priority = obj.get("priority", 0)
         blocking = obj.get("blocking", 0)
-        return TaskAssignment(worker, task, priority, blocking)
+        return TaskAssignment(worker, task, priority, blocking, obj.get("duplicate", False))
+
+    def fetch_finished(self, worker, download):
+        data_object = download.output
+        self.runtime_state.availability.add(data_object.id, worker.id)
+        self.objects_updated.add(data_object)
+        size = data_object.size
+        worker.statistics.bytes_received += size
+        worker.statistics.downloads += 1
+        part_size = download.part_size
+        for source_worker in download.sources:
+            source_worker.statistics.bytes_sent += part_size
+            source_worker.statistics.uploads += 1
+            self.add_trace_event(
+                FetchEndTraceEvent(self.env.now, worker, source_worker, data_object))
+        if self.batch_updates:
+            self.new_availability.append((data_object, worker))
+        if not self.wakeup_event.triggered:
+            self.wakeup_event.succeed()
 
-    def fetch_finished(self, worker, source_worker, data_object):
-        self.runtime_state.object_info(data_object).availability.append(worker)
+    def on_data_evicted(self, worker, data_object):
+        runtime_state = self.runtime_state
+        runtime_state.placing.remove(data_object.id, worker.id)
+        runtime_state.availability.remove(data_object.id, worker.id)
         self.objects_updated.add(data_object)
+        if self.batch_updates:
+            pair = (data_object, worker)
+            if pair in self.new_availability:
+                # The scheduler was not informed about the object on the worker yet
+                self.new_availability.remove(pair)
+                if pair in self.new_placing:
+                    self.new_placing.remove(pair)
+            else:
+                self.new_evictions.append(pair)
         if not self.wakeup_event.triggered:
             self.wakeup_event.succeed()
-        self.add_trace_event(
-            FetchEndTraceEvent(self.env.now, worker, source_worker, data_object))
 
-    def try_retract_assigned_task(self, task, info):
-        for w in info.assigned_workers[:]:
+    def has_unfinished_consumers(self, data_object):
+        states = self.runtime_state.states
+        return any(states[t.id] != TaskState.Finished for t in data_object.consumers)
+
+    def try_retract_assigned_task(self, task):
+        runtime_state = self.runtime_state
+        if runtime_state.running.any(task.id):
+            return False
+        for w in runtime_state.assigned_workers(task):
             if not w.try_retract_task(task):
                 return False
             self.add_trace_event(TaskRetractTraceEvent(
                 self.env.now, w, task))
-            info.assigned_workers.remove(w)
-        info.state = TaskState.Waiting
+            runtime_state.assigned.remove(task.id, w.id)
+        runtime_state.set_task_state(task, TaskState.Waiting)
         return True
 
     def apply_schedule(self, schedule):
@@ -100,33 +320,48 @@ class Simulator:
         for obj in schedule:
             # TODO: Filter invalid assignemnts
             assignments.append(self.read_assignment(obj))
-        assignments.sort(key=lambda a: a.priority, reverse=True)
+        # Duplicates are applied after (re)assignments of the same tasks
+        assignments.sort(key=lambda a: (not a.duplicate, a.priority), reverse=True)
+        runtime_state = self.runtime_state
         for assignment in assignments:
-            info = self.runtime_state.task_info(assignment.task)
-            if info.state == TaskState.Finished:
+            task = assignment.task
+            state = runtime_state.task_state(task)
+            if state == TaskState.Finished:
+                if assignment.duplicate and assignment.worker is not None:
+                    # The task finished while the scheduler was deciding (scheduling_time),
+                    # the copy is dropped and reported as cancelled
+                    logger.info("Dropping duplicate of finished task (%s, %s)",
+                                assignment.task, assignment.worker)
+                    self.cancelled_duplicates.append((task, assignment.worker))
+                    continue
                 raise Exception("Scheduler tries to assign a finished task ({})"
                                 .format(assignment.task))
-            if info.state == TaskState.Assigned:
-                if assignment.worker in info.assigned_workers:
+            if assignment.duplicate and assignment.worker is None:
+                raise Exception("Scheduler duplicates task ({}) without a worker"
+                                .format(assignment.task))
+            if state == TaskState.Assigned:
+                if (assignment.worker is not None and
+                        runtime_state.assigned.contains(task.id, assignment.worker.id)):
                     logging.info("Reassigning without effect (%s, %s)",
                                  assignment.task, assignment.worker)
                     continue
-                if not self.reassign_allowed:
-                    raise Exception("Scheduler reassigns already assigned task ({})"
-                                    .format(assignment.task))
-                if not self.try_retract_assigned_task(assignment.task, info):
-                    self.reassign_failed.add(assignment.task)
-                    if not self.wakeup_event.triggered:
-                        self.wakeup_event.succeed()
-                    continue
+                if not assignment.duplicate:
+                    if not self.reassign_allowed:
+                        raise Exception("Scheduler reassigns already assigned task ({})"
+                                        .format(assignment.task))
+                    if not self.try_retract_assigned_task(assignment.task):
+                        self.reassign_failed.add(assignment.task)
+                        if not self.wakeup_event.triggered:
+                            self.wakeup_event.succeed()
+                        continue
 
             self.add_trace_event(TaskAssignTraceEvent(
                 self.env.now, assignment.worker, assignment.task))
 
             if assignment.worker is None:
                 continue
-            info.state = TaskState.Assigned
-            info.assigned_workers.append(assignment.worker)
+            runtime_state.set_task_state(task, TaskState.Assigned)
+            runtime_state.assigned.add(task.id, assignment.worker.id)
             worker = assignment.worker
             lst = worker_loads.get(worker)
             if lst is None:
@@ -137,29 +372,97 @@ class Simulator:
             worker.assign_tasks(worker_loads[worker])
 
     def send_update(self):
+        statistics = self.statistics
+        if self.retirable_jobs:
+            self._retire_jobs()
+        if self.batch_updates:
+            message = {"type": "update_batch", "batch": self.make_update_batch()}
+        else:
+            message = self.make_update_message()
+        if self.completed_jobs:
+            self.retirable_jobs += self.completed_jobs
+            self.completed_jobs = []
+        logger.debug("Sending update %s", message)
+        start = perf_counter()
+        cpu_start = process_time()
+        schedule = self.scheduler.send_message(message)
+        statistics.add_scheduler_invocation(self.env.now, perf_counter() - start,
+                                            process_time() - cpu_start)
+        logger.debug("Scheduler result %s", schedule)
+        if self.schedule_record is not None and schedule:
+            self.schedule_record.add(self.env.now, statistics.tasks_finished, schedule)
+        return schedule
+
+    def make_update_batch(self):
+        runtime_state = self.runtime_state
+        finished = []
+        started = []
+        for task in self.tasks_updated:
+            if runtime_state.task_state(task) == TaskState.Finished:
+                finished.append((task.id, runtime_state.assigned.ids(task.id)[0]))
+            elif runtime_state.running.any(task.id):
+                started.append((task.id, runtime_state.running.ids(task.id)[0]))
+        self.tasks_updated.clear()
+        self.objects_updated.clear()
+
+        batch = UpdateBatch(
+            self.new_workers,
+            self.netmodel.bandwidth if self.update_bandwidth else None,
+            self.new_objects,
+            self.new_tasks,
+            finished,
+            started,
+            self.new_placing,
+            self.new_availability,
+            [(t.id, runtime_state.assigned.ids(t.id)[0]) for t in self.reassign_failed],
+            self.retired_tasks,
+            self.retired_objects,
+            self.new_evictions,
+            self.cancelled_duplicates,
+            self.netmodel.latency if self.update_bandwidth else None)
+
+        self.new_workers = []
+        self.update_bandwidth = False
+        self.new_objects = []
+        self.new_tasks = []
+        self.new_placing = []
+        self.new_availability = []
+        self.new_evictions = []
+        self.cancelled_duplicates = []
+        self.reassign_failed = set()
+        self.retired_tasks = []
+        self.retired_objects = []
+        return batch
+
+    def make_update_message(self):
         runtime_state = self.runtime_state
 
         def make_task_update(task):
-            info = runtime_state.task_info(task)
-            assert len(info.assigned_workers) == 1
-            # The following code has to be updated
-            # when we allow duplication of tasks
-            return {
+            assigned_workers = runtime_state.assigned.ids(task.id)
+            running_workers = runtime_state.running.ids(task.id)
+            if running_workers:
+                worker = running_workers[0]
+                assigned_workers.remove(worker)
+            else:
+                worker = assigned_workers.pop(0)
+            result = {
                 "id": task.id,
-                "state": info.state,
-                "worker": info.assigned_workers[0].id,
-                "running": bool(info.running_at_workers)
+                "state": TaskState(runtime_state.task_state(task)),
+                "worker": worker,
+                "running": bool(running_workers)
             }
+            if assigned_workers:
+                result["duplicates"] = assigned_workers
+            return result
 
         def make_object_update(obj):
-            info = runtime_state.object_info(obj)
-            placing = info.placing
+            placing = runtime_state.placing.ids(obj.id)
             result = {
               "id": obj.id,
-              "placing": [w.id for w in placing],
-              "availability": [w.id for w in info.availability]
+              "placing": placing,
+              "availability": runtime_state.availability.ids(obj.id)
             }
-            if info.placing or runtime_state.task_info(obj.parent).state == TaskState.Finished:
+            if placing or runtime_state.task_state(obj.parent) == TaskState.Finished:
                 result["size"] = obj.size
             return result
 
@@ -178,6 +481,7 @@ class Simulator:
 
         if self.update_bandwidth:
             message["network_bandwidth"] = self.netmodel.bandwidth
+            message["network_latency"] = self.netmodel.latency
             self.update_bandwidth = False
 
         if self.new_tasks:
@@ -191,21 +495,25 @@ class Simulator:
         if self.reassign_failed:
             message["reassign_failed"] = [
                 {"id": t.id,
-                 "assigned_workers": [w.id for w in runtime_state.task_info(t).assigned_workers]}
+                 "assigned_workers": runtime_state.assigned.ids(t.id)}
                 for t in self.reassign_failed
             ]
             self.reassign_failed = set()
 
-        logger.debug("Sending update %s", message)
-        schedule = self.scheduler.send_message(message)
-        logger.debug("Scheduler result %s", schedule)
-        return schedule
+        if self.cancelled_duplicates:
+            message["cancelled_duplicates"] = [
+                {"id": t.id, "worker": w.id} for t, w in self.cancelled_duplicates
+            ]
+            self.cancelled_duplicates = []
 
-    def _master_process(self, env):
-        min_scheduling_interval = self.min_scheduling_interval
-        scheduling_time = self.scheduling_time
-        timeout = self.env.timeout
+        if self.retired_tasks or self.retired_objects:
+            message["retired_tasks"] = self.retired_tasks
+            message["retired_objects"] = self.retired_objects
+            self.retired_tasks = []
+            self.retired_objects = []
+        return message
 
+    def _master_start(self):
         # We are here intentionally separate registering workers
         # and task submit, as it is usually separated in real-word
         # reactors.
@@ -214,31 +522,67 @@ class Simulator:
         schedule = self.send_update()
         assert not schedule
 
+    def _master_submit(self):
+        self.tasks_submitted = True
         self.new_tasks += list(self.task_graph.tasks.values())
         self.new_objects += list(self.task_graph.objects.values())
 
-        schedule = self.send_update()
+        self._master_schedule(self.send_update())
+
+    def _master_schedule(self, schedule):
+        scheduling_time = self.scheduling_time
+        if scheduling_time == "measured":
+            scheduling_time = (self.statistics.scheduler_cpu_times[-1] *
+                               self.scheduling_time_scale)
         if scheduling_time:
-            yield timeout(scheduling_time)
+            self.env.timeout(scheduling_time, schedule).callbacks.append(
+                self._master_schedule_ready)
+        else:
+            self._master_apply(schedule)
+
+    def _master_schedule_ready(self, event):
+        self._master_apply(event.value)
+
+    def _master_apply(self, schedule):
         if schedule:
             self.apply_schedule(schedule)
 
-        while self.unprocessed_tasks > 0:
-            self.wakeup_event = Event(env)
-            if min_scheduling_interval:
-                yield self.wakeup_event & timeout(min_scheduling_interval)
+        if self.unprocessed_tasks <= 0 and not self.pending_jobs:
+            self.done_event.succeed(self.env.now)
+            return
+
+        self.wakeup_event = self.env.event()
+        self.wakeup_event.callbacks.append(self._master_wakeup)
+        # Changes made during scheduling time could not trigger
+        # the previous (already processed) wakeup event
+        if self.tasks_updated or self.objects_updated or self.new_tasks:
+            self.wakeup_event.succeed()
+        if self.min_scheduling_interval:
+            self.master_waits = 2
+            self.env.timeout(self.min_scheduling_interval).callbacks.append(
+                self._master_wakeup)
+        else:
+            self.master_waits = 1
+
+    def _master_wakeup(self, event):
+        self.master_waits -= 1
+        if self.master_waits == 0:
+            if self.coalesce_updates:
+                self._master_coalesce(event)
             else:
-                yield self.wakeup_event
+                self._master_schedule(self.send_update())
 
-            schedule = self.send_update()
-            if scheduling_time:
-                yield timeout(scheduling_time)
-            if schedule:
-                self.apply_schedule(schedule)
+    def _master_coalesce(self, event):
+        # Postpone the update behind all events of the current time
+        env = self.env
+        if env.peek() <= env.now:
+            env.timeout(0).callbacks.append(self._master_coalesce)
+        else:
+            self._master_schedule(self.send_update())
 
     def on_task_start(self, worker, task):
         logger.debug("Task %s started on %s", task, worker)
-        self.runtime_state.task_info(task).running_at_workers.append(worker)
+        self.runtime_state.running.add(task.id, worker.id)
         if self.task_start_notification:
             self.tasks_updated.add(task)
             if not self.wakeup_event.triggered:
@@ -247,38 +591,45 @@ class Simulator:
     def on_task_finished(self, worker, task):
         logger.debug("Task %s finished on %s", task, worker)
         runtime_state = self.runtime_state
-        info = runtime_state.task_info(task)
-        assert info.state == TaskState.Assigned
-        assert worker in info.assigned_workers
-        info.running_at_workers.remove(worker)
-        info.state = TaskState.Finished
-        info.end_time = self.env.now
-        self.new_finished.append(task)
+        assert runtime_state.task_state(task) == TaskState.Assigned
+        assert runtime_state.assigned.contains(task.id, worker.id)
+        runtime_state.running.remove(task.id, worker.id)
+        runtime_state.set_task_state(task, TaskState.Finished)
+        runtime_state.end_times[task.id] = self.env.now
         self.unprocessed_tasks -= 1
+        self.statistics.tasks_finished += 1
+        if runtime_state.assigned.count(task.id) > 1:
+            self._cancel_duplicates(task, worker)
+        if self.task_jobs:
+            job = self.task_jobs.get(task)
+            if job is not None:
+                job.unfinished_tasks -= 1
+                if job.unfinished_tasks == 0:
+                    self._job_finished(job)
 
         worker_updates = {}
 
         self.tasks_updated.add(task)
         objects_updated = self.objects_updated
+        unfinished_inputs = runtime_state.unfinished_inputs
 
         for o in task.outputs:
-            o_info = runtime_state.object_info(o)
-            o_info.placing.append(worker)
-            o_info.availability.append(worker)
+            runtime_state.placing.add(o.id, worker.id)
+            runtime_state.availability.add(o.id, worker.id)
             objects_updated.add(o)
+            if self.batch_updates:
+                self.new_placing.append((o, worker))
+                self.new_availability.append((o, worker))
             tasks = o.consumers
             for t in tasks:
-                t_info = runtime_state.task_info(t)
-                t_info.unfinished_inputs -= 1
-                if t_info.unfinished_inputs <= 0:
-                    if t_info.unfinished_inputs < 0:
-                        raise Exception("Invalid number of unfinished inputs: {}, task {}".format(
-                            t_info.unfinished_inputs, t
-                        ))
-                    assert t_info.unfinished_inputs == 0
+                unfinished_inputs[t.id] -= 1
+                if unfinished_inputs[t.id] < 0:
+                    raise Exception("Invalid number of unfinished inputs: {}, task {}".format(
+                        unfinished_inputs[t.id], t
+                    ))
 
             for t in tasks:
-                for w in runtime_state.task_info(t).assigned_workers:
+                for w in runtime_state.assigned_workers(t):
                     updates = worker_updates.get(w)
                     if updates is None:
                         updates = []
@@ -290,40 +641,329 @@ class Simulator:
         if not self.wakeup_event.triggered:
             self.wakeup_event.succeed()
 
+    def _cancel_duplicates(self, task, worker):
+        runtime_state = self.runtime_state
+        now = self.env.now
+        for w in runtime_state.assigned_workers(task):
+            if w is worker:
+                continue
+            if w.cancel_task(task):
+                self.add_trace_event(TaskCancelTraceEvent(now, w, task))
+                runtime_state.running.remove(task.id, w.id)
+            else:
+                self.add_trace_event(TaskRetractTraceEvent(now, w, task))
+            runtime_state.assigned.remove(task.id, w.id)
+            self.cancelled_duplicates.append((task, w))
+
+    def submit(self, task_graph, time=None):
+        """
+        Submits a job (an independent task graph) arriving at the given simulated time
+
+        The job arrives immediately if time is None. Tasks and objects of the
+        job get new ids (possibly of retired tasks/objects) when it arrives,
+        the task graph should not be used after submission.
+        """
+        delay = 0 if time is None else time - self.env.now
+        self._check_arrival(delay)
+        self._check_incremental()
+        self.pending_jobs += 1
+        self.env.timeout(delay, task_graph).callbacks.append(self._job_arrived)
+
+    def submit_stream(self, jobs):
+        """
+        Submits an iterable of (arrival_time, task_graph) with non-decreasing times
+
+        The iterable is consumed lazily, i.e. the next job is taken when the
+        previous one arrives (see estee.simulator.poisson_arrivals).
+        """
+        self._check_incremental()
+        self.pending_jobs += 1
+        self._next_stream_job(iter(jobs))
+
+    def _check_arrival(self, delay):
+        if delay < 0:
+            raise Exception("Job arrival time {} is in the past".format(self.env.now + delay))
+        if self.done_event is not None and self.done_event.triggered:
+            raise Exception("Simulation is already finished")
+
+    def _check_incremental(self):
+        # The scheduler is registered when the simulation starts
+        if self.done_event is not None and not self.incremental:
+            raise Exception("Scheduler does not support jobs submitted into the simulation")
+
+    def _next_stream_job(self, jobs):
+        item = next(jobs, None)
+        if item is None:
+            self.pending_jobs -= 1
+            if self.wakeup_event is not None and not self.wakeup_event.triggered:
+                self.wakeup_event.succeed()
+            return
+        time, task_graph = item
+        delay = time - self.env.now
+        self._check_arrival(delay)
+        self.env.timeout(delay, (jobs, task_graph)).callbacks.append(self._stream_job_arrived)
+
+    def _job_arrived(self, event):
+        self.pending_jobs -= 1
+        self._add_job(event.value)
+
+    def _stream_job_arrived(self, event):
+        jobs, task_graph = event.value
+        self._add_job(task_graph)
+        self._next_stream_job(jobs)
+
+    def _add_job(self, task_graph):
+        if not self.job_count:
+            # Tasks of jobs are added to (and retired from) a copy of the initial graph
+            graph = self.task_graph
+            self.task_graph = graph.__class__(dict(graph.tasks), dict(graph.objects))
+
+        tasks = list(task_graph.tasks.values())
+        objects = list(task_graph.objects.values())
+
+        graph_tasks = self.task_graph.tasks
+        free_ids = self.free_task_ids
+        for task in tasks:
+            if free_ids:
+                task.id = free_ids.pop()
+            else:
+                task.id = self.next_task_id
+                self.next_task_id += 1
+            graph_tasks[task.id] = task
+
+        graph_objects = self.task_graph.objects
+        free_ids = self.free_object_ids
+        for obj in objects:
+            if free_ids:
+                obj.id = free_ids.pop()
+            else:
+                obj.id = self.next_object_id
+                self.next_object_id += 1
+            graph_objects[obj.id] = obj
+
+        self.runtime_state.add_tasks(tasks)
+        self.runtime_state.add_objects(objects)
+        self.unprocessed_tasks += len(tasks)
+        self.new_tasks += tasks
+        self.new_objects += objects
+
+        job = Job(self.job_count, tasks, objects, self.env.now)
+        self.job_count += 1
+        task_jobs = self.task_jobs
+        for task in tasks:
+            task_jobs[task] = job
+        if not tasks:
+            self._job_finished(job)
+        if self.wakeup_event is not None and not self.wakeup_event.triggered:
+            self.wakeup_event.succeed()
+
+    def _job_finished(self, job):
+        job.end_time = self.env.now
+        self.statistics.add_finished_job(job)
+        self.completed_jobs.append(job)
+
+    def _retire_jobs(self):
+        # Objects may be still downloaded by workers where
+        # a consumer was retracted, such jobs are retired later
+        downloading = set()
+        for worker in self.workers:
+            for download in worker.running_downloads:
+                downloading.add(download.output)
+        jobs = []
+        for job in self.retirable_jobs:
+            if downloading and any(obj in downloading for obj in job.objects):
+                jobs.append(job)
+            else:
+                self._retire_job(job)
+        self.retirable_jobs = jobs
+
+    def _retire_job(self, job):
+        runtime_state = self.runtime_state
+        workers = self.workers
+        graph_tasks = self.task_graph.tasks
+        graph_objects = self.task_graph.objects
+
+        for obj in job.objects:
+            # Objects with zero size are placed on workers of consumers without downloading
+            worker_ids = set(runtime_state.availability.ids(obj.id))
+            for task in obj.consumers:
+                worker_ids.update(runtime_state.assigned.ids(task.id))
+            for worker_id in worker_ids:
+                workers[worker_id].discard_data(obj)
+            self.objects_updated.discard(obj)
+            del graph_objects[obj.id]
+            self.retired_objects.append(obj.id)
+            self.free_object_ids.append(obj.id)
+
+        task_jobs = self.task_jobs
+        for task in job.tasks:
+            del graph_tasks[task.id]
+            del task_jobs[task]
+            self.retired_tasks.append(task.id)
+            self.free_task_ids.append(task.id)
+
     def start_scheduler(self):
         self.scheduler._simulator = self
         message = self.scheduler.start()
         if message.get("type") != "register":
             raise Exception("Invalid registeration message from scheduler")
         logger.info("Scheduler '%s', version '%s', reassigning: '%s', "
-                    "task_start_notification: '%s'",
+                    "task_start_notification: '%s', batch_updates: '%s'",
                     message.get("scheduler_name"),
                     message.get("scheduler_version"),
                     message.get("reassigning"),
-                    message.get("task_start_notification"))
+                    message.get("task_start_notification"),
+                    message.get("batch_updates"))
         self.reassign_allowed = bool(message.get("reassigning", False))
         self.task_start_notification = bool(message.get("task_start_notification", False))
+        self.batch_updates = bool(message.get("batch_updates", False))
+        self.incremental = bool(message.get("incremental", False))
+        if self.pending_jobs:
+            self._check_incremental()
+        if self.schedule_record is not None:
+            self.schedule_record.reassigning = self.reassign_allowed
+            self.schedule_record.task_start_notification = self.task_start_notification
 
     def stop_scheduler(self):
         self.scheduler.stop()
         self.scheduler._simulator = None
         logger.info("Scheduler stopped")
 
-    def run(self):
+    def _prepare(self):
+        """
+        Initializes the simulation and registers workers in the scheduler
+
+        Tasks are submitted by _start(), so a prepared simulator may be forked
+        into replicas that share the initialization (see run_replicas()).
+        """
         assert not self.trace_events
 
-        self.runtime_state = RuntimeState(self.task_graph)
+        self.runtime_state = RuntimeState(self.task_graph, self.workers)
         self.unprocessed_tasks = self.task_graph.task_count
+        tasks = self.task_graph.tasks
+        objects = self.task_graph.objects
+        self.next_task_id = max(tasks) + 1 if tasks else 0
+        self.next_object_id = max(objects) + 1 if objects else 0
 
         env = self.env
-        self.netmodel.init(self.env, self.workers)
+        self.netmodel.init(env, self.workers)
 
         for worker in self.workers:
-            env.process(worker.run(env, self, self.netmodel))
-
-        master_process = env.process(self._master_process(env))
+            worker.start(env, self, self.netmodel)
+        self.statistics = SimulatorStatistics(w.statistics for w in self.workers)
 
+        self.done_event = env.event()
         self.start_scheduler()
-        env.run(master_process)
+        self._master_start()
+
+    def _start(self):
+        if self.done_event is None:
+            self._prepare()
+        self._master_submit()
+
+    def run_until(self, time):
+        """
+        Processes events before the given simulated time
+
+        Returns True if all tasks are finished, the simulation may be
+        continued by run() or another run_until().
+        """
+        start = perf_counter()
+        if not self.tasks_submitted:
+            self._start()
+        env = self.env
+        done_event = self.done_event
+        while not done_event.processed and env.peek() < time:
+            env.step()
+        self._update_statistics(start)
+        return done_event.processed
+
+    def fork(self):
+        """
+        Returns an independent simulator that continues from the current state
+
+        Runtime state, workers, network model, scheduler and the event queue
+        are copied. The task graph and objects returned by
+        netmodel.shared_objects() are shared with the fork. It has to be called
+        between simulation steps (e.g. after run_until()).
+
+        The copy is not copy-on-write: each fork costs time and memory
+        proportional to the whole mutable state (O(tasks + objects + workers +
+        pending events), including the model of the graph kept by the
+        scheduler), so forking thousands of branches of a large simulation is
+        expensive. snapshot() pays this cost once, and each fork of the
+        snapshot pays it again.
+        """
+        if self.job_count or self.pending_jobs:
+            raise Exception("Simulation with submitted jobs cannot be forked")
+        # simpy marks untriggered events by PENDING sentinel, it must not be copied
+        memo = {id(self.task_graph): self.task_graph, id(PENDING): PENDING}
+        for task in self.task_graph.tasks.values():
+            memo[id(task)] = task
+        for obj in self.task_graph.objects.values():
+            memo[id(obj)] = obj
+        for obj in self.netmodel.shared_objects():
+            memo[id(obj)] = obj
+        return copy.deepcopy(self, memo)
+
+    def snapshot(self):
+        return SimulatorSnapshot(self.fork())
+
+    def _update_statistics(self, start):
+        self.statistics.wall_time += perf_counter() - start
+        self.statistics.update(self.env.now)
+        self.netmodel.update_statistics(self.statistics)
+
+    def run(self):
+        """
+        Runs the simulation until all tasks are finished and returns the makespan
+        """
+        start = perf_counter()
+        if not self.tasks_submitted:
+            self._start()
+        env = self.env
+        env.run(self.done_event)
+        self._update_statistics(start)
         self.stop_scheduler()
-        return env.now
\ No newline at end of file
+        return env.now
+
+    def run_bounded(self, deadline=None, max_time=None):
+        """
+        Runs the simulation until all tasks are finished or a bound is reached
+
+        The simulation is aborted as soon as the simulated time passes
+        deadline (absolute simulated time, e.g. the best makespan so far) or
+        max_time (simulated time relative to the current time). RunResult is
+        returned in both cases. The scheduler is stopped only when the
+        simulation is completed, so an aborted simulation may be continued by
+        run(), run_bounded() or run_until().
+        """
+        start = perf_counter()
+        if not self.tasks_submitted:
+            self._start()
+        env = self.env
+        done_event = self.done_event
+
+        bound = float("inf")
+        if deadline is not None:
+            bound = deadline
+        if max_time is not None:
+            bound = min(bound, env.now + max_time)
+
+        while not done_event.processed:
+            next_time = env.peek()
+            if next_time == float("inf"):
+                raise RuntimeError("No scheduled events left but the simulation "
+                                   "is not finished")
+            if next_time > bound:
+                break
+            env.step()
+        self._update_statistics(start)
+
+        completed = done_event.processed
+        if completed:
+            self.stop_scheduler()
+        return RunResult(completed,
+                         env.now if completed else bound,
+                         self.statistics.tasks_finished,
+                         self.statistics.bytes_transferred)
@@ -0,0 +1,168 @@
+from array import array
+from bisect import bisect_left
+
+import numpy as np
+
+
+class WorkerStatistics:
+    """
+    Counters of a single worker
+
+        busy_cpu_time - sum of cpus * running time of finished tasks
+        cancelled_cpu_time - cpu time of running copies of duplicated tasks that were
+                             cancelled because another copy finished first
+        idle_time - simulated time when no task was running on the worker
+        bytes_sent, bytes_received - total size of finished downloads
+        downloads - number of finished downloads (received by the worker)
+        uploads - number of finished downloads (or parts of striped downloads)
+                  sent by the worker
+        max_queue_depth - maximal number of unfinished tasks assigned to the worker
+        evictions, evicted_bytes - objects dropped from memory (see Worker.memory)
+        spilled_bytes, unspilled_bytes - total size of objects written to/read from disk
+        max_memory_usage - maximal size of objects in memory (after evictions)
+    """
+
+    __slots__ = ("busy_cpu_time", "cancelled_cpu_time", "idle_time", "idle_since",
+                 "bytes_sent", "bytes_received", "downloads", "uploads", "max_queue_depth",
+                 "evictions", "evicted_bytes", "spilled_bytes", "unspilled_bytes",
+                 "max_memory_usage")
+
+    def __init__(self):
+        self.busy_cpu_time = 0
+        self.cancelled_cpu_time = 0
+        self.idle_time = 0
+        self.idle_since = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.downloads = 0
+        self.uploads = 0
+        self.max_queue_depth = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self.spilled_bytes = 0
+        self.unspilled_bytes = 0
+        self.max_memory_usage = 0
+
+    def update_idle_time(self, now):
+        if self.idle_since is not None:
+            self.idle_time += now - self.idle_since
+            self.idle_since = now
+
+
+class SimulatorStatistics:
+    """
+    Cheap statistics of a simulation gathered by counters
+
+        workers - list of WorkerStatistics (indexed by worker id)
+        time - simulated time reached
+        scheduler_invocations - number of updates sent to the scheduler
+        scheduler_wall_time - wall-clock time spent in scheduler.send_message
+        scheduler_times - simulated time of each scheduler invocation
+        scheduler_durations - wall-clock time of each scheduler invocation
+        scheduler_cpu_times - CPU time (time.process_time) of each scheduler invocation
+        wall_time - wall-clock time spent in Simulator.run/run_until
+        tasks_finished - number of finished tasks
+        job_end_times, job_latencies - end time and latency (end time - arrival time)
+                                       of each finished job (see Simulator.submit)
+        flow_cache_hits, flow_cache_misses - lookups of cached flows of the network model
+                                             (see MaxMinFlowNetModel.CACHE_SIZE)
+
+    Per-invocation and per-job values are stored in compact arrays of doubles.
+    """
+
+    __slots__ = ("workers", "time", "scheduler_invocations", "scheduler_wall_time",
+                 "scheduler_times", "scheduler_durations", "scheduler_cpu_times", "wall_time",
+                 "tasks_finished", "job_end_times", "job_latencies", "flow_cache_hits",
+                 "flow_cache_misses")
+
+    def __init__(self, workers=()):
+        self.workers = list(workers)
+        self.time = 0
+        self.scheduler_invocations = 0
+        self.scheduler_wall_time = 0
+        self.scheduler_times = array("d")
+        self.scheduler_durations = array("d")
+        self.scheduler_cpu_times = array("d")
+        self.wall_time = 0
+        self.tasks_finished = 0
+        self.job_end_times = array("d")
+        self.job_latencies = array("d")
+        self.flow_cache_hits = 0
+        self.flow_cache_misses = 0
+
+    def add_scheduler_invocation(self, now, duration, cpu_time):
+        self.scheduler_invocations += 1
+        self.scheduler_wall_time += duration
+        self.scheduler_times.append(now)
+        self.scheduler_durations.append(duration)
+        self.scheduler_cpu_times.append(cpu_time)
+
+    def add_finished_job(self, job):
+        self.job_end_times.append(job.end_time)
+        self.job_latencies.append(job.latency)
+
+    @property
+    def flow_cache_hit_rate(self):
+        lookups = self.flow_cache_hits + self.flow_cache_misses
+        if not lookups:
+            return None
+        return self.flow_cache_hits / lookups
+
+    @property
+    def jobs_finished(self):
+        return len(self.job_end_times)
+
+    def job_latency_percentiles(self, percentiles=(50, 90, 99)):
+        if not self.job_latencies:
+            return None
+        return np.percentile(self.job_latencies, percentiles)
+
+    def job_throughput(self, since=0):
+        """
+        Returns the number of jobs finished per unit of simulated time after `since`
+
+        A warm-up period of a stream of jobs may be skipped by `since`.
+        """
+        if self.time <= since:
+            return 0
+        finished = len(self.job_end_times) - bisect_left(self.job_end_times, since)
+        return finished / (self.time - since)
+
+    def update(self, now):
+        self.time = now
+        for worker in self.workers:
+            worker.update_idle_time(now)
+
+    @property
+    def simulation_wall_time(self):
+        return self.wall_time - self.scheduler_wall_time
+
+    @property
+    def bytes_transferred(self):
+        return sum(w.bytes_received for w in self.workers)
+
+    @property
+    def downloads(self):
+        return sum(w.downloads for w in self.workers)
+
+    def upload_fairness(self):
+        """
+        Returns Jain's fairness index of bytes sent by workers (None if nothing was sent)
+
+        The index is 1 when all workers sent the same amount of data and 1/n
+        when all data was sent by a single worker out of n.
+        """
+        sent = [w.bytes_sent for w in self.workers]
+        total = sum(sent)
+        if not total:
+            return None
+        return total * total / (len(sent) * sum(x * x for x in sent))
+
+    @property
+    def busy_cpu_time(self):
+        return sum(w.busy_cpu_time for w in self.workers)
+
+    def __repr__(self):
+        return ("<SimulatorStatistics time={} scheduler_invocations={} "
+                "scheduler_wall_time={:.3f} wall_time={:.3f}>").format(
+            self.time, self.scheduler_invocations, self.scheduler_wall_time, self.wall_time)
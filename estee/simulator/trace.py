@@ -6,6 +6,8 @@ TaskAssignTraceEvent = collections.namedtuple("TaskAssign", ["time", "worker", "
 TaskRetractTraceEvent = collections.namedtuple("TaskRetract", ["time", "worker", "task"])
 TaskStartTraceEvent = collections.namedtuple("TaskStart", ["time", "worker", "task"])
 TaskEndTraceEvent = collections.namedtuple("TaskEnd", ["time", "worker", "task"])
+# A running copy of a duplicated task cancelled because another copy finished first
+TaskCancelTraceEvent = collections.namedtuple("TaskCancel", ["time", "worker", "task"])
 
 FetchStartTraceEvent = collections.namedtuple(
     "FetchStart", ["time", "target_worker", "source_worker", "output"])
@@ -13,6 +15,10 @@ FetchStartTraceEvent = collections.namedtuple(
 FetchEndTraceEvent = collections.namedtuple(
     "FetchEnd", ["time", "target_worker", "source_worker", "output"])
 
+ObjectEvictTraceEvent = collections.namedtuple("ObjectEvict", ["time", "worker", "output"])
+ObjectSpillTraceEvent = collections.namedtuple("ObjectSpill", ["time", "worker", "output"])
+ObjectUnspillTraceEvent = collections.namedtuple("ObjectUnspill", ["time", "worker", "output"])
+
 NetModelFlowEvent = collections.namedtuple(
     "NetModelFlow", ["time", "source_worker", "target_worker", "value"])
 
@@ -62,13 +68,14 @@ def build_task_locations(trace_events, worker):
     def map_end(start_event, end_event):
         event, slot = start_event
         slots.remove(slot)
-        return (event.task,
-                (event.time, event.time + event.task.duration, slot[0], slot[1]))
+        end = end_event.time
+        return (event.task, (event.time, end, slot[0], slot[1]))
 
     yield from merge_trace_events(
         trace_events,
         lambda t: isinstance(t, TaskStartTraceEvent) and t.worker == worker,
-        lambda t: isinstance(t, TaskEndTraceEvent) and t.worker == worker,
+        lambda t: (isinstance(t, (TaskEndTraceEvent, TaskCancelTraceEvent)) and
+                   t.worker == worker),
         lambda e: e.task,
         map_start,
         map_end
@@ -99,7 +106,8 @@ def build_worker_usage(trace_events, worker):
     list(merge_trace_events(
         trace_events,
         lambda t: isinstance(t, TaskStartTraceEvent) and t.worker == worker,
-        lambda t: isinstance(t, TaskEndTraceEvent) and t.worker == worker,
+        lambda t: (isinstance(t, (TaskEndTraceEvent, TaskCancelTraceEvent)) and
+                   t.worker == worker),
         lambda e: e.task,
         map_start,
         map_end
@@ -421,8 +429,8 @@ def export_to_chrome_events(trace_events):
     ep = merge_trace_events(
         trace_events,
         lambda t: isinstance(t, TaskStartTraceEvent),
-        lambda t: isinstance(t, TaskEndTraceEvent),
-        lambda e: e.task,
+        lambda t: isinstance(t, (TaskEndTraceEvent, TaskCancelTraceEvent)),
+        lambda e: (e.task, e.worker),
     )
     result = []
     id_counter = 1
@@ -435,6 +443,8 @@ def export_to_chrome_events(trace_events):
             "dur": to_chrome_time(e2.time - e1.time),
             "pid": e1.worker.id,
         })
+        if isinstance(e2, TaskCancelTraceEvent):
+            continue
 
         consumers = set()
         for o in e1.task.outputs:
@@ -466,7 +476,7 @@ def export_to_chrome_events(trace_events):
     assigns = {}
 
     for event in trace_events:
-        if isinstance(event, TaskStartTraceEvent) or isinstance(event, TaskEndTraceEvent):
+        if isinstance(event, (TaskStartTraceEvent, TaskEndTraceEvent, TaskCancelTraceEvent)):
             if isinstance(event, TaskStartTraceEvent):
                 cpus.setdefault(event.worker, 0)
                 cpus[event.worker] += event.task.cpus
@@ -482,7 +492,8 @@ def export_to_chrome_events(trace_events):
                     "cpus": cpus[event.worker]
                 }
             })
-        if isinstance(event, TaskAssignTraceEvent) or isinstance(event, TaskEndTraceEvent) or isinstance(event, TaskRetractTraceEvent):
+        if isinstance(event, (TaskAssignTraceEvent, TaskEndTraceEvent, TaskRetractTraceEvent,
+                              TaskCancelTraceEvent)):
             if isinstance(event, TaskAssignTraceEvent):
                 assigns.setdefault(event.worker, 0)
                 assigns[event.worker] += event.task.cpus
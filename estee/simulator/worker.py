@@ -1,41 +1,67 @@
 import logging
+import random
+from functools import partial
+from heapq import heappop, heappush
 
-from simpy import Event, Store
-
-from ..simulator.trace import FetchStartTraceEvent, \
-    TaskEndTraceEvent, TaskStartTraceEvent
+from .memory import get_eviction_policy
+from .statistics import WorkerStatistics
+from ..simulator.trace import FetchStartTraceEvent, ObjectEvictTraceEvent, \
+    ObjectSpillTraceEvent, ObjectUnspillTraceEvent, TaskEndTraceEvent, TaskStartTraceEvent
 
 logger = logging.getLogger(__name__)
 
 
 class RunningTask:
 
-    __slots__ = ("task", "start_time")
+    __slots__ = ("task", "start_time", "duration")
 
-    def __init__(self, task, start_time):
+    def __init__(self, task, start_time, duration):
         self.task = task
         self.start_time = start_time
+        self.duration = duration
 
     def running_time(self, now):
         return now - self.start_time
 
     def remaining_time(self, now):
-        return self.task.duration - self.running_time(now)
+        return self.duration - self.running_time(now)
 
 
 class Download:
 
-    __slots__ = ("output", "source", "start_time", "priority", "consumer_count")
+    __slots__ = ("output", "source", "sources", "running_parts", "start_time", "priority",
+                 "consumer_count", "order", "entry")
 
-    def __init__(self, output, priority):
+    def __init__(self, output, priority, order=0):
         self.output = output
         self.start_time = None
+        # The first source (None while not running) and all sources of a striped download
         self.source = None
+        self.sources = None
+        self.running_parts = 0
         self.priority = priority
         self.consumer_count = 0
+        self.order = order
+        # The current entry of the download in pending heaps, other entries are outdated
+        self.entry = None
 
     def update_priority(self, priority):
-        self.priority = max(self.priority, priority)
+        """
+        Returns True if the priority was increased
+        """
+        if priority > self.priority:
+            self.priority = priority
+            return True
+        return False
+
+    @property
+    def part_size(self):
+        """
+        Size transferred from each source
+        """
+        if len(self.sources) == 1:
+            return self.output.size
+        return self.output.size / len(self.sources)
 
     def running_time(self, now):
         if self.start_time is None:
@@ -49,35 +75,178 @@ class Download:
                 self.start_time - simulator.env.now)
 
 
+class PreparedQueue:
+    """
+    Assignments with all inputs present on a worker, waiting for free cpus
+
+    Assignments are grouped by the number of required cpus, each group has
+    a heap ordered by (-priority, arrival) and a heap of blocks. An assignment
+    that does not fit into free cpus blocks all assignments with a priority
+    lower than its block. Since block <= priority, it precedes every assignment
+    it blocks, hence the current block is the maximal block of groups that do
+    not fit. Cancelled and started assignments are dropped lazily.
+    """
+
+    __slots__ = ("groups", "seq")
+
+    def __init__(self):
+        self.groups = {}
+        self.seq = 0
+
+    def push(self, assignment):
+        self.seq += 1
+        cpus = assignment.task.cpus
+        group = self.groups.get(cpus)
+        if group is None:
+            group = ([], [])
+            self.groups[cpus] = group
+        # entry[2] is set to None when the assignment leaves the queue
+        entry = [-assignment.priority, self.seq, assignment]
+        heappush(group[0], entry)
+        heappush(group[1], (-assignment.block, self.seq, entry))
+
+    def pop(self, free_cpus):
+        """
+        Returns the next assignment that fits into free_cpus or None
+        """
+        block = float("-inf")
+        best = None
+        best_entries = None
+        for cpus, (entries, blocks) in list(self.groups.items()):
+            while entries and entries[0][2].cancelled:
+                heappop(entries)[2] = None
+            if not entries:
+                del self.groups[cpus]
+                continue
+            if cpus <= free_cpus:
+                if best is None or entries[0] < best:
+                    best = entries[0]
+                    best_entries = entries
+            else:
+                while blocks[0][2][2] is None or blocks[0][2][2].cancelled:
+                    heappop(blocks)
+                block = max(block, -blocks[0][0])
+        if best is None or best[2].priority < block:
+            return None
+        heappop(best_entries)
+        assignment = best[2]
+        best[2] = None
+        return assignment
+
+
 class Worker:
+    """
+    Worker of the simulated cluster
+
+        speed - relative speed of the worker, durations of tasks are divided by it
+        memory - capacity of the memory for data objects (None = unbounded)
+        eviction_policy - name ("lru", "largest", "no-consumers") or an instance
+                          of EvictionPolicy choosing objects evicted when the
+                          memory is full
+        spill_bandwidth - bandwidth of the disk for spilling objects
+                          (None = spilling disabled)
+        download_source - policy choosing sources of downloads:
+                          "first" - the first worker in placing of the object
+                          "least-loaded" - a replica (worker in availability)
+                                           with the smallest size of running uploads
+                          "random" - a random replica
+                          "striped" - the object is split into equal parts
+                                      downloaded from up to `max_stripes`
+                                      least loaded replicas (only with network
+                                      models that limit the bandwidth of the
+                                      receiver, otherwise the parts would
+                                      make the download faster for free)
+
+    Except for "first", sources are chosen when a download starts among replicas
+    that have less than `max_downloads_per_worker` running downloads to the worker.
+    A download whose replicas are all busy waits in the pending downloads of these
+    replicas until one of them finishes a download to the worker.
+
+    With a bounded memory, objects over the capacity are evicted at the end of
+    each step of the worker. An object is dropped if no task assigned to the
+    worker needs it and it is not the placed copy (the source of downloads) of
+    an object with unfinished consumers; the scheduler is informed about the
+    changed placement. Other objects are spilled to disk if spilling is enabled,
+    otherwise they stay in memory over the capacity. Inputs of running tasks are
+    never evicted. Spilled inputs are read back before a task starts, reads and
+    writes share the disk.
+    """
 
     DOWNLOAD_PRIORITY_BOOST_FOR_READY_TASK = 100000
-
-    def __init__(self, cpus=1, max_downloads=4, max_downloads_per_worker=2):
+    DOWNLOAD_SOURCE_POLICIES = ("first", "least-loaded", "random", "striped")
+    # Key of pending downloads whose source is chosen when they start
+    ANY_SOURCE = -1
+
+    def __init__(self, cpus=1, max_downloads=4, max_downloads_per_worker=2,
+                 memory=None, eviction_policy="lru", spill_bandwidth=None,
+                 download_source="first", max_stripes=4, speed=1.0):
+        assert speed > 0
         self.cpus = cpus
+        self.speed = speed
         self.assignments = {}
-        self.ready_store = None
+        self.incoming_assignments = []
+        self.prepared_assignments = PreparedQueue()
+        self.finished_assignments = []
+        self.finished_downloads = []
+        self.task_wakeup = None
+        self.download_wakeup = None
 
         self.data = set()
         self.running_tasks = {}
         self.scheduled_downloads = {}
         self.running_downloads = []
+        # Downloads that are not running, heaps of (-priority, order, download) per source id
+        # (ANY_SOURCE for downloads whose sources are chosen when they start)
+        self.pending_downloads = {}
+        # Heap of (-priority, order, source id) of heads of pending_downloads,
+        # entries may be outdated and are checked when popped
+        self.download_sources = []
+        # Number of running downloads per source id
+        self.source_downloads = {}
+        self.download_order = 0
 
         self.free_cpus = cpus
         self.max_downloads = max_downloads
         self.max_downloads_per_worker = max_downloads_per_worker
         self.id = None
+        self.statistics = WorkerStatistics()
+
+        self.memory = memory
+        self.eviction_policy = get_eviction_policy(eviction_policy)
+        self.spill_bandwidth = spill_bandwidth
+        self.memory_usage = 0
+        self.spilled = set()
+        # Object -> counter value of its last use (for LRU ordering)
+        self.last_use = {}
+        self.use_counter = 0
+        self.disk_free_time = 0
+        # Objects uploaded to other workers (tracked only with a bounded memory)
+        self.uploading = {}
+
+        if download_source not in self.DOWNLOAD_SOURCE_POLICIES:
+            raise Exception("Unknown download source policy '{}'".format(download_source))
+        self.download_source = download_source
+        self.max_stripes = max_stripes
+        # Total size of running downloads (or their parts) sent by the worker
+        self.upload_load = 0
 
     def to_dict(self):
         return {
             "id": self.id,
-            "cpus": self.cpus
+            "cpus": self.cpus,
+            "speed": self.speed
         }
 
     def copy(self):
         return Worker(cpus=self.cpus,
                       max_downloads=self.max_downloads,
-                      max_downloads_per_worker=self.max_downloads_per_worker)
+                      max_downloads_per_worker=self.max_downloads_per_worker,
+                      memory=self.memory,
+                      eviction_policy=self.eviction_policy,
+                      spill_bandwidth=self.spill_bandwidth,
+                      download_source=self.download_source,
+                      max_stripes=self.max_stripes,
+                      speed=self.speed)
 
     def try_retract_task(self, task):
         if task in self.running_tasks:
@@ -88,7 +257,29 @@ class Worker:
         logging.debug("Retracting task %s from worker %s", task, self)
         a = self.assignments[task]
         a.cancelled = True
+        self._cancel_downloads(task)
+        del self.assignments[a.task]
+        return True
+
+    def cancel_task(self, task):
+        """
+        Cancels a copy of a duplicated task that was finished on another worker
 
+        Returns True if the copy was running (its cpus are freed immediately).
+        """
+        a = self.assignments.pop(task)
+        a.cancelled = True
+        running_task = self.running_tasks.pop(task, None)
+        if running_task is None:
+            self._cancel_downloads(task)
+            return False
+        logging.debug("Cancelling running task %s on worker %s", task, self)
+        self.free_cpus += task.cpus
+        self.statistics.cancelled_cpu_time += task.cpus * running_task.running_time(self.env.now)
+        self._wakeup_tasks()
+        return True
+
+    def _cancel_downloads(self, task):
         for inp in task.inputs:
             d = self.scheduled_downloads.get(inp)
             if d is None:
@@ -101,12 +292,7 @@ class Worker:
                     assert d not in self.running_downloads
                     del self.scheduled_downloads[inp]
 
-                # This is necessary to cleanup cache
-                if not self.download_wakeup.triggered:
-                    self.download_wakeup.succeed()
-
-        del self.assignments[a.task]
-        return True
+                self._wakeup_downloads()
 
     def assign_tasks(self, assignments):
         runtime_state = self.simulator.runtime_state
@@ -123,14 +309,17 @@ class Worker:
             for inp in assignment.task.inputs:
                 if inp in self.data:
                     continue
-                if runtime_state.object_info(inp).placing:
+                if runtime_state.is_placed(inp):
                     self._schedule_download(assignment, inp,
-                                            runtime_state.task_info(assignment.task).is_ready)
+                                            runtime_state.is_ready(assignment.task))
                 need_inputs += 1
             assignment.remaining_inputs_count = need_inputs
             if need_inputs == 0:
-                self.ready_store.put(assignment)
+                self._add_prepared(assignment)
             logger.info("Task %s scheduled on %s (%s ri)", assignment.task, self, need_inputs)
+        statistics = self.statistics
+        if len(self.assignments) > statistics.max_queue_depth:
+            statistics.max_queue_depth = len(self.assignments)
 
     def update_tasks(self, updates):
         runtime_state = self.simulator.runtime_state
@@ -140,7 +329,7 @@ class Worker:
                 if obj.size == 0:
                     self._add_data(obj)
                 else:
-                    self._schedule_download(a, obj, runtime_state.task_info(task).is_ready)
+                    self._schedule_download(a, obj, runtime_state.is_ready(task))
 
     @property
     def assigned_tasks(self):
@@ -150,6 +339,9 @@ class Worker:
         if obj in self.data:
             raise Exception("Object {} is already on worker {}".format(obj, self))
         self.data.add(obj)
+        if self.memory is not None:
+            self._use_data(obj)
+            self.memory_usage += obj.size
         for t in obj.consumers:
             a = self.assignments.get(t)
             if a is None:
@@ -157,7 +349,98 @@ class Worker:
             a.remaining_inputs_count -= 1
             if a.remaining_inputs_count <= 0:
                 assert a.remaining_inputs_count == 0
-                self.ready_store.put(a)
+                self._add_prepared(a)
+
+    def discard_data(self, obj):
+        """
+        Removes the object from the worker (if present) without informing the simulator
+        """
+        if obj not in self.data:
+            return
+        self.data.remove(obj)
+        if self.memory is not None:
+            del self.last_use[obj]
+            if obj in self.spilled:
+                self.spilled.remove(obj)
+            else:
+                self.memory_usage -= obj.size
+
+    def _use_data(self, obj):
+        self.use_counter += 1
+        self.last_use[obj] = self.use_counter
+
+    def _free_memory(self):
+        statistics = self.statistics
+        if self.memory_usage > self.memory:
+            simulator = self.simulator
+            placing = simulator.runtime_state.placing
+            spilled = self.spilled
+            running_tasks = self.running_tasks
+            assignments = self.assignments
+            now = self.env.now
+
+            candidates = [obj for obj in self.data if obj.size > 0 and obj not in spilled]
+            candidates.sort(key=partial(self.eviction_policy.key, self))
+            for obj in candidates:
+                if self.memory_usage <= self.memory:
+                    break
+                consumers = obj.consumers
+                if any(t in running_tasks for t in consumers) or obj in self.uploading:
+                    continue
+                if (not any(t in assignments for t in consumers) and
+                        (not placing.contains(obj.id, self.id) or
+                         not simulator.has_unfinished_consumers(obj))):
+                    self.discard_data(obj)
+                    statistics.evictions += 1
+                    statistics.evicted_bytes += obj.size
+                    simulator.add_trace_event(ObjectEvictTraceEvent(now, self, obj))
+                    simulator.on_data_evicted(self, obj)
+                elif self.spill_bandwidth is not None:
+                    self.spilled.add(obj)
+                    self.memory_usage -= obj.size
+                    self._use_disk(obj.size, now)
+                    statistics.spilled_bytes += obj.size
+                    simulator.add_trace_event(ObjectSpillTraceEvent(now, self, obj))
+
+        if self.memory_usage > statistics.max_memory_usage:
+            statistics.max_memory_usage = self.memory_usage
+
+    def _use_disk(self, size, now):
+        self.disk_free_time = max(self.disk_free_time, now) + size / self.spill_bandwidth
+        return self.disk_free_time
+
+    def _unspill_inputs(self, task, now):
+        """
+        Reads spilled inputs of the task back to memory, returns the delay of the task
+        """
+        spilled = self.spilled
+        end = now
+        for inp in task.inputs:
+            if inp in spilled:
+                spilled.remove(inp)
+                self.memory_usage += inp.size
+                end = self._use_disk(inp.size, now)
+                self.statistics.unspilled_bytes += inp.size
+                self.simulator.add_trace_event(ObjectUnspillTraceEvent(now, self, inp))
+        return end - now
+
+    def _add_prepared(self, assignment):
+        # Assignment is picked up in the next step of the worker,
+        # i.e. after the simulator processes the current events.
+        self.incoming_assignments.append(assignment)
+        self._wakeup_tasks()
+
+    def _wakeup_tasks(self):
+        if self.task_wakeup is None:
+            self.task_wakeup = self.env.event()
+            self.task_wakeup.callbacks.append(self._process_tasks)
+            self.task_wakeup.succeed()
+
+    def _wakeup_downloads(self):
+        if self.download_wakeup is None:
+            self.download_wakeup = self.env.event()
+            self.download_wakeup.callbacks.append(self._process_downloads)
+            self.download_wakeup.succeed()
 
     def _schedule_download(self, assignment, obj, ready):
         priority = assignment.priority
@@ -167,116 +450,277 @@ class Worker:
         if d is None:
             logger.info("Worker %s: scheduled downloading %s, priority=%s", self, obj, priority)
             assert obj not in self.data
-            d = Download(obj, priority)
+            self.download_order += 1
+            d = Download(obj, priority, self.download_order)
             self.scheduled_downloads[obj] = d
-        else:
-            d.update_priority(priority)
+            self._push_download(d)
+        elif d.update_priority(priority) and d.source is None:
+            self._push_download(d)
         d.consumer_count += 1
-        if not self.download_wakeup.triggered:
-            self.download_wakeup.succeed()
-
-    def _download_process(self):
-        events = [self.download_wakeup]
-        env = self.env
-        runtime_state = self.simulator.runtime_state
+        self._wakeup_downloads()
 
+    def _push_download(self, d):
+        if self.download_source == "first":
+            source_id = self.simulator.runtime_state.placing.ids(d.output.id)[0]
+        else:
+            source_id = self.ANY_SOURCE
+        entry = (-d.priority, d.order, d)
+        d.entry = entry
+        self._push_pending(entry, source_id)
+
+    def _push_pending(self, entry, source_id):
+        heap = self.pending_downloads.get(source_id)
+        if heap is None:
+            heap = []
+            self.pending_downloads[source_id] = heap
+        heappush(heap, entry)
+        if self.source_downloads.get(source_id, 0) < self.max_downloads_per_worker:
+            heappush(self.download_sources, (entry[0], entry[1], source_id))
+
+    def _block_download(self, d):
+        """
+        Moves a download whose replicas are all busy to pending downloads of the replicas
+
+        It is popped when one of the replicas finishes a download to this worker.
+        """
+        entry = (-d.priority, d.order, d)
+        d.entry = entry
+        for source_id in self.simulator.runtime_state.availability.ids(d.output.id):
+            self._push_pending(entry, source_id)
+
+    def _pending_download_head(self, source_id):
+        heap = self.pending_downloads.get(source_id)
+        if heap is None:
+            return None
+        scheduled_downloads = self.scheduled_downloads
+        while heap:
+            entry = heap[0]
+            d = entry[2]
+            if (d.source is None and entry is d.entry and
+                    scheduled_downloads.get(d.output) is d):
+                return entry
+            heappop(heap)
+        del self.pending_downloads[source_id]
+        return None
+
+    def _select_sources(self, obj):
+        """
+        Returns ids of sources of a download with the ANY_SOURCE key (empty if all are busy)
+        """
+        workers = self.simulator.workers
+        source_downloads = self.source_downloads
+        limit = self.max_downloads_per_worker
+        candidates = [workers[i] for i in self.simulator.runtime_state.availability.ids(obj.id)
+                      if source_downloads.get(i, 0) < limit]
+        if not candidates:
+            return ()
+        policy = self.download_source
+        if policy == "random":
+            return (random.choice(candidates).id,)
+        candidates.sort(key=lambda w: w.upload_load)
+        if policy == "least-loaded":
+            return (candidates[0].id,)
+        return [w.id for w in candidates[:self.max_stripes]]
+
+    def _pop_any_source_download(self):
+        """
+        Pops the first download with the ANY_SOURCE key that has a free source
+
+        Returns (download, source ids) or (None, ()) if there is no such download.
+        Downloads whose sources are all busy are moved to pending downloads of
+        their replicas (see _block_download), so they are not scanned again
+        and they do not block downloads from other sources.
+        """
+        ANY_SOURCE = self.ANY_SOURCE
         while True:
-            finished = yield env.any_of(events)
-            for event in finished.keys():
-                if event == events[0]:
-                    self.download_wakeup = Event(self.simulator.env)
-                    events[0] = self.download_wakeup
-                    downloads = None
+            head = self._pending_download_head(ANY_SOURCE)
+            if head is None:
+                return None, ()
+            heappop(self.pending_downloads[ANY_SOURCE])
+            d = head[2]
+            source_ids = self._select_sources(d.output)
+            if source_ids:
+                return d, source_ids
+            self._block_download(d)
+
+    def _pop_source_download(self, source_id):
+        """
+        Pops the head of pending downloads of a free source
+
+        Returns (download, source ids) or (None, ()) if the download is blocked again.
+        """
+        d = heappop(self.pending_downloads[source_id])[2]
+        if self.download_source == "first":
+            return d, (source_id,)
+        # A blocked download, the source is free now but the policy
+        # chooses among all free replicas
+        source_ids = self._select_sources(d.output)
+        if source_ids:
+            return d, source_ids
+        # The object is no longer on the source
+        self._block_download(d)
+        head = self._pending_download_head(source_id)
+        if head is not None:
+            heappush(self.download_sources, (head[0], head[1], source_id))
+        return None, ()
+
+    def _download_finished(self, event):
+        d = event.value
+        d.running_parts -= 1
+        if d.running_parts == 0:
+            self.finished_downloads.append(d)
+            self._wakeup_downloads()
+
+    def _process_downloads(self, event):
+        self.download_wakeup = None
+        source_downloads = self.source_downloads
+        download_sources = self.download_sources
+
+        for download in self.finished_downloads:
+            obj = download.output
+            self._add_data(obj)
+            self.running_downloads.remove(download)
+            del self.scheduled_downloads[obj]
+            for source in download.sources:
+                source._upload_finished(obj, download.part_size)
+                source_id = source.id
+                source_downloads[source_id] -= 1
+                head = self._pending_download_head(source_id)
+                if head is not None:
+                    heappush(download_sources, (head[0], head[1], source_id))
+            self.simulator.fetch_finished(self, download)
+        self.finished_downloads = []
+        if self.memory is not None:
+            self._free_memory()
+
+        workers = self.simulator.workers
+        while download_sources and len(self.running_downloads) < self.max_downloads:
+            key = heappop(download_sources)
+            source_id = key[2]
+            count = source_downloads.get(source_id, 0)
+            if count >= self.max_downloads_per_worker:
+                continue
+            head = self._pending_download_head(source_id)
+            if head is None:
+                continue
+            if head[0] != key[0] or head[1] != key[1]:
+                heappush(download_sources, (head[0], head[1], source_id))
+                continue
+            if source_id == self.ANY_SOURCE:
+                d, source_ids = self._pop_any_source_download()
+                if d is None:
                     continue
-                events.remove(event)
-                download = event.value
-                self._add_data(download.output)
-                self.running_downloads.remove(download)
-                del self.scheduled_downloads[download.output]
-
-                self.simulator.fetch_finished(self, download.source, download.output)
-
-            if len(self.running_downloads) < self.max_downloads:
-                # We need to sort any time, as it priority may changed in background
-
-                if downloads is None:
-                    downloads = list(o for o in self.scheduled_downloads.values()
-                                     if o not in self.running_downloads)
-                    downloads.sort(key=lambda d: d.priority, reverse=True)
-
-                for d in downloads[:]:
-                    count = 0
-                    worker = runtime_state.object_info(d.output).placing[0]
-                    for rd in self.running_downloads:
-                        if worker == rd.source:
-                            count += 1
-                    if count >= self.max_downloads_per_worker:
-                        continue
-                    downloads.remove(d)
-                    assert d.start_time is None
-                    d.start_time = self.env.now
-                    d.source = worker
-                    self.running_downloads.append(d)
-                    event = self.netmodel.download(worker, self, d.output.size, d)
-                    events.append(event)
-                    self.simulator.add_trace_event(
-                        FetchStartTraceEvent(self.env.now, self, worker, d.output))
-                    if len(self.running_downloads) >= self.max_downloads:
-                        break
-
-    def run(self, env, simulator, netmodel):
+            else:
+                d, source_ids = self._pop_source_download(source_id)
+                if d is None:
+                    continue
+            for i in source_ids:
+                source_downloads[i] = source_downloads.get(i, 0) + 1
+            if source_downloads.get(source_id, 0) < self.max_downloads_per_worker:
+                head = self._pending_download_head(source_id)
+                if head is not None:
+                    heappush(download_sources, (head[0], head[1], source_id))
+
+            self._start_download(d, [workers[i] for i in source_ids])
+
+    def _start_download(self, d, sources):
+        assert d.start_time is None
+        now = self.env.now
+        obj = d.output
+        d.start_time = now
+        d.source = sources[0]
+        d.sources = sources
+        d.running_parts = len(sources)
+        self.running_downloads.append(d)
+        size = d.part_size
+        for source in sources:
+            source.upload_load += size
+            if source.memory is not None:
+                source.uploading[obj] = source.uploading.get(obj, 0) + 1
+            event = self.netmodel.download(source, self, size, d)
+            event.callbacks.append(self._download_finished)
+            self.simulator.add_trace_event(FetchStartTraceEvent(now, self, source, obj))
+
+    def _upload_finished(self, obj, size):
+        self.upload_load -= size
+        if self.memory is not None:
+            count = self.uploading[obj] - 1
+            if count:
+                self.uploading[obj] = count
+            else:
+                del self.uploading[obj]
+
+    def _task_finished(self, event):
+        self.finished_assignments.append(event.value)
+        self._wakeup_tasks()
+
+    def _process_tasks(self, event):
+        simulator = self.simulator
+        now = self.env.now
+
+        prepared_assignments = self.prepared_assignments
+        statistics = self.statistics
+        for assignment in self.incoming_assignments:
+            prepared_assignments.push(assignment)
+        self.incoming_assignments = []
+
+        for assignment in self.finished_assignments:
+            if assignment.cancelled:
+                # Copy of a duplicated task, its cpus were freed by cancel_task()
+                continue
+            task = assignment.task
+            self.free_cpus += task.cpus
+            running_task = self.running_tasks.pop(task)
+            statistics.busy_cpu_time += task.cpus * running_task.duration
+            del self.assignments[task]
+            simulator.add_trace_event(TaskEndTraceEvent(now, self, task))
+            for output in task.outputs:
+                self._add_data(output)
+            simulator.on_task_finished(self, task)
+        self.finished_assignments = []
+
+        while True:
+            assignment = prepared_assignments.pop(self.free_cpus)
+            if assignment is None:
+                break
+            task = assignment.task
+            self.free_cpus -= task.cpus
+            simulator.add_trace_event(TaskStartTraceEvent(now, self, task))
+            duration = task.run_time(self.speed)
+            if self.memory is not None:
+                for inp in task.inputs:
+                    self._use_data(inp)
+                if self.spilled:
+                    duration += self._unspill_inputs(task, now)
+            self.running_tasks[task] = RunningTask(task, now, duration)
+            self.env.timeout(duration, assignment).callbacks.append(
+                self._task_finished)
+            simulator.on_task_start(self, task)
+
+        if self.memory is not None:
+            self._free_memory()
+
+        if self.free_cpus == self.cpus:
+            if statistics.idle_since is None:
+                statistics.idle_since = now
+        elif statistics.idle_since is not None:
+            statistics.idle_time += now - statistics.idle_since
+            statistics.idle_since = None
+
+        self.task_wakeup = None
+        if self.incoming_assignments:
+            self._wakeup_tasks()
+
+    def start(self, env, simulator, netmodel):
+        if self.download_source == "striped" and not netmodel.LIMITS_RECEIVER_BANDWIDTH:
+            # Parts would be downloaded in parallel, each at the full bandwidth
+            raise Exception("Striped downloads need a network model that limits "
+                            "the bandwidth of the receiver (e.g. MaxMinFlowNetModel)")
         self.env = env
         self.simulator = simulator
         self.netmodel = netmodel
-        self.ready_store = Store(env)
-        self.download_wakeup = Event(self.simulator.env)
-
         self.free_cpus = self.cpus
-        env.process(self._download_process())
-
-        prepared_assignments = []
-        events = [self.ready_store.get()]
-
-        while True:
-            finished = yield env.any_of(events)
-            for event in finished.keys():
-                if event == events[0]:
-                    events[0] = self.ready_store.get()
-                    assignment = event.value
-                    if assignment.cancelled:
-                        continue
-                    prepared_assignments.append(assignment)
-                    prepared_assignments.sort(key=lambda a: a.priority, reverse=True)
-                    continue
-
-                assignment = event.value
-                task = assignment.task
-                self.free_cpus += task.cpus
-                assert not assignment.cancelled
-                del self.assignments[assignment.task]
-                events.remove(event)
-                del self.running_tasks[task]
-                simulator.add_trace_event(TaskEndTraceEvent(self.env.now, self, task))
-                for output in task.outputs:
-                    self._add_data(output)
-                simulator.on_task_finished(self, task)
-
-            block = float("-inf")
-            for assignment in prepared_assignments[:]:
-                if assignment.priority < block:
-                    continue
-                task = assignment.task
-                if task.cpus <= self.free_cpus:
-                    prepared_assignments.remove(assignment)
-                    if assignment.cancelled:
-                        continue
-                    self.free_cpus -= task.cpus
-                    self.running_tasks[task] = RunningTask(task, self.env.now)
-                    simulator.add_trace_event(TaskStartTraceEvent(self.env.now, self, task))
-                    events.append(env.timeout(task.duration, assignment))
-                    self.simulator.on_task_start(self, assignment.task)
-                else:
-                    block = max(block, assignment.block)
+        self.statistics = WorkerStatistics()
 
     def __repr__(self):
         return "<Worker {}>".format(self.id)
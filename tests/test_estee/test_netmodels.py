@@ -5,18 +5,27 @@ import pytest
 import simpy
 from numpy.testing import assert_array_equal
 
-from estee.simulator import Worker
-from estee.simulator.netmodels import compute_maxmin_flow, \
+from estee.simulator import SimulatorStatistics, Worker
+from estee.simulator.engine import NativeEnvironment
+from estee.simulator.netmodels import compute_maxmin_flow, compute_maxmin_flow_sparse, \
     MaxMinFlowNetModel, SimpleNetModel
 
 
 def test_maxmin_flow():
 
     def mm_flow(send_capacities, recv_capacities, connections):
-        return compute_maxmin_flow(
+        connections = np.array(connections, dtype=np.int32)
+        links = list(zip(*np.nonzero(connections)))
+        sparse = np.zeros(connections.shape)
+        for (s, r), f in zip(links, compute_maxmin_flow_sparse(
+                send_capacities, recv_capacities, links)):
+            sparse[s, r] = f
+        result = compute_maxmin_flow(
             np.array(send_capacities, dtype=np.float),
             np.array(recv_capacities, dtype=np.float),
-            np.array(connections, dtype=np.int32))
+            connections)
+        assert_array_equal(result, sparse)
+        return result
 
     assert_array_equal(np.array([[0.5], [0.5]]),
                        mm_flow([1, 1], [1], [[1], [1]]))
@@ -48,12 +57,27 @@ def test_maxmin_flow():
                                np.eye(4, dtype=np.int32)))
 
 
-def create_netmodel(cclass=MaxMinFlowNetModel):
-    env = simpy.Environment()
-    workers = [Worker() for _ in range(4)]
+def test_maxmin_flow_sparse_random():
+    rng = np.random.RandomState(42)
+    for _ in range(50):
+        connections = (rng.rand(20, 15) < 0.2).astype(np.int32)
+        send_capacities = rng.randint(1, 5, 20) / 4
+        recv_capacities = rng.randint(1, 5, 15) / 4
+        nonzero = np.nonzero(connections)
+        links = list(zip(*nonzero))
+        sparse = compute_maxmin_flow_sparse(send_capacities, recv_capacities, links)
+        expected = compute_maxmin_flow(send_capacities.copy(), recv_capacities.copy(),
+                                       connections)
+        assert_array_equal(sparse, expected[nonzero])
+
+
+def create_netmodel(cclass=MaxMinFlowNetModel, env_class=simpy.Environment, worker_count=4,
+                    **netmodel_args):
+    env = env_class()
+    workers = [Worker() for _ in range(worker_count)]
     for i, w in enumerate(workers):
         w.id = i
-    netmodel = cclass(100)
+    netmodel = cclass(100, **netmodel_args)
     netmodel.init(env, workers)
     return netmodel, env, workers
 
@@ -140,3 +164,148 @@ def test_maxmin_netmodel():
 
         assert tm1 > tm2
         assert tm1 < sum(diffs) + sum(sizes) / netmodel.bandwidth
+
+
+def test_maxmin_netmodel_long_lived_link():
+    netmodel, env, workers = create_netmodel()
+    netmodel.download(workers[0], workers[1], 10 ** 12)
+    env.run(env.timeout(10 ** 9))
+
+    # The progress of the busy link is rebased, so a small download keeps its exact size
+    small = netmodel.download(workers[0], workers[1], 0.1)
+    link = netmodel.links[(0, 1)]
+    assert link.progress <= link.REBASE_PROGRESS
+    assert sorted(d.end - link.progress for d in link.downloads) == [0.1, 10 ** 12 - 10 ** 11]
+
+    env.run(small)
+    assert env.now == pytest.approx(10 ** 9 + 0.1 / 50)
+    assert len(link.downloads) == 1
+
+
+def test_maxmin_netmodel_incremental_flows():
+    random.seed(42)
+    netmodel, env, workers = create_netmodel(worker_count=12)
+    # Links within two groups of workers, so there are several components
+    groups = [list(range(6)), list(range(6, 12))]
+    checked = 0
+    for _ in range(300):
+        source, target = random.sample(random.choice(groups), 2)
+        netmodel.download(workers[source], workers[target], random.random() * 100)
+        env.run(env.timeout(random.random() / 4))
+        if netmodel.recompute_flows:
+            continue
+        connections = np.zeros((12, 12), dtype=np.int32)
+        for s, t in netmodel.links:
+            connections[s, t] = 1
+        expected = compute_maxmin_flow(np.full(12, 100.0), np.full(12, 100.0), connections)
+        flows = np.zeros((12, 12))
+        for (s, t), f in netmodel.flows.items():
+            flows[s, t] = f
+        assert_array_equal(flows, expected)
+        checked += 1
+    assert checked > 100
+
+
+def test_maxmin_netmodel_trace_flows():
+    netmodel, env, workers = create_netmodel()
+    events = []
+    netmodel.set_event_listener(events.append)
+
+    def flows():
+        result = [(e.time, e.source_worker.id, e.target_worker.id, e.value) for e in events]
+        events.clear()
+        return sorted(result)
+
+    d1 = netmodel.download(workers[0], workers[1], 100)
+    netmodel.download(workers[2], workers[3], 300)
+    env.run(env.timeout(0.5))
+    assert flows() == [(0, 0, 1, 100), (0, 2, 3, 100)]
+
+    # Only flows of the changed component are traced
+    netmodel.download(workers[0], workers[2], 100)
+    env.run(d1)
+    assert flows() == [(0.5, 0, 1, 50), (0.5, 0, 2, 50), (1.5, 0, 1, 0), (1.5, 0, 2, 100)]
+
+
+def test_maxmin_netmodel_flow_cache():
+    netmodel, env, workers = create_netmodel()
+    env.run(netmodel.download(workers[0], workers[1], 100))
+    env.run(env.timeout(1))
+    # Closing the last link of a component is not looked up in the cache
+    assert not netmodel.links
+    assert (netmodel.flow_cache_hits, netmodel.flow_cache_misses) == (0, 1)
+
+    # The same component on other workers is found in the cache
+    env.run(netmodel.download(workers[2], workers[3], 100))
+    env.run(env.timeout(1))
+    assert (netmodel.flow_cache_hits, netmodel.flow_cache_misses) == (1, 1)
+
+    statistics = SimulatorStatistics()
+    netmodel.update_statistics(statistics)
+    assert statistics.flow_cache_hits == 1
+    assert statistics.flow_cache_hit_rate == 0.5
+
+
+def test_maxmin_netmodel_flow_cache_size():
+    netmodel, env, workers = create_netmodel(worker_count=8)
+    # A single link takes 8 bytes of key and 8 bytes of flow
+    netmodel.flow_cache.size = 200
+    for i in range(1, 8):
+        netmodel.download(workers[0], workers[i], 100)
+        env.run(env.timeout(0.1))
+    cache = netmodel.flow_cache
+    assert cache.used == sum(len(k) + f.nbytes for k, f in cache.cache.items())
+    assert 0 < cache.used <= 200
+    assert len(cache.cache) < 7
+
+
+def test_maxmin_netmodel_native_env():
+    random.seed(42)
+    COUNT = 50
+
+    ids = list(range(4))
+    pairs = [random.sample(ids, 2) for i in range(COUNT)]
+    sizes = [random.random() * 200 + 0.00001 for i in range(COUNT)]
+    diffs = [random.random() / 10.0 + 0.00001 for i in range(COUNT)]
+
+    results = []
+    for env_class in (simpy.Environment, NativeEnvironment):
+        finished = []
+        netmodel, env, workers = create_netmodel(env_class=env_class)
+        for i, (p, s, d) in enumerate(zip(pairs, sizes, diffs)):
+            ev = netmodel.download(workers[p[0]], workers[p[1]], s, i)
+            ev.callbacks.append(lambda e: finished.append((e.env.now, e.value)))
+            env.run(env.timeout(d))
+        env.run()
+        assert len(finished) == COUNT
+        results.append(finished)
+    assert results[0] == results[1]
+
+
+@pytest.mark.parametrize("cclass", [SimpleNetModel, MaxMinFlowNetModel])
+def test_netmodel_latency(cclass):
+    netmodel, env, workers = create_netmodel(cclass, latency=0.5,
+                                             link_latencies={(2, 3): 1})
+    d = netmodel.download(workers[0], workers[1], 200)
+    env.run(d)
+    assert env.now == pytest.approx(2.5)
+
+    d = netmodel.download(workers[0], workers[1], 0)
+    env.run(d)
+    assert env.now == pytest.approx(3.0)
+
+    d = netmodel.download(workers[2], workers[3], 100)
+    env.run(d)
+    assert env.now == pytest.approx(5.5)
+
+
+def test_maxmin_netmodel_latency_flows():
+    netmodel, env, workers = create_netmodel(latency=1)
+    # The second download shares the link only after its latency (at 2.5)
+    d1 = netmodel.download(workers[0], workers[1], 200)
+    env.run(env.timeout(1.5))
+    d2 = netmodel.download(workers[0], workers[1], 100)
+    env.run(d1)
+    assert env.now == pytest.approx(3.5)
+    env.run(d2)
+    assert env.now == pytest.approx(4.0)
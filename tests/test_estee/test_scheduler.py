@@ -1,11 +1,14 @@
 import itertools
 
+import pytest
+
 from estee.common import TaskGraph
 from estee.schedulers import (AllOnOneScheduler, BlevelGtScheduler,
                               Camp2Scheduler,
                               DLSScheduler, ETFScheduler, MCPScheduler,
                               RandomAssignScheduler, RandomGtScheduler,
-                              RandomScheduler, WorkStealingScheduler, SchedulerBase)
+                              RandomScheduler, ReplayScheduler, WorkStealingScheduler,
+                              SchedulerBase)
 from estee.schedulers.clustering import find_critical_path, critical_path_clustering, LcScheduler
 from estee.schedulers.genetic import GeneticScheduler
 from estee.schedulers.others import TlevelScheduler, BlevelScheduler
@@ -17,7 +20,8 @@ from estee.schedulers.utils import compute_b_level_duration_size, \
     compute_t_level_duration_size
 from estee.schedulers.utils import topological_sort, \
     worker_estimate_earliest_time, get_size_estimate
-from estee.simulator import SimpleNetModel, TaskAssignment
+from estee.simulator import MaxMinFlowNetModel, ScheduleRecord, SimpleNetModel, Simulator, \
+    TaskAssignment, Worker
 from .test_utils import do_sched_test, task_by_name
 
 
@@ -40,6 +44,79 @@ def test_scheduler_all_on_one(plan1):
         assert obj.availability == obj.placing
 
 
+def test_scheduler_replay(plan1, tmpdir):
+    def run(scheduler, netmodel, record_schedule=False):
+        simulator = Simulator(plan1, [Worker(cpus=2), Worker(), Worker()], scheduler, netmodel,
+                              trace=True, record_schedule=record_schedule)
+        simulator.run()
+        return simulator
+
+    def assignments(simulator):
+        return [(e.time, e.worker.id, e.task.id) for e in simulator.trace_events
+                if type(e).__name__ == "TaskAssign"]
+
+    for scheduler in (BlevelGtScheduler(), WorkStealingScheduler(), Camp2Scheduler()):
+        original = run(scheduler, SimpleNetModel(2), record_schedule=True)
+        record = original.schedule_record
+        assert len(record) >= plan1.task_count
+        assert record.reassigning == scheduler.reassigning
+
+        filename = str(tmpdir.join("schedule.npz"))
+        record.save(filename)
+        record = ScheduleRecord.load(filename)
+        assert record.reassigning == scheduler.reassigning
+
+        for batch_updates in (True, False):
+            replay = run(ReplayScheduler(record, batch_updates=batch_updates), SimpleNetModel(2))
+            assert replay.env.now == original.env.now
+            assert assignments(replay) == assignments(original)
+
+        replay = run(ReplayScheduler(record), MaxMinFlowNetModel(2))
+        assert all(replay.runtime_state.task_info(t).is_finished for t in plan1.tasks.values())
+
+
+@pytest.mark.parametrize("engine", ["simpy", "native"])
+def test_scheduler_replay_other_bandwidth(engine):
+    task_graph = TaskGraph()
+    a = task_graph.new_task("a", duration=1, output_size=10)
+    b = task_graph.new_task("b", duration=1, output_size=10)
+    c = task_graph.new_task("c", duration=1)
+    b.add_input(a)
+    c.add_input(b)
+
+    class Scheduler(SchedulerBase):
+        def schedule(self, update):
+            # Ready tasks alternate between workers, so each output is downloaded
+            for t in update.new_ready_tasks:
+                self.assign(self.workers[t.id % 2], t)
+
+    def run(scheduler, bandwidth):
+        simulator = Simulator(task_graph, [Worker(), Worker()], scheduler,
+                              SimpleNetModel(bandwidth), record_schedule=True, engine=engine)
+        return simulator.run(), simulator.schedule_record
+
+    makespan, record = run(Scheduler("x", "0"), 1)
+    assert makespan == 23
+    assert record.times == [0, 1, 12]
+    assert run(ReplayScheduler(record), 1)[0] == 23
+    assert run(ReplayScheduler(record), 100)[0] == pytest.approx(3.2)
+    assert run(ReplayScheduler(record, batch_updates=False), 100)[0] == pytest.approx(3.2)
+
+
+def test_scheduler_replay_drops_finished_tasks(plan1):
+    def run(scheduler, bandwidth, record_schedule=False):
+        simulator = Simulator(plan1, [Worker(cpus=2), Worker(), Worker()], scheduler,
+                              SimpleNetModel(bandwidth), record_schedule=record_schedule)
+        simulator.run()
+        return simulator
+
+    record = run(WorkStealingScheduler(), 1, record_schedule=True).schedule_record
+    assert record.reassigning
+    for bandwidth, batch_updates in itertools.product((1, 1000), (True, False)):
+        replay = run(ReplayScheduler(record, batch_updates=batch_updates), bandwidth)
+        assert all(replay.runtime_state.task_info(t).is_finished for t in plan1.tasks.values())
+
+
 def test_scheduler_random(plan1):
     # 1w, instant
     assert 17 == do_sched_test(plan1, 1, RandomScheduler())
@@ -128,6 +205,34 @@ def test_scheduler_ws(plan1):
     assert 12 <= do_sched_test(plan1, 2, WorkStealingScheduler(), SimpleNetModel()) <= 18
 
 
+@pytest.mark.parametrize("scheduler_cls", [
+    AllOnOneScheduler, DLSScheduler, MCPScheduler, BlevelScheduler, TlevelScheduler])
+def test_scheduler_update_messages(plan1, scheduler_cls):
+    def run(batch_updates):
+        scheduler = scheduler_cls()
+        scheduler.batch_updates = batch_updates
+        message_types = []
+        send_message = scheduler.send_message
+
+        def record_message(message):
+            message_types.append(message["type"])
+            return send_message(message)
+        scheduler.send_message = record_message
+
+        simulator = do_sched_test(plan1, [2, 1], scheduler, MaxMinFlowNetModel(2),
+                                  return_simulator=True)
+        return simulator, set(message_types)
+
+    batched, batched_types = run(True)
+    plain, plain_types = run(False)
+    assert batched_types == {"update_batch"}
+    assert plain_types == {"update"}
+    assert plain.env.now == batched.env.now
+    for task in plan1.tasks.values():
+        assert plain.runtime_state.task_info(task).end_time == \
+            batched.runtime_state.task_info(task).end_time
+
+
 def test_compute_independent_tasks(plan1):
     it = compute_independent_tasks(plan1)
     a1, a2, a3, a4, a5, a6, a7, a8 = plan1.tasks.values()
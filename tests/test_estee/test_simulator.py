@@ -1,9 +1,20 @@
+import random
+import time
+
+import numpy as np
 import pytest
 
 from estee.common import TaskGraph
-from estee.schedulers import AllOnOneScheduler, DoNothingScheduler, SchedulerBase, \
-    StaticScheduler
-from estee.simulator import SimpleNetModel, TaskState
+from estee.generators.elementary import triplets
+from estee.schedulers import AllOnOneScheduler, BlevelGtScheduler, Camp2Scheduler, \
+    DoNothingScheduler, SchedulerBase, StaticScheduler
+from estee.schedulers.clustering import LcScheduler
+from estee.simulator import FluidSimulator, InstantNetModel, MaxMinFlowNetModel, \
+    SimpleNetModel, Simulator, TaskState, Worker, compare_fluid, poisson_arrivals, \
+    run_replicas
+from estee.simulator.trace import FetchEndTraceEvent, TaskCancelTraceEvent, TaskStartTraceEvent
+from estee.simulator.runtimeinfo import RuntimeState, WorkerBitmap
+from estee.simulator.trace import NetModelFlowEvent
 from .test_utils import do_sched_test, fixed_scheduler
 
 
@@ -131,6 +142,65 @@ def test_scheduling_time():
     assert runtime_state.task_info(d).end_time == 14
 
 
+def test_scheduling_time_changes_during_scheduling():
+    test_graph = TaskGraph()
+    a = test_graph.new_task("A", duration=1, output_size=1)
+    b = test_graph.new_task("B", duration=0.5, output_size=1)
+    c = test_graph.new_task("C", duration=1)
+    c.add_inputs([a, b])
+
+    class Scheduler(SchedulerBase):
+        def schedule(self, update):
+            for t in update.new_ready_tasks:
+                self.assign(self.workers[0], t)
+
+    # A finishes while the update sent after B is being scheduled
+    simulator = do_sched_test(test_graph, [2], Scheduler("x", "0"),
+                              scheduling_time=2, return_simulator=True)
+    assert simulator.runtime_state.task_info(c).end_time == 7.5
+
+
+def test_scheduling_time_measured():
+    test_graph = TaskGraph()
+    a = test_graph.new_task("A", duration=1, output_size=1)
+    b = test_graph.new_task("B", duration=1, output_size=1)
+    c = test_graph.new_task("C", duration=1)
+    b.add_input(a)
+    c.add_input(b)
+
+    class Scheduler(SchedulerBase):
+        def schedule(self, update):
+            # Sleeping is not charged, only the CPU time of the scheduler
+            time.sleep(0.01)
+            start = time.process_time()
+            while time.process_time() - start < 0.01:
+                pass
+            for t in update.new_ready_tasks:
+                self.assign(self.workers[0], t)
+
+    scale = 100
+    simulator = Simulator(test_graph, [Worker()], Scheduler("x", "0"), InstantNetModel(),
+                          scheduling_time="measured", scheduling_time_scale=scale)
+    makespan = simulator.run()
+
+    statistics = simulator.statistics
+    durations = statistics.scheduler_durations
+    cpu_times = statistics.scheduler_cpu_times
+    assert len(durations) == len(cpu_times) == len(statistics.scheduler_times) == \
+        statistics.scheduler_invocations
+    assert all(d >= 0.02 for d in durations)
+    assert all(0.01 <= t < d for t, d in zip(cpu_times, durations))
+    assert sum(durations) == pytest.approx(statistics.scheduler_wall_time)
+    # The first update (new workers) is not charged
+    assert makespan == pytest.approx(3 + scale * sum(cpu_times[1:]))
+    start = scale * cpu_times[1]
+    assert simulator.runtime_state.task_info(a).end_time == pytest.approx(start + 1)
+
+    with pytest.raises(Exception):
+        Simulator(test_graph, [Worker()], Scheduler("x", "0"), InstantNetModel(),
+                  scheduling_time="wall")
+
+
 def test_simulator_reschedule_no_download():
     test_graph = TaskGraph()
     a1 = test_graph.new_task("A1", duration=10, cpus=1)
@@ -346,3 +416,594 @@ def test_simulator_task_start_notify():
                   scheduler,
                   trace=True, netmodel=SimpleNetModel(1))
     assert triggered[1] and triggered[0]
+
+
+def trace_summary(simulator):
+    def key(e):
+        worker = getattr(e, "worker", None) or e.target_worker
+        return (e.time, type(e).__name__, worker.id, getattr(e, "task", None) or e.output)
+    return [key(e) for e in simulator.trace_events
+            if not isinstance(e, NetModelFlowEvent)]
+
+
+@pytest.mark.parametrize("netmodel", [SimpleNetModel, MaxMinFlowNetModel])
+@pytest.mark.parametrize("sched_timing", [(None, None), (0.3, None), (None, 0.2)])
+def test_simulator_native_engine(plan1, netmodel, sched_timing):
+    min_scheduling_interval, scheduling_time = sched_timing
+    assignments = [(i % 3, task, i % 4) for i, task in enumerate(plan1.tasks.values())]
+
+    for scheduler_fn in (lambda: fixed_scheduler(assignments), AllOnOneScheduler):
+        results = []
+        for engine in ("simpy", "native"):
+            simulator = do_sched_test(plan1, [2, 1, 1], scheduler_fn(), netmodel(2),
+                                      trace=True, return_simulator=True,
+                                      min_scheduling_interval=min_scheduling_interval,
+                                      scheduling_time=scheduling_time,
+                                      engine=engine)
+            results.append((simulator.env.now, trace_summary(simulator)))
+        assert results[0] == results[1]
+
+
+def test_simulator_native_engine_no_events():
+    task_graph = TaskGraph()
+    task_graph.new_task("A", duration=1)
+
+    with pytest.raises(RuntimeError):
+        do_sched_test(task_graph, 1, DoNothingScheduler(), engine="native")
+
+
+def test_simulator_invalid_engine():
+    with pytest.raises(Exception):
+        Simulator(TaskGraph(), [Worker()], DoNothingScheduler(), SimpleNetModel(),
+                  engine="xyz")
+
+
+class ProtocolRecordScheduler(SchedulerBase):
+
+    def __init__(self, batch_updates):
+        super().__init__("protocol-record", "0", task_start_notification=True)
+        self.batch_updates = batch_updates
+        self.updates = []
+
+    def start(self):
+        message = super().start()
+        message["batch_updates"] = self.batch_updates
+        return message
+
+    def schedule(self, update):
+        objects = self.task_graph.objects.values()
+        self.updates.append((
+            sorted(w.worker_id for w in update.new_workers),
+            update.network_update,
+            sorted(o.id for o in update.new_objects),
+            sorted(t.id for t in update.new_tasks),
+            sorted(t.id for t in update.new_ready_tasks),
+            sorted((t.id, t.computed_by.worker_id) for t in update.new_finished_tasks),
+            sorted((t.id, t.start_time) for t in update.new_started_tasks),
+            sorted((o.id, o.size,
+                    sorted(w.worker_id for w in o.placing),
+                    sorted(w.worker_id for w in o.availability)) for o in objects)))
+        for t in update.new_ready_tasks:
+            self.assign(self.workers[t.id % len(self.workers)], t, priority=t.id % 4)
+
+
+@pytest.mark.parametrize("netmodel", [SimpleNetModel, MaxMinFlowNetModel])
+def test_simulator_batch_updates(plan1, netmodel):
+    results = []
+    for batch_updates in (False, True):
+        scheduler = ProtocolRecordScheduler(batch_updates)
+        simulator = do_sched_test(plan1, [2, 1, 1], scheduler, netmodel(2),
+                                  trace=True, return_simulator=True,
+                                  min_scheduling_interval=0.3)
+        assert simulator.batch_updates == batch_updates
+        results.append((simulator.env.now, trace_summary(simulator), scheduler.updates))
+    assert results[0] == results[1]
+
+
+@pytest.mark.parametrize("policy", ["lru", "largest", "no-consumers"])
+def test_simulator_batch_updates_eviction(plan1, policy):
+    results = []
+    for batch_updates in (False, True):
+        scheduler = ProtocolRecordScheduler(batch_updates)
+        workers = [Worker(cpus=2, memory=4, eviction_policy=policy),
+                   Worker(memory=4, eviction_policy=policy),
+                   Worker(memory=4, eviction_policy=policy)]
+        simulator = do_sched_test(plan1, workers, scheduler, SimpleNetModel(2),
+                                  trace=True, return_simulator=True)
+        assert sum(w.statistics.evictions for w in workers) > 0
+        results.append((simulator.env.now, trace_summary(simulator), scheduler.updates))
+    assert results[0] == results[1]
+
+
+@pytest.mark.parametrize("batch_updates", [True, False])
+def test_simulator_duplicate_task(batch_updates):
+    test_graph = TaskGraph()
+    x = test_graph.new_task("x", duration=5, expected_duration=5)
+    a = test_graph.new_task("a", duration=10, expected_duration=10)
+    y = test_graph.new_task("y", duration=1, expected_duration=1)
+
+    class Scheduler(SchedulerBase):
+        def __init__(self, duplicate):
+            super().__init__("duplicate", "0")
+            self.duplicate_a = duplicate
+            self.finished = []
+            self.cancelled = []
+
+        def start(self):
+            message = super().start()
+            message["batch_updates"] = batch_updates
+            return message
+
+        def schedule(self, update):
+            self.finished += [(t.id, t.computed_by.worker_id) for t in update.new_finished_tasks]
+            self.cancelled += [(t.id, w.worker_id) for t, w in update.cancelled_duplicates]
+            if not update.new_tasks:
+                return
+            w0, w1 = self.workers[0], self.workers[1]
+            tasks = self.task_graph.tasks
+            self.assign(w0, tasks[x.id], priority=2)
+            self.assign(w0, tasks[a.id], priority=1)
+            self.assign(w0, tasks[y.id], priority=0)
+            if self.duplicate_a:
+                self.duplicate(w1, tasks[a.id])
+
+    scheduler = Scheduler(False)
+    assert do_sched_test(test_graph, [1, 1], scheduler) == 16
+
+    # The copy of "a" on worker 1 finishes at 10, the copy started on worker 0 at 5 is cancelled
+    scheduler = Scheduler(True)
+    scheduler._disable_cleanup = True
+    simulator = do_sched_test(test_graph, [1, 1], scheduler, trace=True, return_simulator=True)
+    assert simulator.env.now == 11
+    assert sorted(scheduler.finished) == [(x.id, 0), (a.id, 1), (y.id, 0)]
+    assert scheduler.cancelled == [(a.id, 0)]
+    assert scheduler.task_graph.tasks[a.id].duplicates == []
+    assert [(e.time, e.worker.id, e.task) for e in simulator.trace_events
+            if isinstance(e, TaskCancelTraceEvent)] == [(10, 0, a)]
+    assert simulator.runtime_state.assigned_workers(a) == [simulator.workers[1]]
+    assert simulator.workers[0].statistics.cancelled_cpu_time == 5
+    assert simulator.workers[0].statistics.busy_cpu_time == 6
+
+
+@pytest.mark.parametrize("batch_updates", [True, False])
+def test_simulator_duplicate_finished_task(batch_updates):
+    test_graph = TaskGraph()
+    x = test_graph.new_task("x", duration=1, expected_duration=1)
+    z = test_graph.new_task("z", duration=10, expected_duration=10)
+
+    class Scheduler(SchedulerBase):
+        def __init__(self):
+            super().__init__("duplicate", "0", task_start_notification=True,
+                             batch_updates=batch_updates)
+            self.cancelled = []
+
+        def schedule(self, update):
+            self.cancelled += [(t.id, w.worker_id) for t, w in update.cancelled_duplicates]
+            tasks = self.task_graph.tasks
+            if not tasks:
+                return
+            if update.new_tasks:
+                self.assign(self.workers[0], tasks[x.id])
+                self.assign(self.workers[1], tasks[z.id])
+            if tasks[x.id] in update.new_started_tasks:
+                # x finishes at 5, before the copy arrives at 6
+                self.duplicate(self.workers[1], tasks[x.id])
+
+    scheduler = Scheduler()
+    simulator = do_sched_test(test_graph, [1, 1], scheduler, scheduling_time=2,
+                              trace=True, return_simulator=True)
+    assert simulator.env.now == 14
+    assert scheduler.cancelled == [(x.id, 1)]
+    assert simulator.runtime_state.assigned_workers(x) == [simulator.workers[0]]
+    assert not any(isinstance(e, TaskCancelTraceEvent) for e in simulator.trace_events)
+
+
+@pytest.mark.parametrize("engine", ["simpy", "native"])
+def test_simulator_coalesce_updates(engine):
+    test_graph = TaskGraph()
+    prev = None
+    for i in range(20):
+        a = test_graph.new_task(duration=1, expected_duration=1, output_size=1)
+        b = test_graph.new_task(duration=0, expected_duration=0, output_size=1)
+        b.add_input(a)
+        c = test_graph.new_task(duration=1, expected_duration=1)
+        c.add_input(b)
+        if prev is not None:
+            c.add_input(prev)
+        prev = a
+
+    # Deterministic scheduler, so the numbers of invocations are comparable
+    class Scheduler(SchedulerBase):
+        def schedule(self, update):
+            for t in sorted(update.new_ready_tasks, key=lambda t: t.id):
+                self.assign(self.workers[t.id % 2], t)
+
+    results = []
+    for coalesce_updates in (False, True):
+        simulator = do_sched_test(test_graph, [4, 4], Scheduler("deterministic", "0"),
+                                  return_simulator=True, engine=engine,
+                                  coalesce_updates=coalesce_updates)
+        results.append((simulator.env.now, simulator.statistics.scheduler_invocations))
+    assert results[0][0] == results[1][0]
+    assert results[0][1] > results[1][1]
+
+
+@pytest.mark.parametrize("engine", ["simpy", "native"])
+@pytest.mark.parametrize("netmodel", [SimpleNetModel, MaxMinFlowNetModel])
+def test_simulator_fork(plan1, engine, netmodel):
+    assignments = [(i % 3, task, i % 4) for i, task in enumerate(plan1.tasks.values())]
+
+    def summary(simulator):
+        return sorted(trace_summary(simulator), key=str)
+
+    def create_simulator():
+        return Simulator(plan1, [Worker(cpus=2), Worker(), Worker()],
+                         fixed_scheduler(assignments), netmodel(2),
+                         trace=True, engine=engine)
+
+    simulator = create_simulator()
+    makespan = simulator.run()
+    expected = summary(simulator)
+
+    simulator = create_simulator()
+    assert not simulator.run_until(makespan / 2)
+    snapshot = simulator.snapshot()
+    assert snapshot.now == simulator.env.now
+    fork = simulator.fork()
+
+    assert simulator.run() == makespan
+    assert not snapshot.fork().run_until(makespan / 2 + 0.1)
+    for sim in (fork, snapshot.fork()):
+        assert sim.env.now < makespan / 2
+        assert sim.run() == makespan
+        assert summary(sim) == expected
+    assert summary(simulator) == expected
+
+    assert create_simulator().run_until(makespan + 1)
+
+
+@pytest.mark.parametrize("engine", ["simpy", "native"])
+def test_simulator_run_deadline(plan1, engine):
+    assignments = [(i % 3, task, i % 4) for i, task in enumerate(plan1.tasks.values())]
+
+    def create_simulator():
+        return Simulator(plan1, [Worker(cpus=2), Worker(), Worker()],
+                         fixed_scheduler(assignments), SimpleNetModel(2),
+                         trace=True, engine=engine)
+
+    simulator = create_simulator()
+    makespan = simulator.run()
+    end_times = [simulator.runtime_state.task_info(t).end_time for t in plan1.tasks.values()]
+    fetches = [e for e in simulator.trace_events if isinstance(e, FetchEndTraceEvent)]
+
+    result = create_simulator().run_bounded(deadline=makespan)
+    assert result.completed
+    assert result.makespan == makespan
+    assert result.tasks_finished == plan1.task_count
+    assert result.bytes_transferred == sum(e.output.size for e in fetches)
+
+    limit = makespan / 2
+    result = create_simulator().run_bounded(deadline=limit)
+    assert not result.completed
+    assert result.makespan is None
+    assert result.time == limit
+    assert result.tasks_finished == sum(1 for t in end_times if t <= limit)
+    assert result.bytes_transferred == sum(e.output.size for e in fetches if e.time <= limit)
+
+    simulator = create_simulator()
+    simulator.run_until(1)
+    now = simulator.env.now
+    result = simulator.run_bounded(max_time=limit, deadline=makespan)
+    assert not result.completed
+    assert result.time == now + limit
+    assert result.tasks_finished == sum(1 for t in end_times if t <= now + limit)
+
+    # The aborted simulation continues with the same results
+    assert simulator.scheduler._simulator is simulator
+    assert not simulator.run_until(makespan / 2 + 2)
+    assert simulator.run() == makespan
+    assert [simulator.runtime_state.task_info(t).end_time
+            for t in plan1.tasks.values()] == end_times
+
+
+def test_worker_bitmap():
+    bitmap = WorkerBitmap(3, 130)
+    for w in (0, 63, 64, 129):
+        bitmap.add(1, w)
+    bitmap.add(2, 5)
+    assert bitmap.ids(0) == []
+    assert bitmap.ids(1) == [0, 63, 64, 129]
+    assert bitmap.count(1) == 4
+    assert bitmap.contains(1, 64)
+    assert not bitmap.contains(1, 65)
+    bitmap.remove(1, 64)
+    assert bitmap.ids(1) == [0, 63, 129]
+    assert not bitmap.any(0)
+    assert bitmap.any(2)
+
+
+def test_runtime_state_views():
+    test_graph = TaskGraph()
+    a = test_graph.new_task("A", duration=1, output_size=1)
+    b = test_graph.new_task("B", duration=1)
+    b.add_input(a)
+
+    simulator = do_sched_test(test_graph, 70, fixed_scheduler([(65, a, 0), (3, b, 0)]),
+                              SimpleNetModel(1), return_simulator=True)
+    runtime_state = simulator.runtime_state
+    workers = simulator.workers
+
+    info = runtime_state.task_info(a)
+    assert info.state == TaskState.Finished
+    assert info.is_finished and info.is_ready and not info.is_running
+    assert info.end_time == 1
+    assert info.assigned_workers == [workers[65]]
+    assert info.running_at_workers == []
+    assert runtime_state.task_info(b).end_time == 3
+
+    o_info = runtime_state.object_info(a.output)
+    assert o_info.placing == [workers[65]]
+    assert o_info.availability == [workers[3], workers[65]]
+
+    waiting = RuntimeState(test_graph, workers)
+    assert waiting.task_info(b).is_waiting
+    assert waiting.task_info(b).unfinished_inputs == 1
+    assert waiting.task_info(b).end_time is None
+
+
+@pytest.mark.parametrize("engine", ["simpy", "native"])
+def test_simulator_statistics(plan1, engine):
+    assignments = [(i % 3, task, i % 4) for i, task in enumerate(plan1.tasks.values())]
+    workers = [Worker(cpus=2), Worker(), Worker()]
+    simulator = Simulator(plan1, workers, fixed_scheduler(assignments), SimpleNetModel(2),
+                          trace=True, engine=engine)
+    makespan = simulator.run()
+    statistics = simulator.statistics
+
+    assert statistics.time == makespan
+    assert statistics.scheduler_invocations > 1
+    assert 0 < statistics.scheduler_wall_time < statistics.wall_time
+    assert statistics.simulation_wall_time > 0
+
+    fetches = [e for e in simulator.trace_events if isinstance(e, FetchEndTraceEvent)]
+    assert statistics.downloads == len(fetches)
+    assert statistics.bytes_transferred == sum(e.output.size for e in fetches)
+    assert statistics.busy_cpu_time == sum(t.cpus * t.duration for t in plan1.tasks.values())
+
+    for worker, worker_statistics in zip(workers, statistics.workers):
+        assert worker.statistics is worker_statistics
+        tasks = [t for w, t, _ in assignments if w == worker.id]
+        assert worker_statistics.max_queue_depth == len(tasks)
+        assert worker_statistics.busy_cpu_time == sum(t.cpus * t.duration for t in tasks)
+
+        intervals = sorted((e.time, e.time + e.task.duration) for e in simulator.trace_events
+                           if isinstance(e, TaskStartTraceEvent) and e.worker == worker)
+        busy = 0
+        end = 0
+        for start, task_end in intervals:
+            busy += max(0, task_end - max(end, start))
+            end = max(end, task_end)
+        assert worker_statistics.idle_time == pytest.approx(makespan - busy)
+
+        received = [e for e in fetches if e.target_worker == worker]
+        sent = [e for e in fetches if e.source_worker == worker]
+        assert worker_statistics.downloads == len(received)
+        assert worker_statistics.bytes_received == sum(e.output.size for e in received)
+        assert worker_statistics.bytes_sent == sum(e.output.size for e in sent)
+
+
+@pytest.mark.parametrize("engine", ["simpy", "native"])
+def test_run_replicas(plan1, engine):
+    class Scheduler(SchedulerBase):
+        def schedule(self, update):
+            workers = [self.workers[i] for i in sorted(self.workers)]
+            for t in sorted(update.new_ready_tasks, key=lambda t: t.id):
+                self.assign(random.choice([w for w in workers if w.cpus >= t.cpus]), t)
+
+    def create_workers():
+        return [Worker(cpus=2), Worker(), Worker()]
+
+    random.seed(42)
+    expected = []
+    for _ in range(4):
+        simulator = Simulator(plan1, create_workers(), Scheduler("x", "0"), SimpleNetModel(2),
+                              engine=engine)
+        expected.append((simulator.run(), simulator.statistics.bytes_transferred))
+
+    random.seed(42)
+    results = run_replicas(plan1, create_workers(), Scheduler("x", "0"), SimpleNetModel(2), 4,
+                           engine=engine)
+    assert len(results) == 4
+    assert len(set(expected)) > 1
+    assert [(r.makespan, r.statistics.bytes_transferred) for r in results] == expected
+    assert len(set(id(r.statistics) for r in results)) == 4
+    for r in results:
+        assert r.statistics.time == r.makespan
+        assert r.statistics.busy_cpu_time == sum(t.cpus * t.duration
+                                                 for t in plan1.tasks.values())
+
+
+def make_job(duration):
+    graph = TaskGraph()
+    a = graph.new_task(duration=duration, output_size=1)
+    b = graph.new_task(duration=duration, output_size=1)
+    c = graph.new_task(duration=duration)
+    c.add_inputs([a, b])
+    return graph
+
+
+@pytest.mark.parametrize("batch_updates", [True, False])
+def test_simulator_submit_jobs(batch_updates):
+    retired = []
+    graph_sizes = []
+
+    class Scheduler(SchedulerBase):
+        def start(self):
+            message = super().start()
+            message["batch_updates"] = batch_updates
+            return message
+
+        def schedule(self, update):
+            retired.append(len(update.retired_tasks))
+            graph_sizes.append(len(self.task_graph.tasks))
+            assert all(t.state == TaskState.Finished for t in update.retired_tasks)
+            for i, t in enumerate(sorted(update.new_ready_tasks, key=lambda t: t.id)):
+                self.assign(self.workers[i % 2], t)
+
+    initial = make_job(1)
+    simulator = Simulator(initial, [Worker(), Worker()], Scheduler("x", "0"),
+                          SimpleNetModel(1))
+    for i in range(10):
+        simulator.submit(make_job(2), time=10 * i + 10)
+    makespan = simulator.run()
+
+    statistics = simulator.statistics
+    assert statistics.tasks_finished == 33
+    assert statistics.jobs_finished == 10
+    # each job takes 2 (a, b in parallel) + 1 (download) + 2 (c)
+    assert list(statistics.job_latencies) == [5] * 10
+    assert list(statistics.job_end_times) == [10 * i + 15 for i in range(10)]
+    assert makespan == 105
+    assert statistics.job_latency_percentiles((50, 100)).tolist() == [5, 5]
+    assert statistics.job_throughput() == pytest.approx(10 / 105)
+    assert statistics.job_throughput(since=60) == pytest.approx(5 / 45)
+
+    # Tasks and objects of finished jobs are retired after the scheduler is informed
+    # about their finish, their ids are reused. The initial task graph is kept.
+    assert sum(retired) == 9 * 3
+    assert simulator.next_task_id == 9
+    assert len(simulator.runtime_state.states) == 12
+    assert len(simulator.task_graph.tasks) == 6
+    assert max(graph_sizes) == 6
+    assert sum(len(w.data) for w in simulator.workers) <= 6
+    assert all(t.id in simulator.task_graph.tasks for t in initial.tasks.values())
+    # The given graph is not modified
+    assert simulator.task_graph is not initial
+    assert sorted(initial.tasks) == [0, 1, 2]
+
+    with pytest.raises(Exception):
+        simulator.fork()
+
+
+def test_simulator_submit_stream():
+    class Scheduler(SchedulerBase):
+        def schedule(self, update):
+            for t in update.new_ready_tasks:
+                self.assign(self.workers[t.id % len(self.workers)], t)
+
+    arrivals = list(poisson_arrivals(lambda: make_job(1), rate=0.5, count=100, seed=1))
+    times = [t for t, _ in arrivals]
+    assert times == sorted(times)
+    assert [t for t, _ in poisson_arrivals(lambda: None, 0.5, count=100, seed=1)] == times
+
+    simulator = Simulator(TaskGraph(), [Worker() for _ in range(4)], Scheduler("x", "0"),
+                          SimpleNetModel(1), engine="native")
+    simulator.submit_stream(iter(arrivals))
+    makespan = simulator.run()
+
+    statistics = simulator.statistics
+    assert statistics.jobs_finished == 100
+    assert statistics.tasks_finished == 300
+    assert makespan >= times[-1] + 3
+    assert all(latency >= 3 for latency in statistics.job_latencies)
+    assert simulator.next_task_id < 100
+
+    simulator = Simulator(TaskGraph(), [Worker()], Scheduler("x", "0"), SimpleNetModel(1))
+    simulator.submit_stream(poisson_arrivals(lambda: make_job(1), rate=1, seed=1))
+    result = simulator.run_bounded(max_time=100)
+    assert not result.completed
+    assert result.tasks_finished == simulator.statistics.tasks_finished > 0
+    assert simulator.statistics.jobs_finished > 0
+
+
+@pytest.mark.parametrize("scheduler", [LcScheduler, Camp2Scheduler])
+def test_simulator_submit_stream_static_scheduler(scheduler):
+    def job():
+        graph = make_job(1)
+        for t in graph.tasks.values():
+            t.expected_duration = 1
+        return graph
+
+    arrivals = poisson_arrivals(job, rate=0.5, count=10, seed=1)
+    simulator = Simulator(job(), [Worker(), Worker()], scheduler(), SimpleNetModel(1))
+    simulator.submit_stream(arrivals)
+    with pytest.raises(Exception, match="does not support jobs"):
+        simulator.run()
+
+    # Submitting into a started simulation
+    simulator = Simulator(job(), [Worker(), Worker()], scheduler(), SimpleNetModel(1))
+    simulator.run_until(1)
+    with pytest.raises(Exception, match="does not support jobs"):
+        simulator.submit(make_job(1))
+
+
+@pytest.mark.parametrize("batch_updates", [False, True])
+def test_simulator_network_latency(batch_updates):
+    test_graph = TaskGraph()
+    a = test_graph.new_task("a", duration=1, output_size=4)
+    b = test_graph.new_task("b", duration=1)
+    b.add_input(a)
+
+    class Scheduler(SchedulerBase):
+        network = None
+
+        def start(self):
+            message = super().start()
+            message["batch_updates"] = batch_updates
+            return message
+
+        def schedule(self, update):
+            if update.network_update:
+                self.network = (self.network_bandwidth, self.network_latency)
+            for t in update.new_ready_tasks:
+                self.assign(self.workers[t.id], t)
+
+    scheduler = Scheduler("latency", "0")
+    assert do_sched_test(test_graph, 2, scheduler, SimpleNetModel(2, latency=0.5)) == 4.5
+    assert scheduler.network == (2, 0.5)
+
+
+def test_fluid_simulator():
+    test_graph = TaskGraph()
+    for duration in (3, 3, 2, 2):
+        test_graph.new_task(duration=duration)
+    assert FluidSimulator(test_graph, [Worker(), Worker()], SimpleNetModel()).run() == 5
+
+    test_graph = TaskGraph()
+    x = test_graph.new_task("x", duration=1, output_size=10)
+    y = test_graph.new_task("y", duration=1, output_size=10)
+    z = test_graph.new_task("z", duration=1)
+    z.add_inputs([x, y])
+    comparison = compare_fluid(test_graph, [Worker(), Worker()], BlevelGtScheduler(),
+                               SimpleNetModel(5))
+    assert comparison.fluid_makespan == 4
+    assert comparison.exact_makespan == 4
+    assert comparison.error == 0
+
+    # Multi-cpu tasks
+    test_graph = TaskGraph()
+    for cpus in (2, 2, 3, 1, 2):
+        test_graph.new_task(duration=1, cpus=cpus)
+    workers = [Worker(cpus=3), Worker(cpus=2)]
+    assert FluidSimulator(test_graph, workers, SimpleNetModel()).run() == 2
+
+
+def test_fluid_simulator_error(plan1):
+    simulator = FluidSimulator(plan1, [Worker(cpus=2), Worker()], MaxMinFlowNetModel(2))
+    makespan = simulator.run()
+    assert simulator.steps > 0
+    exact = do_sched_test(plan1, [Worker(cpus=2), Worker()], BlevelGtScheduler(),
+                          MaxMinFlowNetModel(2))
+    # Ties of BlevelGtScheduler depend on the order of sets, the exact makespan
+    # of this small graph is either 8.5 or 9.5
+    assert abs(makespan - exact) / exact < 0.15
+
+    np.random.seed(42)
+    test_graph = triplets(100, 4)
+    workers = [Worker(cpus=4) for _ in range(4)]
+    simulator = FluidSimulator(test_graph, workers, MaxMinFlowNetModel(100))
+    makespan = simulator.run()
+    # Steps advance time, their count does not grow with the number of tasks
+    assert simulator.steps <= 20
+    exact = do_sched_test(test_graph, workers, BlevelGtScheduler(), MaxMinFlowNetModel(100))
+    assert abs(makespan - exact) / exact < 0.02
@@ -1,4 +1,6 @@
 
+import copy
+
 from estee.common import Task, TaskGraph
 
 
@@ -51,6 +53,24 @@ def test_task_graph_copy(plan1):
                 assert i1.id == i2.id
 
 
+def test_task_graph_deepcopy_long_chain():
+    task_graph = TaskGraph()
+    prev = task_graph.new_task(output_size=1)
+    for _ in range(5000):
+        task = task_graph.new_task(output_size=1)
+        task.add_input(prev)
+        prev = task
+
+    result = copy.deepcopy(task_graph)
+    assert result.task_count == task_graph.task_count
+    for task_id, task in result.tasks.items():
+        assert task is not task_graph.tasks[task_id]
+        assert [o.id for o in task.inputs] == [o.id for o in task_graph.tasks[task_id].inputs]
+        for o in task.inputs:
+            assert result.objects[o.id] is o
+            assert task in o.consumers
+
+
 def test_task_graph_merge(plan1):
 
     task_graph = TaskGraph.merge([plan1, plan1, plan1, plan1])
@@ -71,7 +71,8 @@ def plan_reverse_cherry1():
 
 def do_sched_test(task_graph, workers, scheduler,
                   netmodel=None, trace=False, return_simulator=False,
-                  min_scheduling_interval=None, scheduling_time=None):
+                  min_scheduling_interval=None, scheduling_time=None, engine="simpy",
+                  coalesce_updates=False):
 
     if netmodel is None:
         netmodel = InstantNetModel()
@@ -85,7 +86,9 @@ def do_sched_test(task_graph, workers, scheduler,
     simulator = Simulator(task_graph, workers, scheduler, netmodel,
                           trace=trace,
                           scheduling_time=scheduling_time,
-                          min_scheduling_interval=min_scheduling_interval)
+                          min_scheduling_interval=min_scheduling_interval,
+                          engine=engine,
+                          coalesce_updates=coalesce_updates)
     result = simulator.run()
     if return_simulator:
         return simulator
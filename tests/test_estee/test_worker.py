@@ -4,7 +4,11 @@ import pytest
 
 from estee.common import TaskGraph
 from estee.schedulers import SchedulerBase
-from estee.simulator import SimpleNetModel, Worker
+from estee.simulator import InstantNetModel, MaxMinFlowNetModel, SimpleNetModel, \
+    TaskAssignment, Worker
+from estee.simulator.trace import FetchStartTraceEvent, ObjectEvictTraceEvent, \
+    ObjectSpillTraceEvent, ObjectUnspillTraceEvent
+from estee.simulator.worker import Download, PreparedQueue
 from .test_utils import do_sched_test, fixed_scheduler
 
 
@@ -125,6 +129,56 @@ def test_worker_download_priorities2():
     assert simulator.runtime_state.task_info(b2).end_time == pytest.approx(7)
 
 
+@pytest.mark.parametrize("policy", ["first", "least-loaded", "random"])
+def test_worker_download_priorities_changed(policy):
+    g = TaskGraph()
+    # Outputs of a* are on worker 0, b* on worker 1 and c on worker 2
+    sources = {name: (g.new_task(name, duration=0, output_size=1), worker)
+               for name, worker in [("a0", 0), ("a1", 0), ("b0", 1), ("b1", 1), ("c", 2)]}
+    consumers = {name: g.new_task("x" + name, duration=0) for name in sources}
+    for name, consumer in consumers.items():
+        consumer.add_input(sources[name][0])
+    trigger = g.new_task("trigger", duration=1.5)
+    y = g.new_task("y", duration=0)
+    y.add_input(sources["c"][0])
+    z = g.new_task("z", duration=0)
+    z.add_input(sources["b1"][0])
+
+    class Scheduler(SchedulerBase):
+        def schedule(self, update):
+            tasks = {t.id: t for t in self.task_graph.tasks.values()}
+            if update.new_tasks:
+                for task, worker in sources.values():
+                    self.assign(self.workers[worker], tasks[task.id])
+                self.assign(self.workers[4], tasks[trigger.id])
+            finished = {t.id for t in update.new_finished_tasks}
+            if sources["c"][0].id in finished:
+                for priority, name in enumerate(["c", "b1", "a1", "b0", "a0"]):
+                    self.assign(self.workers[3], tasks[consumers[name].id], priority)
+            if trigger.id in finished:
+                # Raises priorities of pending downloads of c and b1
+                self.assign(self.workers[3], tasks[y.id], 10)
+                self.assign(self.workers[3], tasks[z.id], 20)
+
+    workers = [Worker() for _ in range(3)] + \
+        [Worker(max_downloads=1, download_source=policy), Worker()]
+    simulator = do_sched_test(g, workers, Scheduler("x", "0"), SimpleNetModel(1),
+                              trace=True, return_simulator=True)
+    starts = [(e.time, e.output.parent.name) for e in simulator.trace_events
+              if isinstance(e, FetchStartTraceEvent)]
+    assert starts == [(0, "a0"), (1, "b0"), (2, "b1"), (3, "c"), (4, "a1")]
+
+
+def test_download_update_priority():
+    g = TaskGraph()
+    a = g.new_task("a", duration=1, output_size=1)
+    d = Download(a.output, 1)
+    assert d.update_priority(3)
+    assert d.priority == 3
+    assert not d.update_priority(2)
+    assert d.priority == 3
+
+
 def test_worker_execute_priorities():
     SIZE = 20
     g = TaskGraph()
@@ -179,6 +233,53 @@ def test_worker_priority_block():
     assert runtime_state.task_info(c).end_time == pytest.approx(3)
 
 
+def test_worker_prepared_queue():
+    def start_sorted(prepared, free_cpus):
+        # Reference implementation: sorted list scanned linearly
+        prepared.sort(key=lambda a: a.priority, reverse=True)
+        started = []
+        block = float("-inf")
+        for a in prepared[:]:
+            if a.cancelled:
+                prepared.remove(a)
+                continue
+            if a.priority < block:
+                continue
+            if a.task.cpus <= free_cpus:
+                prepared.remove(a)
+                free_cpus -= a.task.cpus
+                started.append(a)
+            else:
+                block = max(block, a.block)
+        return started
+
+    def start_queue(queue, free_cpus):
+        started = []
+        while True:
+            a = queue.pop(free_cpus)
+            if a is None:
+                return started
+            free_cpus -= a.task.cpus
+            started.append(a)
+
+    rng = random.Random(42)
+    g = TaskGraph()
+    tasks = [g.new_task(duration=1, cpus=rng.randint(1, 4)) for _ in range(300)]
+    prepared = []
+    queue = PreparedQueue()
+    for step in range(100):
+        for _ in range(rng.randint(0, 6)):
+            priority = rng.randint(-3, 3)
+            a = TaskAssignment(None, rng.choice(tasks), priority,
+                               rng.randint(-5, priority) if rng.random() < 0.3 else -5)
+            prepared.append(a)
+            queue.push(a)
+        for a in rng.sample(prepared, min(len(prepared), rng.randint(0, 1))):
+            a.cancelled = True
+        free_cpus = rng.randint(0, 5)
+        assert start_queue(queue, free_cpus) == start_sorted(prepared, free_cpus)
+
+
 def test_worker_freecpus():
     test_graph = TaskGraph()
     test_graph.new_task("A", duration=10, cpus=2, output_size=1)
@@ -257,3 +358,199 @@ def test_more_outputs_from_same_source():
     ])
 
     assert do_sched_test(test_graph, [1], s) == 2
+
+
+@pytest.mark.parametrize("policy, evicted", [("lru", 0), ("largest", 1)])
+def test_worker_memory_eviction(policy, evicted):
+    g = TaskGraph()
+    a = g.new_task("a", duration=1, output_size=6)
+    b = g.new_task("b", duration=1, output_size=8)
+    b.add_input(a)
+    evicted = (a, b)[evicted].output
+
+    s = fixed_scheduler([
+        (0, a, 0),
+        (1, b, 0),
+    ])
+    s._disable_cleanup = True
+    workers = [Worker(), Worker(memory=10, eviction_policy=policy)]
+    simulator = do_sched_test(g, workers, s, SimpleNetModel(), trace=True,
+                              return_simulator=True)
+
+    assert workers[1].data == {a.output, b.output} - {evicted}
+    assert workers[1].memory_usage == 14 - evicted.size
+    assert workers[1].statistics.evictions == 1
+    assert workers[1].statistics.evicted_bytes == evicted.size
+    assert [(e.worker, e.output) for e in simulator.trace_events
+            if isinstance(e, ObjectEvictTraceEvent)] == [(workers[1], evicted)]
+    assert not simulator.runtime_state.availability.contains(evicted.id, 1)
+
+    obj = s.task_graph.objects[evicted.id]
+    assert all(w.worker_id != 1 for w in obj.placing)
+    assert all(w.worker_id != 1 for w in obj.availability)
+
+
+def test_worker_memory_spill():
+    g = TaskGraph()
+    a1 = g.new_task("a1", duration=1, output_size=6)
+    a2 = g.new_task("a2", duration=1, output_size=6)
+    c = g.new_task("c", duration=1)
+    c.add_inputs([a1, a2])
+
+    s = fixed_scheduler([
+        (0, a1, 2),
+        (0, a2, 1),
+        (0, c, 0),
+    ])
+
+    # Output of a1 is needed by c, so it stays in memory over the capacity
+    worker = Worker(memory=10)
+    assert do_sched_test(g, [worker], s) == 3
+    assert worker.statistics.max_memory_usage == 12
+    assert worker.statistics.spilled_bytes == 0
+
+    # Output of a1 is spilled at time 2 (written until 5) and read back before c starts
+    worker = Worker(memory=10, spill_bandwidth=2)
+    simulator = do_sched_test(g, [worker], s, trace=True, return_simulator=True)
+    assert simulator.env.now == 9
+    assert worker.statistics.spilled_bytes == 6
+    assert worker.statistics.unspilled_bytes == 6
+    assert [(type(e), e.time, e.output) for e in simulator.trace_events
+            if isinstance(e, (ObjectSpillTraceEvent, ObjectUnspillTraceEvent))] == [
+        (ObjectSpillTraceEvent, 2, a1.output), (ObjectUnspillTraceEvent, 2, a1.output)]
+
+    # Both outputs have no consumers after c finishes, the least recently used one is dropped
+    assert worker.data == {a2.output}
+    assert not worker.spilled
+    assert worker.statistics.evictions == 1
+
+
+@pytest.mark.parametrize("policy, makespan, fairness", [
+    ("first", 33, 0.25),
+    ("least-loaded", 23, 0.45),
+    ("striped", 23, 0.45),
+    ("random", None, None),
+])
+def test_worker_download_source(policy, makespan, fairness):
+    g = TaskGraph()
+    a = g.new_task("a", duration=1, output_size=10)
+    b = g.new_task("b", duration=1, output_size=0)
+    b.add_input(a)
+    c = g.new_task("c", duration=1)
+    d = g.new_task("d", duration=1)
+    c.add_inputs([a, b])
+    d.add_inputs([a, b])
+    placement = {a.id: 0, b.id: 1, c.id: 2, d.id: 3}
+
+    # c and d are assigned after b finished, so "a" has a replica on worker 1
+    class Scheduler(SchedulerBase):
+        def schedule(self, update):
+            for t in update.new_ready_tasks:
+                self.assign(self.workers[placement[t.id]], t)
+
+    random.seed(1)
+    workers = [Worker(download_source=policy) for _ in range(4)]
+    simulator = do_sched_test(g, workers, Scheduler("ready", "0"), MaxMinFlowNetModel(1),
+                              return_simulator=True)
+    statistics = simulator.statistics
+    assert statistics.bytes_transferred == 30
+    assert sum(w.uploads for w in statistics.workers) == (7 if policy == "striped" else 5)
+    if makespan is None:
+        assert simulator.env.now in (23, 33)
+    else:
+        assert simulator.env.now == pytest.approx(makespan)
+        assert statistics.upload_fairness() == pytest.approx(fairness)
+
+
+@pytest.mark.parametrize("policy", ["first", "least-loaded", "random"])
+def test_worker_download_source_busy(policy):
+    g = TaskGraph()
+    a1 = g.new_task("a1", duration=1, output_size=200)
+    a2 = g.new_task("a2", duration=1, output_size=200)
+    b = g.new_task("b", duration=1, output_size=1)
+    x = g.new_task("x", duration=500, output_size=1)
+    c = g.new_task("c", duration=1)
+    c.add_inputs([a1, a2])
+    d = g.new_task("d", duration=1)
+    d.add_inputs([b, x])
+
+    # The download of a1 or a2 (boosted, c is ready) waits for the other one
+    # from the same source, it must not block b from an idle source
+    workers = [Worker(cpus=2, max_downloads_per_worker=1, download_source=policy)
+               for _ in range(3)]
+    simulator = do_sched_test(
+        g, workers, fixed_scheduler([(0, a1), (0, a2), (1, b), (1, x), (2, c), (2, d)]),
+        SimpleNetModel(1), trace=True, return_simulator=True)
+    starts = {e.output.parent.name: e.time for e in simulator.trace_events
+              if isinstance(e, FetchStartTraceEvent)}
+    assert sorted((starts["a1"], starts["a2"])) == [1, 201]
+    assert starts["b"] == 1
+    assert simulator.env.now == 502
+
+
+@pytest.mark.parametrize("netmodel", [InstantNetModel(), SimpleNetModel(1)])
+def test_worker_download_striped_netmodel(netmodel):
+    g = TaskGraph()
+    a = g.new_task("a", duration=1, output_size=1)
+    g.new_task("b", duration=1).add_input(a)
+    # Parts of striped downloads would not share the bandwidth of the receiver
+    with pytest.raises(Exception, match="Striped downloads"):
+        do_sched_test(g, [Worker(download_source="striped") for _ in range(2)],
+                      fixed_scheduler([(0, t) for t in g.tasks.values()]), netmodel)
+
+
+@pytest.mark.parametrize("policy", Worker.DOWNLOAD_SOURCE_POLICIES)
+def test_worker_download_source_busy_scaling(policy, monkeypatch):
+    count = 300
+    g = TaskGraph()
+    merge = g.new_task("merge", duration=1)
+    merge.add_inputs([g.new_task("x{}".format(i), duration=0, output_size=1)
+                      for i in range(count)])
+
+    select_sources = Worker._select_sources
+    calls = []
+
+    def counted_select_sources(self, obj):
+        calls.append(obj)
+        return select_sources(self, obj)
+    monkeypatch.setattr(Worker, "_select_sources", counted_select_sources)
+
+    # All inputs come from one source, downloads blocked by it are not scanned
+    # again after each started download
+    workers = [Worker(download_source=policy), Worker(cpus=count)]
+    assignments = [(1, t) for t in g.tasks.values() if t is not merge] + [(0, merge)]
+    simulator = do_sched_test(g, workers, fixed_scheduler(assignments),
+                              MaxMinFlowNetModel(100), return_simulator=True)
+    assert simulator.env.now == pytest.approx(count / 100 + 1)
+    assert len(calls) <= 2 * count
+
+
+@pytest.mark.parametrize("batch_updates", [False, True])
+def test_worker_speed(batch_updates):
+    test_graph = TaskGraph()
+    # 8 * ((1 - 0.5) + 0.5 / 2) = 6 on 2 cpus
+    a = test_graph.new_task("a", duration=8, expected_duration=8, cpus=2,
+                            parallel_fraction=0.5, output_size=1)
+    b = test_graph.new_task("b", duration=4, expected_duration=4)
+    b.add_input(a)
+
+    class Scheduler(SchedulerBase):
+        def start(self):
+            message = super().start()
+            message["batch_updates"] = batch_updates
+            return message
+
+        def schedule(self, update):
+            if not update.new_tasks:
+                return
+            tasks = self.task_graph.tasks
+            assert [self.workers[i].speed for i in range(2)] == [2.0, 1.0]
+            assert tasks[a.id].expected_duration == 6
+            self.assign(self.workers[0], tasks[a.id])
+            self.assign(self.workers[1], tasks[b.id])
+
+    workers = [Worker(cpus=2, speed=2.0), Worker(cpus=2)]
+    simulator = do_sched_test(test_graph, workers, Scheduler("speed", "0"),
+                              return_simulator=True)
+    assert simulator.env.now == 7
+    assert [w.busy_cpu_time for w in simulator.statistics.workers] == [6, 4]